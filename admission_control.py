@@ -0,0 +1,163 @@
+import asyncio
+import os
+from typing import Awaitable, Callable, Dict, Optional
+
+import lavalink
+
+import metrics
+
+# Past any of these on every available node, new players are held back so the streams already running stay clean
+ADMISSION_MAX_CPU = float(os.getenv("ADMISSION_MAX_CPU", 0.85))
+# Average frames per player per minute that the node failed to send on time, out of the 3000 a clean stream sends
+ADMISSION_MAX_FRAME_DEFICIT = float(os.getenv("ADMISSION_MAX_FRAME_DEFICIT", 150))
+# Connected players per node, 0 for no limit
+ADMISSION_MAX_PLAYERS = int(os.getenv("ADMISSION_MAX_PLAYERS", 0))
+# Most players a node is given on one stats report, however much CPU headroom the report shows
+ADMISSION_MAX_PER_REPORT = int(os.getenv("ADMISSION_MAX_PER_REPORT", 25))
+# Shorter than the minute between stats reports on purpose: nobody should wait that long for playback. Most of the
+# line gets in on the report that shows room, and whoever is left past the node's headroom is told to try again.
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", 20))
+ADMISSION_QUEUE_LIMIT = int(os.getenv("ADMISSION_QUEUE_LIMIT", 25))
+# Whether filter changes are refused on overloaded nodes, since timescale and the other filters all cost node CPU
+ADMISSION_SHED_FILTERS = os.getenv("ADMISSION_SHED_FILTERS", "false").lower() in ("1", "true", "yes")
+ADMISSION_POLL_INTERVAL = 1.0
+
+
+class AdmissionController():
+    """
+    Decides whether a new player may start, based on the stats each Lavalink node reports.
+
+    A node is overloaded once its system CPU load, frame deficit or player count passes its threshold. New players are
+    admitted straight away while any available node has room, since Lavalink.py places them on the least loaded node.
+    Otherwise they wait in line, first come first served, for up to `queue_timeout` seconds, and are rejected if the
+    line is already `queue_limit` long or no room opens up in time. Players that are already connected are never
+    affected.
+
+    Stats only refresh about once a minute, and a report says nothing about the players started since it was sent. So
+    every admission is counted against the report it was made on, and a node only takes as many players per report as
+    its CPU headroom allows, going by what each of its playing players costs, up to `max_per_report`. The player count
+    limit is checked live, so room under it is admissible straight away.
+    """
+
+    def __init__(
+        self,
+        lavalink_client: lavalink.Client,
+        max_cpu: float = ADMISSION_MAX_CPU,
+        max_frame_deficit: float = ADMISSION_MAX_FRAME_DEFICIT,
+        max_players: int = ADMISSION_MAX_PLAYERS,
+        queue_timeout: float = ADMISSION_QUEUE_TIMEOUT,
+        queue_limit: int = ADMISSION_QUEUE_LIMIT,
+        max_per_report: int = ADMISSION_MAX_PER_REPORT,
+        shed_filters: bool = ADMISSION_SHED_FILTERS,
+        poll_interval: float = ADMISSION_POLL_INTERVAL,
+    ) -> None:
+        self.lavalink = lavalink_client
+        self.max_cpu = max_cpu
+        self.max_frame_deficit = max_frame_deficit
+        self.max_players = max_players
+        self.queue_timeout = queue_timeout
+        self.queue_limit = queue_limit
+        self.max_per_report = max_per_report
+        self.shed_filters = shed_filters
+        self.poll_interval = poll_interval
+
+        self.waiting = 0
+        # asyncio.Lock wakes its waiters in the order they arrived, which is what keeps the line fair
+        self._line = asyncio.Lock()
+        # node -> (the stats report it last admitted a player on, players admitted since that report)
+        self._admitted_since_report: Dict[lavalink.Node, tuple[lavalink.Stats, int]] = {}
+
+    def overload_reason(self, node: lavalink.Node) -> Optional[str]:
+        """Why `node` can't take another player, or None if it can"""
+        if self.max_players and len(node.players) >= self.max_players:
+            return "players"
+
+        stats = node.stats
+        # Nodes report stats about once a minute, and until the first report there's nothing to go on
+        if stats.is_fake:
+            return None
+        if stats.system_load >= self.max_cpu:
+            return "cpu"
+        if stats.frames_deficit >= self.max_frame_deficit:
+            return "frame deficit"
+
+        return None
+
+    def headroom(self, node: lavalink.Node) -> int:
+        """How many more players `node` can be given before its next stats report"""
+        if self.overload_reason(node) is not None:
+            return 0
+
+        stats = node.stats
+        if stats.is_fake:
+            # Nothing to estimate from yet, so only the live player count limit applies
+            return self.max_players - len(node.players) if self.max_players else self.max_per_report
+
+        budget = self.max_per_report
+        if stats.playing_players and stats.system_load > 0:
+            cost_per_player = stats.system_load / stats.playing_players
+            # A node under its thresholds always has room for at least one more
+            budget = min(budget, max(1, int((self.max_cpu - stats.system_load) / cost_per_player)))
+
+        report, admitted = self._admitted_since_report.get(node, (None, 0))
+        return max(0, budget - (admitted if report is stats else 0))
+
+    def _node_with_room(self) -> Optional[lavalink.Node]:
+        """The available node with the most headroom, if any has some"""
+        headroom, node = max(((self.headroom(node), node) for node in self.lavalink.node_manager.available_nodes),
+                             key=lambda item: item[0], default=(0, None))
+        return node if headroom else None
+
+    def _count_admission(self, node: lavalink.Node) -> None:
+        report, admitted = self._admitted_since_report.get(node, (None, 0))
+        self._admitted_since_report[node] = (node.stats, admitted + 1 if report is node.stats else 1)
+
+    def has_capacity(self) -> bool:
+        return self._node_with_room() is not None
+
+    def should_shed_filters(self, node: lavalink.Node) -> bool:
+        return self.shed_filters and self.overload_reason(node) is not None
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "waiting": self.waiting,
+            "overloaded_nodes": sum(1 for node in self.lavalink.node_manager.available_nodes if self.overload_reason(node) is not None),
+        }
+
+    async def admit(self, on_queued: Optional[Callable[[int], Awaitable]] = None) -> bool:
+        """
+        Returns True once a new player may start, or False if it was turned away. `on_queued` is called with the
+        caller's place in line if it has to wait.
+        """
+        # Anyone already waiting goes first, even if room has just opened up
+        node = self._node_with_room() if not self.waiting else None
+        if node is not None:
+            self._count_admission(node)
+            metrics.ADMISSIONS.inc(result="admitted")
+            return True
+
+        if self.waiting >= self.queue_limit:
+            metrics.ADMISSIONS.inc(result="rejected")
+            return False
+
+        self.waiting += 1
+        try:
+            if on_queued is not None:
+                await on_queued(self.waiting)
+
+            await asyncio.wait_for(self._wait_in_line(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            metrics.ADMISSIONS.inc(result="rejected")
+            return False
+        finally:
+            self.waiting -= 1
+
+        metrics.ADMISSIONS.inc(result="queued")
+        return True
+
+    async def _wait_in_line(self) -> None:
+        async with self._line:
+            while (node := self._node_with_room()) is None:
+                await asyncio.sleep(self.poll_interval)
+
+            self._count_admission(node)
@@ -0,0 +1,216 @@
+"""
+Just enough of discord.py's guild, channel and member surface to run the bot's real handlers offline.
+
+Commands are run through the bot's real `invoke` path (checks, cog hooks, argument parsing and error handlers), using
+a Context whose `send` records replies instead of calling Discord. Voice connections go through the real
+LavalinkVoiceClient, with the voice state and voice server updates Discord would send faked by the guild.
+"""
+import asyncio
+import itertools
+from typing import Any, Dict, List, Optional
+
+import discord
+from discord.ext import commands
+from discord.ext.commands.view import StringView
+
+_ids = itertools.count(1_000_000)
+
+
+def next_id() -> int:
+    return next(_ids)
+
+
+class FakeRole():
+    def __init__(self, guild: "FakeGuild", name: str) -> None:
+        self.id = next_id()
+        self.guild = guild
+        self.name = name
+        self.mention = f"<@&{self.id}>"
+
+    @property
+    def members(self) -> List["FakeMember"]:
+        return [member for member in self.guild.members.values() if member.get_role(self.id) is not None]
+
+
+class FakeVoiceState():
+    def __init__(self, channel: Optional["FakeVoiceChannel"]) -> None:
+        self.channel = channel
+
+
+class FakeMember():
+    def __init__(self, guild: "FakeGuild", name: str, bot: bool = False, member_id: Optional[int] = None) -> None:
+        self.id = member_id or next_id()
+        self.guild = guild
+        self.name = name
+        self.display_name = name
+        self.mention = f"<@{self.id}>"
+        self.bot = bot
+        self.roles: List[FakeRole] = []
+        self.voice: Optional[FakeVoiceState] = None
+
+    def get_role(self, role_id: int) -> Optional[FakeRole]:
+        return next((role for role in self.roles if role.id == role_id), None)
+
+    async def add_roles(self, *roles: FakeRole, **_) -> None:
+        await self.guild.simulate_rest_call()
+        self.roles.extend(role for role in roles if role not in self.roles)
+
+    async def remove_roles(self, *roles: FakeRole, **_) -> None:
+        await self.guild.simulate_rest_call()
+        self.roles = [role for role in self.roles if role not in roles]
+
+
+class FakeMessage():
+    def __init__(self, channel: "FakeTextChannel", author: FakeMember, content: str = "", **kwargs: Any) -> None:
+        self.id = next_id()
+        self.channel = channel
+        self.guild = channel.guild
+        self.author = author
+        self.content = content
+        self.attachments: List[Any] = []
+        self.kwargs = kwargs
+        self._state = channel.guild.bot._connection
+
+    async def edit(self, **kwargs: Any) -> "FakeMessage":
+        self.kwargs.update(kwargs)
+        return self
+
+
+class FakeTextChannel():
+    def __init__(self, guild: "FakeGuild", name: str) -> None:
+        self.id = next_id()
+        self.guild = guild
+        self.name = name
+        self.mention = f"<#{self.id}>"
+        self.sent: List[FakeMessage] = []
+
+    async def send(self, content: Optional[str] = None, **kwargs: Any) -> FakeMessage:
+        await self.guild.simulate_rest_call()
+        message = FakeMessage(self, self.guild.me, str(content) if content is not None else "", **kwargs)
+        self.sent.append(message)
+        return message
+
+
+class FakeVoiceChannel():
+    def __init__(self, guild: "FakeGuild", name: str) -> None:
+        self.id = next_id()
+        self.guild = guild
+        self.name = name
+
+    @property
+    def members(self) -> List[FakeMember]:
+        return [member for member in self.guild.members.values() if member.voice and member.voice.channel is self]
+
+    def permissions_for(self, _: FakeMember) -> discord.Permissions:
+        return discord.Permissions(connect=True, speak=True)
+
+    def _get_voice_client_key(self):
+        return self.guild.id, "guild_id"
+
+    async def connect(self, *, cls, timeout: float = 60.0, reconnect: bool = True, self_deaf: bool = False,
+                      self_mute: bool = False):
+        voice_client = cls(self.guild.bot, self)
+        self.guild.voice_client = voice_client
+        await voice_client.connect(timeout=timeout, reconnect=reconnect, self_deaf=self_deaf, self_mute=self_mute)
+        return voice_client
+
+
+class FakeGuild():
+    def __init__(self, bot: commands.Bot, name: str, member_count: int = 20, rest_latency: float = 0.0) -> None:
+        self.id = next_id()
+        self.bot = bot
+        self.name = name
+        self.rest_latency = rest_latency
+        self.voice_client = None
+
+        self.members: Dict[int, FakeMember] = {}
+        self.me = FakeMember(self, "Chocobot", bot=True, member_id=bot.user.id)
+        self.members[self.me.id] = self.me
+        for index in range(member_count):
+            member = FakeMember(self, f"member-{index}")
+            self.members[member.id] = member
+
+        self.text_channels = [FakeTextChannel(self, "bot-commands"), FakeTextChannel(self, "general")]
+        self.voice_channels = [FakeVoiceChannel(self, "Lounge"), FakeVoiceChannel(self, "Gaming")]
+        self.stage_channels: List[FakeVoiceChannel] = []
+        self.roles: List[FakeRole] = [FakeRole(self, "Chocobot")]
+        self.me.roles.append(self.roles[0])
+
+    @property
+    def channels(self) -> list:
+        return [*self.text_channels, *self.voice_channels]
+
+    @property
+    def humans(self) -> List[FakeMember]:
+        return [member for member in self.members.values() if not member.bot]
+
+    async def simulate_rest_call(self) -> None:
+        if self.rest_latency:
+            await asyncio.sleep(self.rest_latency)
+        else:
+            await asyncio.sleep(0)
+
+    def get_channel(self, channel_id: int):
+        return next((channel for channel in self.channels if channel.id == channel_id), None)
+
+    def get_role(self, role_id: int) -> Optional[FakeRole]:
+        return next((role for role in self.roles if role.id == role_id), None)
+
+    def get_member(self, member_id: int) -> Optional[FakeMember]:
+        return self.members.get(member_id)
+
+    async def create_role(self, name: str, **_: Any) -> FakeRole:
+        await self.simulate_rest_call()
+        role = FakeRole(self, name)
+        self.roles.append(role)
+        return role
+
+    async def change_voice_state(self, *, channel: Optional[FakeVoiceChannel], self_mute: bool = False,
+                                 self_deaf: bool = False) -> None:
+        """Plays the part of Discord, answering a voice connect/disconnect with the updates the voice client expects"""
+        self.me.voice = FakeVoiceState(channel) if channel else None
+        voice_client = self.voice_client
+        if voice_client is None:
+            return
+
+        await voice_client.on_voice_state_update({
+            "guild_id": str(self.id),
+            "user_id": str(self.bot.user.id),
+            "channel_id": str(channel.id) if channel else None,
+            "session_id": f"voice-session-{self.id}",
+        })
+
+        if channel is None:
+            self.voice_client = None
+            return
+
+        await voice_client.on_voice_server_update({"guild_id": str(self.id), "token": "fake-token", "endpoint": "fake.discord.media"})
+
+
+class FakeContext(commands.Context):
+    """A Context whose replies are recorded on the channel rather than sent to Discord"""
+
+    async def send(self, content: Optional[str] = None, **kwargs: Any) -> FakeMessage:
+        return await self.channel.send(content, **kwargs)
+
+
+def build_context(bot: commands.Bot, author: FakeMember, channel: FakeTextChannel, content: str) -> FakeContext:
+    """Does what Bot.get_context does for a message, without needing a real discord.Message"""
+    message = FakeMessage(channel, author, content)
+    view = StringView(content)
+    ctx = FakeContext(message=message, bot=bot, view=view, prefix=bot.command_prefix)
+
+    view.skip_string(bot.command_prefix)
+    invoked_with = view.get_word()
+    ctx.invoked_with = invoked_with
+    ctx.command = bot.all_commands.get(invoked_with)
+
+    return ctx
+
+
+def join_voice(member: FakeMember, channel: Optional[FakeVoiceChannel]) -> tuple[FakeVoiceState, FakeVoiceState]:
+    """Moves a member's voice state and returns the (before, after) pair on_voice_state_update receives"""
+    before = member.voice or FakeVoiceState(None)
+    after = FakeVoiceState(channel)
+    member.voice = after if channel else None
+    return before, after
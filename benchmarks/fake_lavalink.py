@@ -0,0 +1,229 @@
+"""
+A stand-in Lavalink v4 node for offline benchmarks.
+
+It speaks enough of the REST and WebSocket protocol for Lavalink.py to connect, load tracks, and drive players:
+a `ready` op and periodic `stats` over the WebSocket, /v4/loadtracks, and player PATCH/DELETE. Track loads take
+`load_latency` seconds so cached and uncached paths can be told apart. When a player is given a track, the node
+answers with a TrackStartEvent just as a real node would, after `start_latency` seconds spent opening the audio.
+Identifiers in `unavailable` load as empty and fail with a TrackExceptionEvent when played, like a deleted video.
+"""
+import asyncio
+import json
+import time
+from typing import Any, Dict, Optional, Set
+
+import lavalink
+from aiohttp import WSMsgType, web
+
+PLAYLIST_LENGTH = 100
+SEARCH_RESULT_LENGTH = 5
+
+
+def fake_track(identifier: str, title: Optional[str] = None, length: int = 180_000) -> Dict[str, Any]:
+    info = {
+        "identifier": identifier,
+        "isSeekable": True,
+        "author": f"Author of {identifier}",
+        "length": length,
+        "isStream": False,
+        "position": 0,
+        "title": title or f"Track {identifier}",
+        "uri": f"https://example.com/watch?v={identifier}",
+        "artworkUrl": f"https://example.com/art/{identifier}.jpg",
+        "isrc": None,
+        "sourceName": "youtube",
+    }
+
+    # A genuinely encoded track, so anything that decodes tracks locally works against the fake node too
+    return {"encoded": lavalink.encode_track(info)[1], "info": info, "pluginInfo": {}, "userData": {}}
+
+
+class FakeLavalinkNode():
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, password: str = "fake", load_latency: float = 0.02,
+                 stats_interval: float = 1.0, name: str = "fake", start_latency: float = 0.0) -> None:
+        self.host = host
+        self.port = port
+        self.password = password
+        self.load_latency = load_latency
+        self.start_latency = start_latency
+        self.stats_interval = stats_interval
+        self.name = name
+        self.session_id = f"fake-session-{name}"
+
+        # Overridable so tests can simulate a degraded node
+        self.system_load = 0.05
+        self.frames_deficit = 0
+        self.unavailable: Set[str] = set()
+
+        self.requests: Dict[str, int] = {}
+        self.players: Dict[str, Dict[str, Any]] = {}
+        self._sockets: Set[web.WebSocketResponse] = set()
+        self._runner: Optional[web.AppRunner] = None
+        self._stats_task: Optional[asyncio.Task] = None
+
+    @property
+    def config(self) -> Dict[str, Any]:
+        """This node in the shape lavalink_pool.ensure_lavalink_client expects"""
+        return {"host": self.host, "port": self.port, "password": self.password, "region": "us", "name": self.name}
+
+    def _count(self, route: str) -> None:
+        self.requests[route] = self.requests.get(route, 0) + 1
+
+    def _authorised(self, request: web.Request) -> bool:
+        return request.headers.get("Authorization") == self.password
+
+    async def start(self) -> None:
+        app = web.Application()
+        app.router.add_get("/v4/websocket", self._handle_websocket)
+        app.router.add_get("/v4/loadtracks", self._handle_load_tracks)
+        app.router.add_patch("/v4/sessions/{session_id}/players/{guild_id}", self._handle_update_player)
+        app.router.add_delete("/v4/sessions/{session_id}/players/{guild_id}", self._handle_destroy_player)
+        app.router.add_get("/v4/stats", self._handle_stats)
+        app.router.add_get("/version", self._handle_version)
+
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        # Port 0 picks a free port, so read back the one that was bound
+        self.port = site._server.sockets[0].getsockname()[1]
+        self._stats_task = asyncio.create_task(self._send_stats_forever())
+
+    async def stop(self) -> None:
+        if self._stats_task is not None:
+            self._stats_task.cancel()
+        for socket in list(self._sockets):
+            await socket.close()
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    def stats(self) -> Dict[str, Any]:
+        playing_players = sum(1 for player in self.players.values() if player.get("track") and not player.get("paused"))
+        return {
+            "players": len(self.players),
+            "playingPlayers": playing_players,
+            "uptime": int(time.monotonic() * 1000),
+            "memory": {"free": 1 << 30, "used": 1 << 28, "allocated": 1 << 30, "reservable": 1 << 32},
+            "cpu": {"cores": 4, "systemLoad": self.system_load, "lavalinkLoad": self.system_load / 2},
+            "frameStats": {"sent": 3000, "nulled": 0, "deficit": self.frames_deficit},
+        }
+
+    async def _broadcast(self, payload: Dict[str, Any]) -> None:
+        for socket in list(self._sockets):
+            if not socket.closed:
+                await socket.send_str(json.dumps(payload))
+
+    async def _send_stats_forever(self) -> None:
+        while True:
+            await asyncio.sleep(self.stats_interval)
+            await self._broadcast({"op": "stats", **self.stats()})
+
+    async def _handle_websocket(self, request: web.Request) -> web.StreamResponse:
+        if not self._authorised(request):
+            return web.Response(status=401)
+
+        socket = web.WebSocketResponse()
+        await socket.prepare(request)
+        self._sockets.add(socket)
+
+        await socket.send_str(json.dumps({"op": "ready", "resumed": False, "sessionId": self.session_id}))
+        await socket.send_str(json.dumps({"op": "stats", **self.stats()}))
+
+        try:
+            async for message in socket:
+                if message.type in (WSMsgType.CLOSE, WSMsgType.ERROR):
+                    break
+        finally:
+            self._sockets.discard(socket)
+
+        return socket
+
+    async def _handle_load_tracks(self, request: web.Request) -> web.Response:
+        if not self._authorised(request):
+            return web.Response(status=401)
+
+        self._count("loadtracks")
+        await asyncio.sleep(self.load_latency)
+        identifier = request.query.get("identifier", "")
+        # URLs are reduced to their last query value, so the ids stay short and readable in reports
+        name = identifier.rsplit("=", 1)[-1]
+
+        if identifier.startswith(("ytsearch:", "scsearch:")):
+            search = identifier.split(":", 1)[1]
+            tracks = [fake_track(f"{search}-{index}", f"{search} (result {index + 1})") for index in range(SEARCH_RESULT_LENGTH)]
+            return web.json_response({"loadType": "search", "data": tracks})
+
+        if "nothing" in identifier or name in self.unavailable:
+            return web.json_response({"loadType": "empty", "data": {}})
+
+        if "playlist" in identifier:
+            tracks = [fake_track(f"{name}-{index}") for index in range(PLAYLIST_LENGTH)]
+            return web.json_response({
+                "loadType": "playlist",
+                "data": {"info": {"name": f"Playlist {name}", "selectedTrack": -1}, "pluginInfo": {}, "tracks": tracks},
+            })
+
+        return web.json_response({"loadType": "track", "data": fake_track(name)})
+
+    @staticmethod
+    def _decoded_track(encoded: str) -> Dict[str, Any]:
+        # Events carry the full track, which a real node gets by decoding the string it was given
+        return {"encoded": encoded, "info": lavalink.decode_track(encoded).raw["info"], "pluginInfo": {}, "userData": {}}
+
+    async def _handle_update_player(self, request: web.Request) -> web.Response:
+        if not self._authorised(request):
+            return web.Response(status=401)
+
+        self._count("update_player")
+        guild_id = request.match_info["guild_id"]
+        update = await request.json()
+        player = self.players.setdefault(guild_id, {"guildId": guild_id, "track": None, "volume": 100, "paused": False,
+                                                    "filters": {}, "voice": {}})
+
+        for key in ("volume", "paused", "filters", "voice"):
+            if key in update:
+                player[key] = update[key]
+
+        # Lavalink.py sends {"track": {"encoded": ...}}; "encodedTrack" is the deprecated form of the same thing
+        if "track" in update or "encodedTrack" in update:
+            encoded = update["track"].get("encoded") if "track" in update else update["encodedTrack"]
+            previous_track = player["track"]
+            player["track"] = self._decoded_track(encoded) if encoded else None
+
+            if previous_track is not None:
+                reason = "replaced" if player["track"] else "stopped"
+                await self._broadcast({"op": "event", "type": "TrackEndEvent", "guildId": guild_id,
+                                       "track": previous_track, "reason": reason})
+            if player["track"] is not None:
+                if self.start_latency:
+                    asyncio.create_task(self._start_track(guild_id, player, player["track"]))
+                else:
+                    await self._start_track(guild_id, player, player["track"])
+
+        return web.json_response({**player, "state": {"time": int(time.time() * 1000), "position": update.get("position", 0),
+                                                      "connected": True, "ping": 1}})
+
+    async def _start_track(self, guild_id: str, player: Dict[str, Any], track: Dict[str, Any]) -> None:
+        if self.start_latency:
+            await asyncio.sleep(self.start_latency)
+        # Replaced or stopped while the audio was still opening
+        if player["track"] is not track:
+            return
+
+        await self._broadcast({"op": "event", "type": "TrackStartEvent", "guildId": guild_id, "track": track})
+        if track["info"]["identifier"] in self.unavailable:
+            player["track"] = None
+            await self._broadcast({"op": "event", "type": "TrackExceptionEvent", "guildId": guild_id, "track": track,
+                                   "exception": {"message": "This video is unavailable", "severity": "common", "cause": "FriendlyException"}})
+            await self._broadcast({"op": "event", "type": "TrackEndEvent", "guildId": guild_id, "track": track, "reason": "loadFailed"})
+
+    async def _handle_destroy_player(self, request: web.Request) -> web.Response:
+        self._count("destroy_player")
+        self.players.pop(request.match_info["guild_id"], None)
+        return web.Response(status=204)
+
+    async def _handle_stats(self, _: web.Request) -> web.Response:
+        return web.json_response(self.stats())
+
+    async def _handle_version(self, _: web.Request) -> web.Response:
+        return web.Response(text="4.0.0-fake")
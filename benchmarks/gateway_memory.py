@@ -0,0 +1,130 @@
+"""
+Memory benchmark for the default and low-memory gateway modes.
+
+Run from the repository root with `python -m benchmarks.gateway_memory`. For each guild size, a synthetic GUILD_CREATE
+(and, where the mode would chunk, the GUILD_MEMBERS_CHUNKs that follow it) is fed through discord.py's real connection
+state, configured the way gateway_config.gateway_options configures the bot. Traced memory is measured after each guild
+is cached. The default mode should grow with total member count, and low-memory mode with voice-connected members only.
+"""
+import asyncio
+import gc
+import tracemalloc
+
+import discord
+from discord.state import ChunkRequest
+
+from gateway_config import gateway_options
+
+GUILD_SIZES = (1_000, 10_000, 50_000, 100_000)
+ONLINE_FRACTION = 0.3
+VOICE_FRACTION = 0.01
+# Discord only sends online members in GUILD_CREATE for guilds over the large threshold, and chunks the rest
+LARGE_THRESHOLD = 250
+CHUNK_SIZE = 1_000
+GUILD_ID = 1
+ROLE_ID = 2
+VOICE_CHANNEL_ID = 3
+
+
+def _member(member_id: int) -> dict:
+    return {
+        "user": {"id": str(member_id), "username": f"member-{member_id}", "discriminator": "0", "avatar": None, "global_name": None},
+        "roles": [str(ROLE_ID)] if member_id % 10 == 0 else [],
+        "joined_at": "2024-01-01T00:00:00+00:00",
+        "deaf": False,
+        "mute": False,
+        "flags": 0,
+    }
+
+
+def _presence(member_id: int) -> dict:
+    return {"user": {"id": str(member_id)}, "status": "online", "activities": [], "client_status": {"desktop": "online"}}
+
+
+def _guild_create(member_count: int, presences: bool) -> dict:
+    online = range(1, int(member_count * ONLINE_FRACTION) + 1)
+    in_voice = range(1, int(member_count * VOICE_FRACTION) + 1)
+    sent_members = range(1, member_count + 1) if member_count <= LARGE_THRESHOLD else online
+
+    return {
+        "id": str(GUILD_ID),
+        "name": "benchmark",
+        "member_count": member_count,
+        "large": member_count > LARGE_THRESHOLD,
+        "roles": [
+            {"id": str(GUILD_ID), "name": "@everyone", "permissions": "0", "position": 0, "color": 0, "hoist": False, "managed": False, "mentionable": False},
+            {"id": str(ROLE_ID), "name": "In Server Lobby", "permissions": "0", "position": 1, "color": 0, "hoist": True, "managed": False, "mentionable": True},
+        ],
+        "channels": [{"id": str(VOICE_CHANNEL_ID), "type": 2, "name": "Lounge", "position": 0, "bitrate": 64000, "user_limit": 0}],
+        "voice_states": [
+            {"user_id": str(member_id), "channel_id": str(VOICE_CHANNEL_ID), "session_id": f"s{member_id}", "deaf": False, "mute": False,
+             "self_deaf": False, "self_mute": False, "self_video": False, "suppress": False, "request_to_speak_timestamp": None}
+            for member_id in in_voice
+        ],
+        "members": [_member(member_id) for member_id in sent_members],
+        "presences": [_presence(member_id) for member_id in online] if presences else [],
+        "threads": [],
+        "emojis": [],
+        "stickers": [],
+    }
+
+
+def _member_chunks(member_count: int, presences: bool, nonce: str):
+    chunk_count = -(-member_count // CHUNK_SIZE)
+    for chunk_index in range(chunk_count):
+        member_ids = range(chunk_index * CHUNK_SIZE + 1, min(member_count, (chunk_index + 1) * CHUNK_SIZE) + 1)
+        yield {
+            "guild_id": str(GUILD_ID),
+            "members": [_member(member_id) for member_id in member_ids],
+            "presences": [_presence(member_id) for member_id in member_ids if member_id <= member_count * ONLINE_FRACTION] if presences else [],
+            "chunk_index": chunk_index,
+            "chunk_count": chunk_count,
+            "nonce": nonce,
+        }
+
+
+async def _measure(member_count: int, low_memory: bool) -> tuple[int, int]:
+    options = gateway_options(low_memory)
+    client = discord.Client(**options)
+    state = client._connection
+    intents: discord.Intents = options["intents"]
+    will_chunk = options.get("chunk_guilds_at_startup", True) and intents.members
+
+    gc.collect()
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+
+    # Payloads are built and dropped one at a time so only what the cache keeps is left behind
+    state._add_guild_from_data(_guild_create(member_count, intents.presences))
+    if will_chunk:
+        # The same bookkeeping the state sets up when it chunks a guild, so chunked members are cached
+        request = ChunkRequest(GUILD_ID, 0, asyncio.get_running_loop(), state._get_guild, cache=True)
+        state._chunk_requests[request.nonce] = request
+        for chunk in _member_chunks(member_count, intents.presences, request.nonce):
+            state.parse_guild_members_chunk(chunk)
+
+    gc.collect()
+    retained = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+
+    cached_members = len(state._get_guild(GUILD_ID).members)
+    await client.close()
+    return retained, cached_members
+
+
+async def run() -> None:
+    print(f"{'members':>9} {'default MiB':>12} {'cached':>8} {'low-memory MiB':>15} {'cached':>8}")
+
+    for member_count in GUILD_SIZES:
+        default_bytes, default_cached = await _measure(member_count, low_memory=False)
+        low_bytes, low_cached = await _measure(member_count, low_memory=True)
+
+        print(f"{member_count:>9} {default_bytes / 2 ** 20:>12.1f} {default_cached:>8} {low_bytes / 2 ** 20:>15.2f} {low_cached:>8}")
+
+
+def main() -> None:
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+Benchmark comparing free-text lookups in the local track history index against a Lavalink search.
+
+Run from the repository root with `python -m benchmarks.history_lookup`. A fresh TrackHistoryIndex is filled with
+`--tracks` tracks spread over `--guilds` guilds, with skewed play counts. The same queries, made from words of tracks
+each guild has played and sometimes mistyped, are then answered by the index and by a fake Lavalink node
+(benchmarks/fake_lavalink.py) over its REST API. Queries for songs nobody has played show the cost a miss adds in front
+of the search it falls back to.
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import tempfile
+import time
+import types
+from typing import Dict, List
+
+import discord
+import lavalink
+from discord.ext import commands
+
+from benchmarks.fake_discord import next_id
+from benchmarks.fake_lavalink import FakeLavalinkNode, fake_track
+from lavalink_pool import ensure_lavalink_client
+from track_history import TrackHistoryIndex
+
+WORDS = (
+    "midnight", "city", "lights", "dancing", "alone", "summer", "rain", "golden", "hour", "heart", "fire", "ocean",
+    "eyes", "dream", "electric", "love", "highway", "neon", "shadow", "river", "moon", "paper", "wings", "echo",
+    "silver", "storm", "velvet", "sky", "wild", "forever", "satellite", "diamond", "ghost", "horizon", "crystal",
+)
+ARTISTS = ("The Night Owls", "Aurora Lane", "Kilo Park", "Saffron", "Juno & The Tides", "DJ Marlowe", "Cobalt Youth")
+
+
+def _title(rng: random.Random) -> str:
+    return " ".join(rng.sample(WORDS, rng.randint(2, 4))).title()
+
+
+def _mistype(word: str, rng: random.Random) -> str:
+    if len(word) < 5:
+        return word
+    index = rng.randrange(1, len(word) - 1)
+    return word[:index] + word[index + 1:]
+
+
+def _query(track: lavalink.AudioTrack, rng: random.Random, typo_rate: float) -> str:
+    words = track.title.lower().split()
+    words = rng.sample(words, min(len(words), rng.randint(2, 3)))
+    if rng.random() < typo_rate:
+        words[0] = _mistype(words[0], rng)
+    return " ".join(words)
+
+
+def _summary(samples: List[float]) -> str:
+    ordered = sorted(samples)
+    p99 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]
+    return f"p50 {statistics.median(ordered) * 1000:8.3f}ms  p99 {p99 * 1000:8.3f}ms"
+
+
+async def _fill(index: TrackHistoryIndex, track_count: int, guild_ids: List[int],
+                rng: random.Random) -> Dict[int, List[lavalink.AudioTrack]]:
+    played: Dict[int, List[lavalink.AudioTrack]] = {guild_id: [] for guild_id in guild_ids}
+
+    for track_index in range(track_count):
+        info = {**fake_track(f"history-{track_index}", _title(rng))["info"], "author": rng.choice(ARTISTS)}
+        track = lavalink.decode_track(lavalink.encode_track(info)[1])
+        guild_id = rng.choice(guild_ids)
+
+        await index.record(guild_id, track)
+        # A few favourites get played a lot and most only once or twice
+        for _ in range(int(rng.paretovariate(1.5))):
+            await index.record(guild_id, track, played=True)
+        played[guild_id].append(track)
+
+    return played
+
+
+async def run(track_count: int, guild_count: int, query_count: int, load_latency: float, typo_rate: float, seed: int) -> None:
+    rng = random.Random(seed)
+    index = TrackHistoryIndex(os.path.join(tempfile.mkdtemp(prefix="chocobot-history-"), "track_history.db"))
+
+    guild_ids = list(range(1, guild_count + 1))
+    started_at = time.perf_counter()
+    played = await _fill(index, track_count, guild_ids, rng)
+    fill_time = time.perf_counter() - started_at
+
+    queries = []
+    for _ in range(query_count):
+        guild_id = rng.choice([guild_id for guild_id in guild_ids if played[guild_id]])
+        queries.append((guild_id, _query(rng.choice(played[guild_id]), rng, typo_rate)))
+    unknown_queries = [(rng.choice(guild_ids), f"unreleased demo {query_index}") for query_index in range(query_count)]
+
+    history_latency: List[float] = []
+    hits = 0
+    for guild_id, query in queries:
+        started_at = time.perf_counter()
+        tracks = await index.search(guild_id, query)
+        history_latency.append(time.perf_counter() - started_at)
+        hits += bool(tracks)
+
+    miss_latency: List[float] = []
+    for guild_id, query in unknown_queries:
+        started_at = time.perf_counter()
+        await index.search(guild_id, query)
+        miss_latency.append(time.perf_counter() - started_at)
+
+    node = FakeLavalinkNode(load_latency=load_latency)
+    await node.start()
+    bot = commands.Bot(command_prefix="!", intents=discord.Intents.none())
+    await bot._async_setup_hook()
+    bot._connection.user = types.SimpleNamespace(id=next_id(), name="Chocobot", bot=True)
+    lavalink_client = ensure_lavalink_client(bot, [node.config])
+    while not all(lavalink_node.available for lavalink_node in lavalink_client.node_manager):
+        await asyncio.sleep(0.01)
+    lavalink_node = lavalink_client.node_manager.nodes[0]
+
+    rest_latency: List[float] = []
+    for _, query in queries:
+        started_at = time.perf_counter()
+        await lavalink_node.get_tracks(f"ytsearch:{query}")
+        rest_latency.append(time.perf_counter() - started_at)
+
+    print(f"{track_count} tracks over {guild_count} guilds indexed in {fill_time:.2f}s, {query_count} queries "
+          f"({typo_rate:.0%} with a typo), fake node search latency {load_latency * 1000:.0f}ms")
+    print(f"History hit:     {_summary(history_latency)}  ({hits}/{query_count} answered locally)")
+    print(f"History miss:    {_summary(miss_latency)}")
+    print(f"Lavalink search: {_summary(rest_latency)}")
+
+    index.close()
+    await bot.lavalink.close()
+    await node.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--tracks", type=int, default=20_000)
+    parser.add_argument("--guilds", type=int, default=50)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--load-latency", type=float, default=0.3, help="seconds each fake Lavalink search takes")
+    parser.add_argument("--typo-rate", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    asyncio.run(run(args.tracks, args.guilds, args.queries, args.load_latency, args.typo_rate, args.seed))
+
+
+if __name__ == "__main__":
+    main()
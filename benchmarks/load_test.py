@@ -0,0 +1,267 @@
+"""
+Offline load test for the bot's command and event handlers.
+
+Run from the repository root with `python -m benchmarks.load_test`. It starts one or more fake Lavalink nodes
+(benchmarks/fake_lavalink.py), builds N fake guilds (benchmarks/fake_discord.py), registers them, and has every guild
+run a seeded mix of play (including searches)/queue/skip/join_lobby commands and voice-state churn concurrently through the real Music cog
+and main.py handlers. It reports throughput and p50/p99 latency per handler. Pass --output to write the results as
+JSON, so runs can be compared across releases. With the same seed and parameters, every run does the same work.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import types
+from typing import Any, Dict, List
+
+# main.py reads its configuration at import time, so the harness has to set it first
+os.environ.setdefault("COMMAND_PREFIX", "!")
+os.environ.setdefault("LOBBY_RECONCILE_WINDOW", "0.05")
+_state_directory = tempfile.mkdtemp(prefix="chocobot-load-")
+os.environ.setdefault("GUILD_ARCHIVE_PATH", os.path.join(_state_directory, "guild_archive.json"))
+os.environ.setdefault("QUEUE_SNAPSHOT_PATH", os.path.join(_state_directory, "queue_snapshot.json"))
+os.environ.setdefault("TRACK_HISTORY_PATH", os.path.join(_state_directory, "track_history.db"))
+os.environ.pop("METRICS_PORT", None)
+
+from benchmarks.fake_discord import FakeGuild, FakeMessage, build_context, join_voice, next_id
+from benchmarks.fake_lavalink import FakeLavalinkNode
+
+RESULTS_SCHEMA_VERSION = 1
+OPERATION_WEIGHTS = {
+    "play": 30,
+    "play_playlist": 2,
+    "play_search": 5,
+    "queue": 20,
+    "skip": 10,
+    "join_lobby": 5,
+    "voice_churn": 33,
+}
+
+
+def percentile(samples: List[float], fraction: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+class LoadTest():
+    def __init__(self, guild_count: int, operations: int, seed: int, node_count: int, load_latency: float,
+                 rest_latency: float, track_pool: int) -> None:
+        self.guild_count = guild_count
+        self.operations = operations
+        self.seed = seed
+        self.node_count = node_count
+        self.load_latency = load_latency
+        self.rest_latency = rest_latency
+        self.track_pool = track_pool
+
+        self.samples: Dict[str, List[float]] = {}
+        self.failures: Dict[str, int] = {}
+        self.nodes: List[FakeLavalinkNode] = []
+
+    def _record(self, handler: str, seconds: float, failed: bool = False) -> None:
+        self.samples.setdefault(handler, []).append(seconds)
+        if failed:
+            self.failures[handler] = self.failures.get(handler, 0) + 1
+
+    async def _setup(self):
+        import main
+        from lavalink_pool import ensure_lavalink_client
+        from music import Music
+
+        for index in range(self.node_count):
+            node = FakeLavalinkNode(name=f"fake-{index}", load_latency=self.load_latency)
+            await node.start()
+            self.nodes.append(node)
+
+        bot = main.bot
+        # Binds the bot to the running loop, which login() would normally do
+        await bot._async_setup_hook()
+        bot._connection.user = types.SimpleNamespace(id=next_id(), name="Chocobot", bot=True)
+        lavalink_client = ensure_lavalink_client(bot, [node.config for node in self.nodes])
+
+        while not all(node.available for node in lavalink_client.node_manager):
+            await asyncio.sleep(0.01)
+
+        await bot.add_cog(Music(bot, visible_queue_length=main.VISIBLE_QUEUE_LENGTH))
+
+        guilds = []
+        for index in range(self.guild_count):
+            guild = FakeGuild(bot, f"guild-{index}", rest_latency=self.rest_latency)
+            bot._connection._guilds[guild.id] = guild
+            main.guild_registry.add(await main.ChocobotGuildRecord.generate_record(guild, guild.text_channels[0]))
+            guilds.append(guild)
+
+        return main, bot, guilds
+
+    async def _run_command(self, bot, guild: FakeGuild, author, content: str, handler: str) -> None:
+        ctx = build_context(bot, author, guild.text_channels[0], content)
+
+        started_at = time.perf_counter()
+        await bot.invoke(ctx)
+        self._record(handler, time.perf_counter() - started_at, ctx.command_failed)
+
+    async def _run_search(self, bot, guild: FakeGuild, author, search: str, choice: int) -> None:
+        from interaction_dispatcher import interaction_dispatcher
+
+        channel = guild.text_channels[0]
+        ctx = build_context(bot, author, channel, f"!play {search}")
+
+        sent_before = len(channel.sent)
+        started_at = time.perf_counter()
+        command = asyncio.create_task(bot.invoke(ctx))
+        # Answers the track picker as soon as it's up, the way a user typing the number would
+        while not command.done():
+            picker = next((message for message in channel.sent[sent_before:] if "view" in message.kwargs), None)
+            if picker is not None:
+                # Results from the guild's track history can offer fewer than five choices
+                reply = FakeMessage(channel, author, str(min(choice, len(picker.kwargs["view"].children))))
+                if interaction_dispatcher.dispatch(reply):
+                    break
+            await asyncio.sleep(0.001)
+        await command
+        self._record("play_search", time.perf_counter() - started_at, ctx.command_failed)
+
+    async def _run_guild(self, main, bot, guild: FakeGuild, rng: random.Random) -> None:
+        humans = guild.humans
+        dj = humans[0]
+        operations = rng.choices(list(OPERATION_WEIGHTS), weights=list(OPERATION_WEIGHTS.values()), k=self.operations)
+
+        # The DJ joins voice first, the same way a real session starts
+        before, after = join_voice(dj, guild.voice_channels[0])
+        await main.on_voice_state_update(dj, before, after)
+
+        for operation in operations:
+            if operation == "play":
+                # A skewed pick, so popular tracks repeat across guilds the way they do in production
+                track_number = min(int(rng.paretovariate(1.2)), self.track_pool)
+                await self._run_command(bot, guild, dj, f"!play https://example.com/watch?v=track{track_number:05}", "play")
+            elif operation == "play_playlist":
+                await self._run_command(bot, guild, dj, f"!play https://example.com/playlist?list=pl{rng.randrange(5):010}", "play")
+            elif operation == "play_search":
+                await self._run_search(bot, guild, dj, f"artist {rng.randrange(50)}", rng.randint(1, 5))
+            elif operation in ("queue", "skip"):
+                await self._run_command(bot, guild, dj, f"!{operation}", operation)
+            elif operation == "join_lobby":
+                await self._run_command(bot, guild, rng.choice(humans[1:]), "!join_lobby", "join_lobby")
+            else:
+                member = rng.choice(humans[1:])
+                channel = None if member.voice else rng.choice(guild.voice_channels)
+                before, after = join_voice(member, channel)
+
+                started_at = time.perf_counter()
+                await main.on_voice_state_update(member, before, after)
+                self._record("on_voice_state_update", time.perf_counter() - started_at)
+
+    async def run(self) -> Dict[str, Any]:
+        main, bot, guilds = await self._setup()
+        rng = random.Random(self.seed)
+        guild_rngs = [random.Random(rng.random()) for _ in guilds]
+
+        started_at = time.perf_counter()
+        await asyncio.gather(*[self._run_guild(main, bot, guild, guild_rng) for guild, guild_rng in zip(guilds, guild_rngs)])
+        elapsed = time.perf_counter() - started_at
+
+        results = self._summarise(elapsed, bot)
+        await self._teardown(bot)
+        return results
+
+    def _summarise(self, elapsed: float, bot) -> Dict[str, Any]:
+        from music import track_search_cache
+
+        handlers = {}
+        for handler, samples in sorted(self.samples.items()):
+            handlers[handler] = {
+                "count": len(samples),
+                "failures": self.failures.get(handler, 0),
+                "throughput_per_second": len(samples) / elapsed,
+                "mean_ms": statistics.fmean(samples) * 1000,
+                "p50_ms": percentile(samples, 0.50) * 1000,
+                "p99_ms": percentile(samples, 0.99) * 1000,
+            }
+
+        total_operations = sum(len(samples) for samples in self.samples.values())
+        return {
+            "schema_version": RESULTS_SCHEMA_VERSION,
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "parameters": {
+                "guilds": self.guild_count,
+                "operations_per_guild": self.operations,
+                "seed": self.seed,
+                "nodes": self.node_count,
+                "load_latency_ms": self.load_latency * 1000,
+                "rest_latency_ms": self.rest_latency * 1000,
+                "track_pool": self.track_pool,
+            },
+            "elapsed_seconds": elapsed,
+            "throughput_per_second": total_operations / elapsed,
+            "handlers": handlers,
+            "lavalink_requests": {node.name: dict(node.requests) for node in self.nodes},
+            "track_search_cache": track_search_cache.stats(),
+            "live_players": len(bot.lavalink.player_manager),
+        }
+
+    async def _teardown(self, bot) -> None:
+        await bot.remove_cog("Music")
+        await bot.lavalink.close()
+        for node in self.nodes:
+            await node.stop()
+
+
+def print_report(results: Dict[str, Any]) -> None:
+    parameters = results["parameters"]
+    print(f"{parameters['guilds']} guilds x {parameters['operations_per_guild']} operations, seed {parameters['seed']}, "
+          f"{parameters['nodes']} node(s), revision {results['revision']}")
+    print(f"{results['throughput_per_second']:.1f} operations/s over {results['elapsed_seconds']:.2f}s\n")
+    print(f"{'handler':<24}{'count':>8}{'fail':>6}{'ops/s':>10}{'p50 ms':>10}{'p99 ms':>10}")
+
+    for handler, summary in results["handlers"].items():
+        print(f"{handler:<24}{summary['count']:>8}{summary['failures']:>6}{summary['throughput_per_second']:>10.1f}"
+              f"{summary['p50_ms']:>10.2f}{summary['p99_ms']:>10.2f}")
+
+    print(f"\nLavalink requests: {results['lavalink_requests']}")
+    print(f"Track search cache: {results['track_search_cache']}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--guilds", type=int, default=50)
+    parser.add_argument("--operations", type=int, default=40, help="operations per guild")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--nodes", type=int, default=1, help="fake Lavalink nodes to spread players over")
+    parser.add_argument("--load-latency", type=float, default=0.05, help="seconds each fake track load takes")
+    parser.add_argument("--rest-latency", type=float, default=0.0, help="seconds each fake Discord REST call takes")
+    parser.add_argument("--track-pool", type=int, default=500, help="distinct tracks guilds pick from")
+    parser.add_argument("--output", help="write the results as JSON to this path")
+    parser.add_argument("--verbose", action="store_true", help="show the bot's own output while the test runs")
+    args = parser.parse_args()
+
+    load_test = LoadTest(args.guilds, args.operations, args.seed, args.nodes, args.load_latency, args.rest_latency, args.track_pool)
+    with contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO()):
+        results = asyncio.run(load_test.run())
+    print_report(results)
+
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(results, output_file, indent=2)
+        print(f"\nWrote results to {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Exercises the Lavalink node pool against several local stand-in nodes: placement, rebalancing and failover.
+
+Run from the repository root with `python -m benchmarks.node_pool`. Players are started across fake Lavalink nodes
+(benchmarks/fake_lavalink.py), then one node reports a CPU load high enough to count as degraded and a single
+NodeHealthMonitor pass moves players off it. The other healthy nodes report different loads, so the pass has to spread
+its moves rather than pile them onto whichever node looked best first. Finally the busiest healthy node is stopped,
+and Lavalink.py should move its players onto the nodes that are left.
+"""
+import argparse
+import asyncio
+import time
+import types
+from typing import Dict, List
+
+import discord
+import lavalink
+from discord.ext import commands
+
+from benchmarks.fake_discord import FakeGuild, next_id
+from benchmarks.fake_lavalink import FakeLavalinkNode, fake_track
+from lavalink_pool import NodeHealthMonitor, describe_nodes, ensure_lavalink_client
+from music import LavalinkVoiceClient
+
+STATS_INTERVAL = 0.2
+
+
+def _players_per_node(lavalink_client: lavalink.Client) -> Dict[str, int]:
+    return {description["name"]: description["players"] for description in describe_nodes(lavalink_client)}
+
+
+async def _wait_for_stats() -> None:
+    # Long enough for every node to send a report reflecting the latest changes
+    await asyncio.sleep(STATS_INTERVAL * 3)
+
+
+async def run(guild_count: int, loads: List[float]) -> None:
+    nodes = [FakeLavalinkNode(name=f"node-{index}", stats_interval=STATS_INTERVAL) for index in range(len(loads))]
+    for node in nodes:
+        await node.start()
+
+    bot = commands.Bot(command_prefix="!", intents=discord.Intents.none())
+    await bot._async_setup_hook()
+    bot._connection.user = types.SimpleNamespace(id=next_id(), name="Chocobot", bot=True)
+    lavalink_client = ensure_lavalink_client(bot, [node.config for node in nodes])
+    while not all(lavalink_node.available for lavalink_node in lavalink_client.node_manager):
+        await asyncio.sleep(0.01)
+
+    guilds = [FakeGuild(bot, f"guild-{index}") for index in range(guild_count)]
+    for guild in guilds:
+        bot._connection._guilds[guild.id] = guild
+        player = bot.lavalink.player_manager.create(guild.id)
+        await guild.voice_channels[0].connect(cls=LavalinkVoiceClient)
+        await player.play(lavalink.AudioTrack(fake_track(f"{guild.id}"), requester=0))
+    await _wait_for_stats()
+    placed = _players_per_node(lavalink_client)
+
+    # The first node degrades, and the rest are left with different amounts of headroom
+    for node, load in zip(nodes, loads):
+        node.system_load = load
+    await _wait_for_stats()
+
+    monitor = NodeHealthMonitor(lavalink_client, max_migrations=guild_count)
+    started_at = time.perf_counter()
+    moved = await monitor.rebalance()
+    rebalance_time = time.perf_counter() - started_at
+    await _wait_for_stats()
+    rebalanced = _players_per_node(lavalink_client)
+    penalties = {description["name"]: description["penalty"] for description in describe_nodes(lavalink_client)}
+
+    busiest_healthy = max(nodes[1:], key=lambda node: len(node.players))
+    await busiest_healthy.stop()
+    # Lavalink.py notices the closed socket and moves the node's players to the others
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline and any(
+        player.node is not None and not player.node.available for player in bot.lavalink.player_manager.values()
+    ):
+        await asyncio.sleep(0.05)
+    failed_over = _players_per_node(lavalink_client)
+    stranded = sum(1 for player in bot.lavalink.player_manager.values() if player.node is None or not player.node.available)
+
+    print(f"{guild_count} players on {len(nodes)} nodes, loads after degrading: {', '.join(f'{load:.2f}' for load in loads)}\n")
+    print(f"{'node':<10}{'placed':>8}{'rebalanced':>12}{'penalty':>10}{'failed over':>13}")
+    for name in placed:
+        print(f"{name:<10}{placed[name]:>8}{rebalanced[name]:>12}{penalties[name]:>10.0f}{failed_over.get(name, 0):>13}")
+    print(f"\nRebalance moved {moved} players in {rebalance_time * 1000:.1f}ms. {busiest_healthy.name} was then stopped, "
+          f"leaving {stranded} players on an unavailable node.")
+
+    await bot.lavalink.close()
+    for node in nodes:
+        if node is not busiest_healthy:
+            await node.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--guilds", type=int, default=60)
+    parser.add_argument("--loads", type=float, nargs="+", default=[0.95, 0.30, 0.10, 0.10],
+                        help="each node's CPU load once the first one degrades")
+    args = parser.parse_args()
+
+    asyncio.run(run(args.guilds, args.loads))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Measures time-to-first-audio and per-guild queue memory when enqueueing a large playlist.
+
+Run from the repository root with `python -m benchmarks.playlist_enqueue`. "Eager" adds every track and replies in the
+channel before starting playback, the way Music.play used to. "Streaming" starts playback after the first track,
+replies, and adds the rest with music.enqueue_in_batches, which keeps tracks past QUEUE_FULL_TRACK_WINDOW in compact
+form. The reply and the player update that starts playback each wait out a simulated REST round-trip, since those
+dominate time-to-first-audio rather than queueing itself. Times are measured from when the search results arrive.
+"""
+import argparse
+import asyncio
+import base64
+import os
+import time
+import tracemalloc
+
+import lavalink
+
+from music import enqueue_in_batches
+
+PLAYLIST_LENGTH = 1_000
+# Round-trips for sending a message through Discord's REST API and for a Lavalink player update
+REPLY_LATENCY = 0.15
+PLAY_LATENCY = 0.02
+
+
+def _fake_track(index: int) -> lavalink.AudioTrack:
+    # Shaped like a YouTube plugin track, with a realistic encoded string and artwork/plugin metadata
+    identifier = base64.urlsafe_b64encode(os.urandom(8)).decode()[:11]
+    return lavalink.AudioTrack({
+        'encoded': base64.b64encode(os.urandom(240)).decode(),
+        'info': {
+            'identifier': identifier,
+            'isSeekable': True,
+            'author': f'Channel {index % 97}',
+            'length': 180_000 + index,
+            'isStream': False,
+            'position': 0,
+            'title': f'Some Artist - Some Reasonably Long Song Title #{index} (Official Video)',
+            'uri': f'https://www.youtube.com/watch?v={identifier}',
+            'artworkUrl': f'https://i.ytimg.com/vi/{identifier}/maxresdefault.jpg',
+            'isrc': None,
+            'sourceName': 'youtube',
+        },
+        'pluginInfo': {'albumName': None, 'albumUrl': None, 'artistUrl': f'https://www.youtube.com/channel/{identifier}',
+                       'artistArtworkUrl': None, 'previewUrl': None, 'isPreview': False},
+        'userData': {},
+    })
+
+
+class _BenchPlayer():
+    """Stands in for lavalink.DefaultPlayer, recording when the node would have been told to start playback"""
+
+    def __init__(self, play_latency: float) -> None:
+        self.guild_id = 0
+        self.queue: list[lavalink.AudioTrack] = []
+        self.started_at = None
+        self.play_latency = play_latency
+
+    def add(self, track: lavalink.AudioTrack, requester: int = 0) -> None:
+        if requester != 0:
+            track.requester = requester
+        self.queue.append(track)
+
+    async def play(self) -> None:
+        await asyncio.sleep(self.play_latency)
+        self.started_at = time.perf_counter()
+
+
+async def _eager(tracks: list[lavalink.AudioTrack], reply_latency: float, play_latency: float) -> _BenchPlayer:
+    player = _BenchPlayer(play_latency)
+    for track in tracks:
+        player.add(requester=1, track=track)
+    await asyncio.sleep(reply_latency)
+    await player.play()
+    return player
+
+
+async def _streaming(tracks: list[lavalink.AudioTrack], reply_latency: float, play_latency: float) -> _BenchPlayer:
+    player = _BenchPlayer(play_latency)
+    player.add(requester=1, track=tracks[0])
+    await player.play()
+    enqueue_task = asyncio.create_task(enqueue_in_batches(player, tracks[1:], 1))
+    await asyncio.sleep(reply_latency)
+    await enqueue_task
+    return player
+
+
+async def _measure(label: str, enqueue, reply_latency: float, play_latency: float) -> None:
+    tracemalloc.start()
+    tracks = [_fake_track(index) for index in range(PLAYLIST_LENGTH)]
+
+    started_at = time.perf_counter()
+    player = await enqueue(tracks, reply_latency, play_latency)
+    finished_at = time.perf_counter()
+    # Drop the search results so only what the guild's queue keeps alive is counted
+    del tracks
+    queue_bytes, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(
+        f"{label:>10}: first audio after {(player.started_at - started_at) * 1000:7.2f} ms, "
+        f"queue complete after {(finished_at - started_at) * 1000:7.2f} ms, "
+        f"{len(player.queue)} tracks, {queue_bytes / 1024:8.1f} KiB retained"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--reply-latency", type=float, default=REPLY_LATENCY, help="seconds a Discord reply takes to send")
+    parser.add_argument("--play-latency", type=float, default=PLAY_LATENCY, help="seconds a Lavalink player update takes")
+    args = parser.parse_args()
+
+    print(f"Reply round-trip {args.reply_latency * 1000:.0f} ms, player update round-trip {args.play_latency * 1000:.0f} ms\n")
+    asyncio.run(_measure("eager", _eager, args.reply_latency, args.play_latency))
+    asyncio.run(_measure("streaming", _streaming, args.reply_latency, args.play_latency))
+
+
+if __name__ == "__main__":
+    main()
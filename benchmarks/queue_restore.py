@@ -0,0 +1,123 @@
+"""
+Benchmark for snapshotting and restoring player queues across a restart.
+
+Run from the repository root with `python -m benchmarks.queue_restore`. Every fake guild gets a connected player with a
+queue of tracks from a fake Lavalink node (benchmarks/fake_lavalink.py). The queues are snapshotted, every player is
+torn down as if the bot had restarted, and a fresh QueueSnapshotter rebuilds them from disk. Restore should make no
+track loads at all, since tracks are decoded from their saved encoded strings.
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+import types
+
+import discord
+import lavalink
+from discord.ext import commands
+
+from benchmarks.fake_discord import FakeGuild, next_id
+from benchmarks.fake_lavalink import FakeLavalinkNode, fake_track
+from lavalink_pool import ensure_lavalink_client
+from music import LavalinkVoiceClient
+from queue_snapshot import QueueSnapshotter
+
+
+def _connect(channel):
+    return channel.connect(cls=LavalinkVoiceClient)
+
+
+async def _start_players(bot: commands.Bot, guilds: list[FakeGuild], queue_length: int, rng: random.Random) -> None:
+    for guild in guilds:
+        player = bot.lavalink.player_manager.create(guild.id)
+        player.store('channel', guild.text_channels[0].id)
+        await _connect(guild.voice_channels[0])
+
+        tracks = [lavalink.AudioTrack(fake_track(f"{guild.id}-{index}"), requester=0) for index in range(queue_length + 1)]
+        player.queue.extend(tracks[1:])
+        await player.play(tracks[0], start_time=rng.randrange(tracks[0].duration))
+
+
+async def _tear_down_players(bot: commands.Bot, guilds: list[FakeGuild]) -> None:
+    for guild in guilds:
+        await guild.voice_client.disconnect(force=True)
+        await bot.lavalink.player_manager.destroy(guild.id)
+
+
+async def run(guild_count: int, queue_length: int, seed: int) -> None:
+    snapshot_path = os.path.join(tempfile.mkdtemp(prefix="chocobot-restore-"), "queue_snapshot.json")
+    rng = random.Random(seed)
+
+    node = FakeLavalinkNode()
+    await node.start()
+
+    bot = commands.Bot(command_prefix="!", intents=discord.Intents.none())
+    await bot._async_setup_hook()
+    bot._connection.user = types.SimpleNamespace(id=next_id(), name="Chocobot", bot=True)
+    lavalink_client = ensure_lavalink_client(bot, [node.config])
+    while not all(lavalink_node.available for lavalink_node in lavalink_client.node_manager):
+        await asyncio.sleep(0.01)
+
+    guilds = [FakeGuild(bot, f"guild-{index}") for index in range(guild_count)]
+    for guild in guilds:
+        bot._connection._guilds[guild.id] = guild
+
+    await _start_players(bot, guilds, queue_length, rng)
+    # Lets the last players' voice connections and player updates land before their positions are read
+    await asyncio.sleep(0.2)
+    saved_positions = {player.guild_id: int(player.position) for player in bot.lavalink.player_manager.values()}
+
+    snapshotter = QueueSnapshotter(bot, connect=_connect, snapshot_path=snapshot_path)
+    # Nothing is saved yet, but snapshots only start once a restore has run, as they do on startup
+    await snapshotter.restore()
+    snapshotter.stop()
+    started_at = time.perf_counter()
+    queues_written = await snapshotter.snapshot()
+    first_snapshot = time.perf_counter() - started_at
+
+    started_at = time.perf_counter()
+    unchanged_written = await snapshotter.snapshot()
+    unchanged_snapshot = time.perf_counter() - started_at
+
+    snapshot_files = (snapshot_path, f"{snapshot_path}.journal", f"{snapshot_path}.positions")
+    snapshot_bytes = sum(os.path.getsize(path) for path in snapshot_files if os.path.exists(path))
+
+    await _tear_down_players(bot, guilds)
+    load_requests_before = node.requests.get("loadtracks", 0)
+
+    restored_snapshotter = QueueSnapshotter(bot, connect=_connect, snapshot_path=snapshot_path)
+    started_at = time.perf_counter()
+    restored = await restored_snapshotter.restore()
+    restore_time = time.perf_counter() - started_at
+    restored_snapshotter.stop()
+    await asyncio.sleep(0.2)
+
+    players = list(bot.lavalink.player_manager.values())
+    intact_queues = sum(1 for player in players if len(player.queue) == queue_length and player.current is not None)
+    resumed_in_place = sum(1 for player in players if abs(int(player.position) - saved_positions[player.guild_id]) < 5_000)
+
+    print(f"{guild_count} guilds, {queue_length} queued tracks each")
+    print(f"First snapshot:    {first_snapshot * 1000:8.1f}ms ({queues_written} queues written, {snapshot_bytes / 1024:.0f} KiB on disk)")
+    print(f"Repeat snapshot:   {unchanged_snapshot * 1000:8.1f}ms ({unchanged_written} queues written)")
+    print(f"Restore:           {restore_time * 1000:8.1f}ms ({restored} players, {restore_time / max(1, restored) * 1000:.2f}ms each)")
+    print(f"Intact queues:     {intact_queues}/{guild_count}, resumed at their saved position: {resumed_in_place}/{guild_count}")
+    print(f"Track loads during restore: {node.requests.get('loadtracks', 0) - load_requests_before}")
+
+    await bot.lavalink.close()
+    await node.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--guilds", type=int, default=300)
+    parser.add_argument("--queue-length", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    asyncio.run(run(args.guilds, args.queue_length, args.seed))
+
+
+if __name__ == "__main__":
+    main()
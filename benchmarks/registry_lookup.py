@@ -0,0 +1,46 @@
+"""
+Micro-benchmark for GuildRegistry lookups.
+
+Run from the repository root with `python -m benchmarks.registry_lookup`. The per-lookup cost should stay
+roughly flat as the guild count grows, where the old list scan grew linearly.
+"""
+import random
+import timeit
+
+from guild_registry import GuildRegistry
+
+GUILD_COUNTS = (10, 100, 1_000, 10_000, 50_000)
+LOOKUPS = 100_000
+
+
+class _BenchRecord():
+    def __init__(self, guild_id: int) -> None:
+        self.name: str = f"guild-{guild_id}"
+        self.guild_id: int = guild_id
+
+
+def _list_scan(records: list[_BenchRecord], guild_id: int):
+    return next((record for record in records if record.guild_id == guild_id), None)
+
+
+def main() -> None:
+    print(f"{'guilds':>8} {'registry ns/lookup':>20} {'list scan ns/lookup':>20}")
+
+    for guild_count in GUILD_COUNTS:
+        records = [_BenchRecord(guild_id) for guild_id in range(guild_count)]
+        registry: GuildRegistry[_BenchRecord] = GuildRegistry()
+        for record in records:
+            registry.add(record)
+
+        targets = [random.randrange(guild_count) for _ in range(LOOKUPS)]
+
+        registry_time = timeit.timeit(lambda: [registry.get(target) for target in targets], number=1)
+        # The list scan is far too slow to run the full lookup count at the larger sizes
+        scan_lookups = max(100, LOOKUPS // guild_count)
+        scan_time = timeit.timeit(lambda: [_list_scan(records, target) for target in targets[:scan_lookups]], number=1)
+
+        print(f"{guild_count:>8} {registry_time / LOOKUPS * 1e9:>20.1f} {scan_time / scan_lookups * 1e9:>20.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Compares many guilds each queueing the same playlist with the same guilds listening to one station playing it.
+
+Run from the repository root with `python -m benchmarks.station_fanout`. Every run drives the real Music cog against a
+fake Lavalink node (benchmarks/fake_lavalink.py) and reports the Lavalink requests made, the track objects held in
+queues, and whether every listener ends up on the station's track. The per-guild baseline runs twice: once with the
+shared track search cache bypassed, so every guild resolves the playlist itself, and once with the cache, which already
+saves the repeated lookups but not the per-guild queues. The cache is cleared between runs, so each pays for its own
+resolution.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import tempfile
+import time
+import types
+from typing import Any, Dict
+
+os.environ.setdefault("COMMAND_PREFIX", "!")
+_state_directory = tempfile.mkdtemp(prefix="chocobot-station-")
+os.environ.setdefault("GUILD_ARCHIVE_PATH", os.path.join(_state_directory, "guild_archive.json"))
+os.environ.setdefault("QUEUE_SNAPSHOT_PATH", os.path.join(_state_directory, "queue_snapshot.json"))
+os.environ.setdefault("TRACK_HISTORY_PATH", os.path.join(_state_directory, "track_history.db"))
+os.environ.pop("METRICS_PORT", None)
+
+from benchmarks.fake_discord import FakeGuild, build_context, join_voice, next_id
+from benchmarks.fake_lavalink import FakeLavalinkNode
+
+PLAYLIST_URL = "https://example.com/playlist?list=station"
+
+
+async def _invoke(bot, guild: FakeGuild, content: str) -> bool:
+    ctx = build_context(bot, guild.humans[0], guild.text_channels[0], content)
+    await bot.invoke(ctx)
+    return not ctx.command_failed
+
+
+async def run(guild_count: int) -> Dict[str, Any]:
+    import main
+    from lavalink_pool import ensure_lavalink_client
+    from music import Music, TrackSearchCache, track_search_cache
+
+    node = FakeLavalinkNode(load_latency=0.05)
+    await node.start()
+
+    bot = main.bot
+    await bot._async_setup_hook()
+    bot._connection.user = types.SimpleNamespace(id=next_id(), name="Chocobot", bot=True)
+    lavalink_client = ensure_lavalink_client(bot, [node.config])
+    while not all(lavalink_node.available for lavalink_node in lavalink_client.node_manager):
+        await asyncio.sleep(0.01)
+    await bot.add_cog(Music(bot))
+    music: Music = bot.get_cog("Music")
+    # Every guild arrives at once, and all three runs can land on one stats report. This compares Lavalink work rather
+    # than how many players the admission gate lets in, so the gate is opened wide enough for all of them.
+    music.admission.max_per_report = guild_count * 3
+
+    results = {}
+    for mode in ("per_guild", "per_guild_cached", "station"):
+        guilds = []
+        for index in range(guild_count):
+            guild = FakeGuild(bot, f"{mode}-{index}")
+            bot._connection._guilds[guild.id] = guild
+            join_voice(guild.humans[0], guild.voice_channels[0])
+            guilds.append(guild)
+
+        track_search_cache.clear()
+        if mode == "per_guild":
+            # Straight to the node, as if there were no shared cache
+            track_search_cache.get_tracks = TrackSearchCache._timed_get_tracks
+        node.requests.clear()
+        started_at = time.perf_counter()
+
+        if mode != "station":
+            succeeded = await asyncio.gather(*[_invoke(bot, guild, f"!play {PLAYLIST_URL}") for guild in guilds])
+            # Waits for the background enqueue of each playlist's remainder
+            while music.playlist_enqueue_tasks:
+                await asyncio.sleep(0.01)
+        else:
+            succeeded = [await _invoke(bot, guilds[0], "!station start fanout"), await _invoke(bot, guilds[0], f"!station add {PLAYLIST_URL}")]
+            succeeded += await asyncio.gather(*[_invoke(bot, guild, "!station join fanout") for guild in guilds[1:]])
+
+        elapsed = time.perf_counter() - started_at
+        if mode == "per_guild":
+            del track_search_cache.get_tracks
+        players = [bot.lavalink.player_manager.get(guild.id) for guild in guilds]
+        station = music.stations.get("fanout")
+        queued = sum(len(player.queue) for player in players if player is not None) + (len(station.queue) if station else 0)
+        in_sync = sum(1 for player in players if player is not None and station is not None and player.current is station.current)
+
+        results[mode] = {
+            "elapsed_seconds": elapsed,
+            "failures": succeeded.count(False),
+            "lavalink_requests": dict(node.requests),
+            "queued_tracks": queued,
+            "listeners_in_sync": in_sync if mode == "station" else None,
+        }
+
+        # Lets the node's TrackStartEvents arrive before the players they're for are removed
+        await asyncio.sleep(0.2)
+        for guild in guilds:
+            if guild.voice_client is not None:
+                await guild.voice_client.disconnect(force=True)
+            bot.lavalink.player_manager.remove(guild.id)
+        if station is not None:
+            await music.stations.end(station)
+
+    await bot.remove_cog("Music")
+    await bot.lavalink.close()
+    await node.stop()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--guilds", type=int, default=100)
+    parser.add_argument("--verbose", action="store_true", help="show the bot's own output while the benchmark runs")
+    args = parser.parse_args()
+
+    with contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO()):
+        results = asyncio.run(run(args.guilds))
+
+    print(f"{args.guilds} guilds playing the same 100-track playlist\n")
+    print(f"{'mode':<18}{'seconds':>10}{'fail':>6}{'loadtracks':>12}{'player updates':>16}{'queued tracks':>15}{'in sync':>9}")
+    for mode, summary in results.items():
+        requests = summary["lavalink_requests"]
+        in_sync = "" if summary["listeners_in_sync"] is None else f"{summary['listeners_in_sync']}/{args.guilds}"
+        print(f"{mode:<18}{summary['elapsed_seconds']:>10.2f}{summary['failures']:>6}{requests.get('loadtracks', 0):>12}"
+              f"{requests.get('update_player', 0):>16}{summary['queued_tracks']:>15}{in_sync:>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+Measures skip-to-audio latency with the track look-ahead switched off and on.
+
+Run from the repository root with `python -m benchmarks.track_transitions`. A fake Lavalink node
+(benchmarks/fake_lavalink.py) takes `--load-latency` seconds per track load and `--start-latency` seconds to open a
+track's audio. The queue mixes fresh search results, deferred tracks that have to be loaded before they can play,
+tracks restored from storage and restored tracks whose video has since gone. Each skip is timed from the skip to the
+next playable track starting, after `--listen` seconds of "listening" that give the look-ahead time to work.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import statistics
+import tempfile
+import time
+import types
+from typing import Any, Dict, List, Optional
+
+os.environ.setdefault("COMMAND_PREFIX", "!")
+_state_directory = tempfile.mkdtemp(prefix="chocobot-transitions-")
+os.environ.setdefault("GUILD_ARCHIVE_PATH", os.path.join(_state_directory, "guild_archive.json"))
+os.environ.setdefault("QUEUE_SNAPSHOT_PATH", os.path.join(_state_directory, "queue_snapshot.json"))
+os.environ.setdefault("TRACK_HISTORY_PATH", os.path.join(_state_directory, "track_history.db"))
+os.environ.pop("METRICS_PORT", None)
+
+import lavalink
+
+from benchmarks.fake_discord import FakeGuild, build_context, join_voice, next_id
+from benchmarks.fake_lavalink import FakeLavalinkNode, fake_track
+
+KINDS = ("fresh", "deferred", "restored", "gone")
+
+
+class SlowDeferredTrack(lavalink.DeferredAudioTrack):
+    """Metadata only, like a track from a source Lavalink can't play directly. Loading it costs a search."""
+
+    async def load(self, client: lavalink.Client) -> Optional[str]:
+        results = await client.get_tracks(self.uri)
+        return results.tracks[0].track if results and results.tracks else None
+
+
+def build_queue(node: FakeLavalinkNode, mode: str, length: int) -> List[lavalink.AudioTrack]:
+    from track_lookahead import mark_resolved
+
+    tracks = []
+    for index in range(length):
+        kind = KINDS[index % len(KINDS)]
+        identifier = f"{mode}-{kind}-{index}"
+        data = fake_track(identifier)
+
+        if kind == "fresh":
+            track = mark_resolved(lavalink.AudioTrack(data))
+        elif kind == "deferred":
+            track = SlowDeferredTrack({**data, "encoded": None})
+        else:
+            # Restored tracks are decoded locally, so nothing says whether they still play
+            track = lavalink.decode_track(data["encoded"])
+            if kind == "gone":
+                node.unavailable.add(identifier)
+        tracks.append(track)
+
+    # Something playable at the end, so skipping past a gone last track still has something to start
+    tracks.append(mark_resolved(lavalink.AudioTrack(fake_track(f"{mode}-end"))))
+    return tracks
+
+
+async def run(queue_length: int, listen: float, load_latency: float, start_latency: float) -> Dict[str, Any]:
+    import main
+    from lavalink_pool import ensure_lavalink_client
+    from music import Music
+
+    node = FakeLavalinkNode(load_latency=load_latency, start_latency=start_latency)
+    await node.start()
+
+    bot = main.bot
+    await bot._async_setup_hook()
+    bot._connection.user = types.SimpleNamespace(id=next_id(), name="Chocobot", bot=True)
+    lavalink_client = ensure_lavalink_client(bot, [node.config])
+    while not all(lavalink_node.available for lavalink_node in lavalink_client.node_manager):
+        await asyncio.sleep(0.01)
+    await bot.add_cog(Music(bot))
+    music: Music = bot.get_cog("Music")
+
+    started_tracks: asyncio.Queue = asyncio.Queue()
+
+    async def on_track_start(event: lavalink.TrackStartEvent) -> None:
+        started_tracks.put_nowait((time.perf_counter(), event.track.identifier))
+
+    bot.lavalink.add_event_hook(on_track_start, event=lavalink.TrackStartEvent)
+
+    results = {}
+    for mode, depth in (("off", 0), ("on", 3)):
+        music.lookahead.depth = depth
+        guild = FakeGuild(bot, f"transitions-{mode}")
+        bot._connection._guilds[guild.id] = guild
+        join_voice(guild.humans[0], guild.voice_channels[0])
+        await bot.invoke(build_context(bot, guild.humans[0], guild.text_channels[0], f"!play https://example.com/watch?v={mode}-first"))
+        player = bot.lavalink.player_manager.get(guild.id)
+
+        player.queue.extend(build_queue(node, mode, queue_length))
+        music.lookahead.schedule(player)
+
+        samples: Dict[str, List[float]] = {kind: [] for kind in KINDS}
+        while len(player.queue) > 1:
+            await asyncio.sleep(listen)
+            while not started_tracks.empty():
+                started_tracks.get_nowait()
+
+            # A gone track the look-ahead has already swapped out is next in line as a replacement search result
+            identifier = player.queue[0].identifier
+            next_kind = identifier.split("-")[1] if identifier.startswith(f"{mode}-") else "gone"
+            skipped_at = time.perf_counter()
+            await player.skip()
+
+            while True:
+                started_at, identifier = await asyncio.wait_for(started_tracks.get(), timeout=10)
+                if identifier not in node.unavailable:
+                    break
+            samples[next_kind].append(started_at - skipped_at)
+
+        results[mode] = {kind: statistics.fmean(values) * 1000 for kind, values in samples.items() if values}
+        results[mode]["all"] = statistics.fmean([value for values in samples.values() for value in values]) * 1000
+
+        await guild.voice_client.disconnect(force=True)
+        bot.lavalink.player_manager.remove(guild.id)
+
+    results["lookahead"] = music.lookahead.stats()
+    await bot.remove_cog("Music")
+    await bot.lavalink.close()
+    await node.stop()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--queue-length", type=int, default=40)
+    parser.add_argument("--listen", type=float, default=0.3, help="seconds between skips")
+    parser.add_argument("--load-latency", type=float, default=0.1, help="seconds each fake track load takes")
+    parser.add_argument("--start-latency", type=float, default=0.02, help="seconds the fake node takes to open a track's audio")
+    parser.add_argument("--verbose", action="store_true", help="show the bot's own output while the benchmark runs")
+    args = parser.parse_args()
+
+    with contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO()):
+        results = asyncio.run(run(args.queue_length, args.listen, args.load_latency, args.start_latency))
+
+    print(f"Mean skip-to-audio through a {args.queue_length}-entry queue, {args.load_latency * 1000:.0f}ms loads, "
+          f"{args.start_latency * 1000:.0f}ms audio start\n")
+    print(f"{'look-ahead':<12}" + "".join(f"{kind + ' ms':>14}" for kind in (*KINDS, "all")))
+    for mode in ("off", "on"):
+        print(f"{mode:<12}" + "".join(f"{results[mode].get(kind, 0):>14.1f}" for kind in (*KINDS, "all")))
+    print(f"\nLook-ahead: {results['lookahead']}")
+
+
+if __name__ == "__main__":
+    main()
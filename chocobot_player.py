@@ -0,0 +1,177 @@
+import time
+from typing import Dict, Iterable, Optional, SupportsIndex
+
+import lavalink
+
+import metrics
+from filter_chain import FilterChain
+
+
+def format_duration(milliseconds: int) -> str:
+    minutes, seconds = divmod(milliseconds // 1000, 60)
+    hours, minutes = divmod(minutes, 60)
+
+    return f"{hours}:{minutes:02}:{seconds:02}" if hours else f"{minutes}:{seconds:02}"
+
+
+def _track_duration(track: lavalink.AudioTrack) -> int:
+    # Streams report a meaningless length, so they don't count towards the queue's total
+    return 0 if track.is_stream else track.duration
+
+
+class TrackedQueue(list):
+    """
+    A player queue that keeps its total duration up to date as it changes and bumps `version` on every change,
+    so anything derived from the queue can tell when it's stale without rescanning it.
+    """
+
+    def __init__(self, tracks: Iterable[lavalink.AudioTrack] = ()) -> None:
+        super().__init__(tracks)
+        self.version = 0
+        self.total_duration = sum(_track_duration(track) for track in self)
+
+    def _changed(self) -> None:
+        self.version += 1
+
+    def _recount(self) -> None:
+        self.total_duration = sum(_track_duration(track) for track in self)
+        self._changed()
+
+    def append(self, track: lavalink.AudioTrack) -> None:
+        super().append(track)
+        self.total_duration += _track_duration(track)
+        self._changed()
+
+    def insert(self, index: SupportsIndex, track: lavalink.AudioTrack) -> None:
+        super().insert(index, track)
+        self.total_duration += _track_duration(track)
+        self._changed()
+
+    def extend(self, tracks: Iterable[lavalink.AudioTrack]) -> None:
+        tracks = list(tracks)
+        super().extend(tracks)
+        self.total_duration += sum(_track_duration(track) for track in tracks)
+        self._changed()
+
+    def __iadd__(self, tracks: Iterable[lavalink.AudioTrack]):
+        self.extend(tracks)
+        return self
+
+    def pop(self, index: SupportsIndex = -1) -> lavalink.AudioTrack:
+        track = super().pop(index)
+        self.total_duration -= _track_duration(track)
+        self._changed()
+        return track
+
+    def remove(self, track: lavalink.AudioTrack) -> None:
+        super().remove(track)
+        self.total_duration -= _track_duration(track)
+        self._changed()
+
+    def clear(self) -> None:
+        super().clear()
+        self.total_duration = 0
+        self._changed()
+
+    # Slice assignment, deletion and reordering are rare enough that recounting is simpler than tracking them
+    def __setitem__(self, index, value) -> None:
+        super().__setitem__(index, value)
+        self._recount()
+
+    def __delitem__(self, index) -> None:
+        super().__delitem__(index)
+        self._recount()
+
+    def sort(self, *args, **kwargs) -> None:
+        super().sort(*args, **kwargs)
+        self._changed()
+
+    def reverse(self) -> None:
+        super().reverse()
+        self._changed()
+
+
+class ChocobotPlayer(lavalink.DefaultPlayer):
+    """
+    DefaultPlayer with a TrackedQueue, a cache of rendered queue pages, activity tracking for the idle reaper, a
+    debounced filter chain, the name of the station it's listening to, if any, and timing of the gap between tracks
+    """
+
+    TITLE_LENGTH_LIMIT = 80
+
+    def __init__(self, guild_id: int, node: lavalink.Node) -> None:
+        super().__init__(guild_id, node)
+        self.queue: TrackedQueue = TrackedQueue()
+
+        self._page_cache_key: Optional[tuple] = None
+        self._page_cache: Dict[tuple[int, int], str] = {}
+
+        self.last_active: float = time.monotonic()
+        self.paused_since: Optional[float] = None
+
+        self.filter_chain = FilterChain(self)
+        self.station: Optional[str] = None
+        # What set off the track change in progress and when, until the next track starts
+        self._transition: Optional[tuple[str, float]] = None
+
+    def touch(self) -> None:
+        """Marks the player as in use, holding off the idle reaper"""
+        self.last_active = time.monotonic()
+
+    async def set_pause(self, pause: bool) -> None:
+        await super().set_pause(pause)
+        if not pause:
+            self.paused_since = None
+        elif self.paused_since is None:
+            self.paused_since = time.monotonic()
+
+    async def skip(self) -> None:
+        self._transition = ("skip", time.perf_counter())
+        await super().skip()
+
+    async def stop(self) -> None:
+        # Nothing is coming next, so there's no gap to measure
+        self._transition = None
+        await super().stop()
+
+    async def handle_event(self, event: lavalink.Event) -> None:
+        if isinstance(event, lavalink.TrackStartEvent) and self._transition is not None:
+            trigger, started_at = self._transition
+            self._transition = None
+            metrics.TRACK_TRANSITION_LATENCY.observe(time.perf_counter() - started_at, trigger=trigger)
+        elif isinstance(event, lavalink.TrackEndEvent) and event.reason in (lavalink.EndReason.FINISHED, lavalink.EndReason.LOAD_FAILED):
+            self._transition = self._transition or ("track_end", time.perf_counter())
+
+        # A station decides what its listeners play next, so a listener never moves on to its own queue
+        if self.station is not None:
+            return
+
+        await super().handle_event(event)
+
+    def queue_summary(self) -> str:
+        return f"{len(self.queue)} tracks queued ({format_duration(self.queue.total_duration)})"
+
+    def page_count(self, page_size: int) -> int:
+        return max(1, -(-len(self.queue) // page_size))
+
+    def render_queue_page(self, page: int, page_size: int) -> str:
+        """Renders one page of the queue, only formatting the tracks on that page. Pages are cached until the queue changes."""
+        cache_key = (self.queue.version, id(self.current))
+        if cache_key != self._page_cache_key:
+            self._page_cache_key = cache_key
+            self._page_cache = {}
+
+        rendered_page = self._page_cache.get((page, page_size))
+        if rendered_page is None:
+            first_index = page * page_size
+            lines = [
+                f"{first_index + offset + 2}: {self._shorten(track.title)}"
+                for offset, track in enumerate(self.queue[first_index:first_index + page_size])
+            ]
+            rendered_page = self._page_cache[(page, page_size)] = "\n".join(lines)
+
+        return rendered_page
+
+    @classmethod
+    def _shorten(cls, title: str) -> str:
+        return title if len(title) <= cls.TITLE_LENGTH_LIMIT else f"{title[:cls.TITLE_LENGTH_LIMIT - 1]}…"
@@ -0,0 +1,303 @@
+"""
+Runs the bot as several processes, each owning a contiguous range of shards, under a supervisor that restarts any that
+crash or stop reporting.
+
+    python -u ./cluster.py
+
+Every guild lives on exactly one shard, so each process only ever sees its own guilds' events, players and commands.
+The guild archive moves to an SQLite database all clusters share (seeded once from the archive file), so a guild
+registered through one cluster is loaded by whichever cluster owns it after a restart or a reshard. The track history
+database is shared the same way. Queue snapshots and the metrics endpoint are per cluster, since the guilds they cover
+are. Each cluster reports its health to the supervisor, which logs a line per cluster every CLUSTER_HEALTH_LOG_INTERVAL.
+"""
+import asyncio
+import math
+import multiprocessing
+import os
+import queue
+import resource
+import signal
+import time
+from typing import Any, Dict, List, Optional
+
+import aiohttp
+from dotenv import load_dotenv
+
+from guild_archive_store import GuildArchiveStore, SqliteGuildArchiveStore
+
+load_dotenv()
+
+DISCORD_TOKEN = os.getenv("DISCORD_TOKEN")
+# Shards in total across every cluster. Unset, Discord's recommended count is used.
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", 0)) or None
+# Unset, one cluster per CPU core, but never more clusters than shards
+CLUSTER_COUNT = int(os.getenv("CLUSTER_COUNT", 0)) or None
+CLUSTER_HEALTH_INTERVAL = float(os.getenv("CLUSTER_HEALTH_INTERVAL", 10))
+CLUSTER_HEALTH_LOG_INTERVAL = float(os.getenv("CLUSTER_HEALTH_LOG_INTERVAL", 60))
+# A cluster that hasn't reported for this long is assumed hung and restarted. Startup gets longer, since a cluster only
+# starts reporting once it has logged in.
+CLUSTER_HEARTBEAT_TIMEOUT = float(os.getenv("CLUSTER_HEARTBEAT_TIMEOUT", 60))
+CLUSTER_STARTUP_TIMEOUT = float(os.getenv("CLUSTER_STARTUP_TIMEOUT", 300))
+# Restarts back off exponentially up to this many seconds. A cluster that stays up for CLUSTER_STABLE_AFTER is healthy
+# again and its next restart is immediate.
+CLUSTER_MAX_RESTART_DELAY = float(os.getenv("CLUSTER_MAX_RESTART_DELAY", 300))
+CLUSTER_STABLE_AFTER = float(os.getenv("CLUSTER_STABLE_AFTER", 600))
+GUILD_ARCHIVE_PATH = os.getenv("GUILD_ARCHIVE_PATH", "guild_archive.json")
+GUILD_ARCHIVE_DB = os.getenv("GUILD_ARCHIVE_DB", "guild_archive.db")
+QUEUE_SNAPSHOT_PATH = os.getenv("QUEUE_SNAPSHOT_PATH", "queue_snapshot.json")
+# Discord allows `max_concurrency` shards to identify every 5 seconds, across every process using the token
+IDENTIFY_WINDOW = 5.0
+
+GATEWAY_BOT_URL = "https://discord.com/api/v10/gateway/bot"
+
+
+def shard_ranges(shard_count: int, cluster_count: int) -> List[List[int]]:
+    """Splits shards 0..shard_count-1 into `cluster_count` contiguous ranges whose sizes differ by at most one"""
+    base, extra = divmod(shard_count, cluster_count)
+    ranges = []
+    start = 0
+    for cluster_id in range(cluster_count):
+        size = base + (1 if cluster_id < extra else 0)
+        ranges.append(list(range(start, start + size)))
+        start += size
+
+    return ranges
+
+
+async def fetch_gateway_limits(token: str) -> tuple[int, int]:
+    """Discord's recommended shard count for the bot, and how many shards may identify at once"""
+    async with aiohttp.ClientSession() as session:
+        async with session.get(GATEWAY_BOT_URL, headers={"Authorization": f"Bot {token}"}) as response:
+            response.raise_for_status()
+            gateway = await response.json()
+
+    return gateway["shards"], gateway["session_start_limit"]["max_concurrency"]
+
+
+class ClusterHealthReporter():
+    """
+    Sent into each cluster process to report its health to the supervisor every `interval` seconds: guild count, each
+    shard's gateway latency, Lavalink players, event loop lag and peak resident memory. The reports double as the
+    heartbeat the supervisor uses to spot a hung cluster.
+    """
+
+    def __init__(self, cluster_id: int, health_queue: multiprocessing.Queue, interval: float = CLUSTER_HEALTH_INTERVAL) -> None:
+        self.cluster_id = cluster_id
+        self.health_queue = health_queue
+        self.interval = interval
+
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self, bot) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(bot))
+
+    async def _run(self, bot) -> None:
+        loop_lag = 0.0
+        while True:
+            self.health_queue.put(self.report(bot, loop_lag))
+
+            # How late the loop wakes up from a sleep is how long every other handler is waiting for it too
+            started_at = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            loop_lag = max(0.0, time.perf_counter() - started_at - self.interval)
+
+    def report(self, bot, loop_lag: float) -> Dict[str, Any]:
+        lavalink_client = getattr(bot, "lavalink", None)
+
+        return {
+            "cluster_id": self.cluster_id,
+            "pid": os.getpid(),
+            "guilds": len(bot.guilds),
+            "latencies": {shard_id: latency for shard_id, latency in getattr(bot, "latencies", [])},
+            "players": len(lavalink_client.player_manager.players) if lavalink_client is not None else 0,
+            "loop_lag": loop_lag,
+            # Kilobytes on Linux
+            "peak_rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+        }
+
+
+def _run_cluster(cluster_id: int, shard_ids: List[int], shard_count: int, health_queue: multiprocessing.Queue) -> None:
+    # main reads its configuration when it's imported, so the cluster's settings go into the environment first
+    os.environ["CLUSTER_ID"] = str(cluster_id)
+    os.environ["CLUSTER_SHARD_IDS"] = ",".join(str(shard_id) for shard_id in shard_ids)
+    os.environ["SHARD_COUNT"] = str(shard_count)
+    os.environ["GUILD_ARCHIVE_BACKEND"] = "sqlite"
+    os.environ["GUILD_ARCHIVE_DB"] = GUILD_ARCHIVE_DB
+    os.environ["QUEUE_SNAPSHOT_PATH"] = f"{QUEUE_SNAPSHOT_PATH}.cluster{cluster_id}"
+    if os.getenv("METRICS_PORT"):
+        os.environ["METRICS_PORT"] = str(int(os.environ["METRICS_PORT"]) + cluster_id)
+
+    import main
+    main.run(ClusterHealthReporter(cluster_id, health_queue))
+
+
+class ClusterProcess():
+    def __init__(self, cluster_id: int, shard_ids: List[int]) -> None:
+        self.cluster_id = cluster_id
+        self.shard_ids = shard_ids
+
+        self.process: Optional[multiprocessing.Process] = None
+        self.started_at = 0.0
+        self.restart_at: Optional[float] = None
+        self.failures = 0
+        self.restarts = 0
+        self.last_report: Optional[Dict[str, Any]] = None
+        self.last_report_at: Optional[float] = None
+
+    @property
+    def shard_label(self) -> str:
+        return f"{self.shard_ids[0]}-{self.shard_ids[-1]}" if len(self.shard_ids) > 1 else str(self.shard_ids[0])
+
+
+class ClusterSupervisor():
+    """
+    Starts one process per shard range and keeps them running.
+
+    A cluster that exits, or stops reporting its health for `heartbeat_timeout` seconds, is restarted after a delay
+    that doubles with each consecutive failure, so one that crashes on startup doesn't hammer Discord with logins.
+    Clusters are started `start_stagger` seconds apart so their shards don't all identify in the same window.
+    SIGTERM and SIGINT stop every cluster before the supervisor exits.
+    """
+
+    def __init__(self, shard_count: int, cluster_count: int, start_stagger: float = 0.0,
+                 heartbeat_timeout: float = CLUSTER_HEARTBEAT_TIMEOUT, startup_timeout: float = CLUSTER_STARTUP_TIMEOUT,
+                 health_log_interval: float = CLUSTER_HEALTH_LOG_INTERVAL) -> None:
+        self.shard_count = shard_count
+        self.start_stagger = start_stagger
+        self.heartbeat_timeout = heartbeat_timeout
+        self.startup_timeout = startup_timeout
+        self.health_log_interval = health_log_interval
+
+        # Spawned rather than forked, so each cluster builds its own bot and event loop from a clean interpreter
+        self._context = multiprocessing.get_context("spawn")
+        self._health_queue = self._context.Queue()
+        self.clusters = [ClusterProcess(cluster_id, shard_ids) for cluster_id, shard_ids in enumerate(shard_ranges(shard_count, cluster_count))]
+        self._stopping = False
+
+    def run(self) -> None:
+        signal.signal(signal.SIGTERM, self._request_stop)
+        signal.signal(signal.SIGINT, self._request_stop)
+
+        for cluster in self.clusters:
+            if self._stopping:
+                break
+            self._start(cluster)
+            time.sleep(self.start_stagger)
+
+        last_logged_at = time.monotonic()
+        while not self._stopping:
+            self._collect_reports(timeout=1.0)
+            self._check_clusters()
+
+            if time.monotonic() - last_logged_at >= self.health_log_interval:
+                self._log_health()
+                last_logged_at = time.monotonic()
+
+        self._stop_all()
+
+    def _request_stop(self, *_) -> None:
+        self._stopping = True
+
+    def _start(self, cluster: ClusterProcess) -> None:
+        cluster.process = self._context.Process(
+            target=_run_cluster, args=(cluster.cluster_id, cluster.shard_ids, self.shard_count, self._health_queue),
+            name=f"chocobot-cluster-{cluster.cluster_id}",
+        )
+        cluster.process.start()
+        cluster.started_at = time.monotonic()
+        cluster.restart_at = None
+        cluster.last_report_at = None
+        print(f"[CHOCOBOT] Started cluster {cluster.cluster_id} (shards {cluster.shard_label}, pid {cluster.process.pid})")
+
+    def _collect_reports(self, timeout: float) -> None:
+        try:
+            report = self._health_queue.get(timeout=timeout)
+            while True:
+                cluster = self.clusters[report["cluster_id"]]
+                # A report queued by a cluster's previous process says nothing about the one replacing it
+                if cluster.process is not None and report["pid"] == cluster.process.pid:
+                    cluster.last_report = report
+                    cluster.last_report_at = time.monotonic()
+                report = self._health_queue.get_nowait()
+        except queue.Empty:
+            pass
+
+    def _check_clusters(self) -> None:
+        now = time.monotonic()
+
+        for cluster in self.clusters:
+            if cluster.restart_at is not None:
+                if now >= cluster.restart_at:
+                    cluster.restarts += 1
+                    self._start(cluster)
+                continue
+
+            if cluster.process.is_alive():
+                last_seen = cluster.last_report_at
+                is_hung = now - cluster.started_at > self.startup_timeout if last_seen is None else (
+                    now - last_seen > self.heartbeat_timeout
+                )
+                if not is_hung:
+                    continue
+
+                print(f"[CHOCOBOT] Cluster {cluster.cluster_id} stopped reporting, killing pid {cluster.process.pid}")
+                cluster.process.kill()
+                cluster.process.join()
+
+            self._schedule_restart(cluster, now)
+
+    def _schedule_restart(self, cluster: ClusterProcess, now: float) -> None:
+        if now - cluster.started_at >= CLUSTER_STABLE_AFTER:
+            cluster.failures = 0
+
+        delay = 0.0 if cluster.failures == 0 else min(CLUSTER_MAX_RESTART_DELAY, 5 * 2 ** (cluster.failures - 1))
+        cluster.failures += 1
+        cluster.restart_at = now + delay
+        print(f"[CHOCOBOT] Cluster {cluster.cluster_id} exited with code {cluster.process.exitcode}, restarting in {delay:.0f}s")
+
+    def _log_health(self) -> None:
+        for cluster in self.clusters:
+            report = cluster.last_report
+            if report is None:
+                print(f"[CHOCOBOT] Cluster {cluster.cluster_id} (shards {cluster.shard_label}): no report yet, {cluster.restarts} restarts")
+                continue
+
+            latencies = [latency for latency in report["latencies"].values() if math.isfinite(latency)]
+            worst_latency = f"{max(latencies) * 1000:.0f}ms" if latencies else "n/a"
+            print(
+                f"[CHOCOBOT] Cluster {cluster.cluster_id} (shards {cluster.shard_label}): {report['guilds']} guilds, "
+                f"{report['players']} players, worst shard latency {worst_latency}, loop lag {report['loop_lag'] * 1000:.0f}ms, "
+                f"peak RSS {report['peak_rss'] / 2**20:.0f}MiB, {cluster.restarts} restarts"
+            )
+
+    def _stop_all(self) -> None:
+        print("[CHOCOBOT] Stopping clusters")
+        running = [cluster.process for cluster in self.clusters if cluster.process is not None and cluster.process.is_alive()]
+        for process in running:
+            process.terminate()
+        for process in running:
+            process.join(timeout=30)
+            if process.is_alive():
+                process.kill()
+
+
+def main() -> None:
+    shard_count, max_concurrency = asyncio.run(fetch_gateway_limits(DISCORD_TOKEN))
+    shard_count = SHARD_COUNT or shard_count
+    cluster_count = min(CLUSTER_COUNT or os.cpu_count() or 1, shard_count)
+
+    # Runs once before any cluster starts, so no cluster ever loads a half-seeded archive
+    imported = asyncio.run(SqliteGuildArchiveStore(GUILD_ARCHIVE_DB).import_from(GuildArchiveStore(GUILD_ARCHIVE_PATH)))
+    if imported:
+        print(f"[CHOCOBOT] Imported {imported} guild archive entries into {GUILD_ARCHIVE_DB}")
+
+    shards_per_cluster = math.ceil(shard_count / cluster_count)
+    start_stagger = math.ceil(shards_per_cluster / max_concurrency) * IDENTIFY_WINDOW
+    print(f"[CHOCOBOT] Running {shard_count} shards across {cluster_count} clusters")
+
+    ClusterSupervisor(shard_count, cluster_count, start_stagger=start_stagger).run()
+
+
+if __name__ == "__main__":
+    main()
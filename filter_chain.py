@@ -0,0 +1,111 @@
+import asyncio
+import os
+from typing import Any, Dict, Optional, Type
+
+import lavalink
+from lavalink.filters import Equalizer, Filter, LowPass, Timescale, Vibrato
+
+import metrics
+
+FILTER_DEBOUNCE = float(os.getenv("FILTER_DEBOUNCE", 0.5))
+
+FILTER_TYPES: Dict[str, Type[Filter]] = {
+    "equalizer": Equalizer,
+    "lowpass": LowPass,
+    "timescale": Timescale,
+    "vibrato": Vibrato,
+}
+
+# Each preset maps filter names to the values passed to that filter's update()
+FILTER_PRESETS: Dict[str, Dict[str, Dict[str, Any]]] = {
+    "off": {},
+    "bassboost": {
+        "equalizer": {"bands": [(0, 0.25), (1, 0.2), (2, 0.15), (3, 0.1)]},
+    },
+    "nightcore": {
+        "timescale": {"speed": 1.2, "pitch": 1.25},
+        "equalizer": {"bands": [(12, 0.1), (13, 0.15), (14, 0.15)]},
+    },
+    "vaporwave": {
+        "timescale": {"speed": 0.85, "pitch": 0.8},
+        "equalizer": {"bands": [(0, 0.3), (1, 0.3)]},
+        "lowpass": {"smoothing": 5.0},
+    },
+    "underwater": {
+        "lowpass": {"smoothing": 40.0},
+        "vibrato": {"frequency": 2.0, "depth": 0.4},
+    },
+    "radio": {
+        "equalizer": {"bands": [(0, -0.25), (1, -0.25), (2, -0.2), (12, -0.2), (13, -0.25), (14, -0.25)]},
+        "vibrato": {"frequency": 0.5, "depth": 0.05},
+    },
+}
+
+
+def build_filter(name: str, **values: Any) -> Filter:
+    _filter = FILTER_TYPES[name]()
+    _filter.update(**values)
+    return _filter
+
+
+class FilterChain():
+    """
+    A guild's combined filter state. Changes are collected for `debounce` seconds and then sent to Lavalink as one
+    player update holding every filter. If the combined result is what the node already has, nothing is sent at all.
+    """
+
+    def __init__(self, player: lavalink.BasePlayer, debounce: float = FILTER_DEBOUNCE) -> None:
+        self.player = player
+        self.debounce = debounce
+
+        self._desired: Dict[str, Filter] = {}
+        # What the node was last sent, in the serialized form Lavalink receives
+        self._applied: Dict[str, Any] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+        self._send_lock = asyncio.Lock()
+
+    @property
+    def active(self) -> list[str]:
+        return sorted(self._desired)
+
+    async def set(self, name: str, **values: Any) -> None:
+        """Adds or replaces one filter, keeping the rest of the chain"""
+        self._desired[name] = build_filter(name, **values)
+        await self._schedule_flush()
+
+    async def remove(self, name: str) -> None:
+        self._desired.pop(name, None)
+        await self._schedule_flush()
+
+    async def apply_preset(self, preset: str) -> None:
+        """Replaces the whole chain with a preset's filters"""
+        self._desired = {name: build_filter(name, **values) for name, values in FILTER_PRESETS[preset].items()}
+        await self._schedule_flush()
+
+    async def _schedule_flush(self) -> None:
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_after_window())
+
+        # Every change in the window waits on the same update, so callers still see any error it raises
+        await asyncio.shield(self._flush_task)
+
+    async def _flush_after_window(self) -> None:
+        await asyncio.sleep(self.debounce)
+        # Changes from here on belong to the next window, since this one is about to read the desired state
+        self._flush_task = None
+
+        async with self._send_lock:
+            desired_filters = list(self._desired.values())
+            desired_state = {key: value for _filter in desired_filters for key, value in _filter.serialize().items()}
+
+            if desired_state == self._applied:
+                metrics.FILTER_UPDATES.inc(result="skipped")
+                return
+
+            if desired_filters:
+                await self.player.set_filters(*desired_filters, replace=True)
+            else:
+                await self.player.clear_filters()
+
+            self._applied = desired_state
+            metrics.FILTER_UPDATES.inc(result="sent")
@@ -0,0 +1,62 @@
+import os
+from typing import Any, Dict
+
+import discord
+
+LOW_MEMORY_MODE = os.getenv("LOW_MEMORY_MODE", "false").lower() in ("1", "true", "yes")
+# Prefix commands are a compatibility layer over the slash commands. Without them the bot doesn't need messages at all.
+PREFIX_COMMANDS = os.getenv("PREFIX_COMMANDS", "true").lower() in ("1", "true", "yes")
+# Set by cluster.py for each process it runs. Without them the bot runs unsharded in a single process.
+CLUSTER_ID = int(os.getenv("CLUSTER_ID")) if os.getenv("CLUSTER_ID") else None
+CLUSTER_SHARD_IDS = [int(shard_id) for shard_id in os.getenv("CLUSTER_SHARD_IDS", "").split(",") if shard_id]
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", 0)) or None
+
+
+def low_memory_intents(prefix_commands: bool = PREFIX_COMMANDS) -> discord.Intents:
+    """
+    Only what the bot uses: guilds (channels and roles), voice states, and guild messages with their content for
+    prefix commands. Members stays on so the roles of the members in voice are kept up to date, but no one else is
+    cached for it.
+    """
+    intents = discord.Intents.none()
+    intents.guilds = True
+    intents.voice_states = True
+    intents.guild_messages = prefix_commands
+    intents.message_content = prefix_commands
+    intents.members = True
+
+    return intents
+
+
+def gateway_options(low_memory: bool = LOW_MEMORY_MODE, prefix_commands: bool = PREFIX_COMMANDS) -> Dict[str, Any]:
+    """
+    The gateway-related keyword arguments for the bot.
+
+    In low-memory mode only voice-connected members are cached, guilds aren't chunked at startup and the message
+    cache is off, so resident memory follows how many people are in voice rather than the total member count.
+    With prefix commands off, message events aren't subscribed to in either mode, so Discord never sends them.
+    """
+    if not low_memory:
+        intents = discord.Intents.all()
+        if not prefix_commands:
+            intents.messages = False
+            intents.message_content = False
+        return {"intents": intents}
+
+    member_cache_flags = discord.MemberCacheFlags.none()
+    member_cache_flags.voice = True
+
+    return {
+        "intents": low_memory_intents(prefix_commands),
+        "member_cache_flags": member_cache_flags,
+        "chunk_guilds_at_startup": False,
+        "max_messages": None,
+    }
+
+
+def shard_options() -> Dict[str, Any]:
+    """The shards this process owns when it's one cluster of several, for AutoShardedBot"""
+    if not CLUSTER_SHARD_IDS:
+        return {}
+
+    return {"shard_ids": CLUSTER_SHARD_IDS, "shard_count": SHARD_COUNT}
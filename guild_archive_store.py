@@ -0,0 +1,236 @@
+import asyncio
+import json
+import os
+import sqlite3
+from typing import Any, Dict, List, Optional, Union
+
+import jsonpickle
+
+ArchiveKey = Union[int, str]
+
+
+class GuildArchiveStore():
+    """
+    Persists guild archive entries as an append-only journal of per-guild changes on top of a snapshot file.
+
+    Each change appends a single line to the journal, so a write costs the same no matter how many guilds are registered.
+    Every `compact_every` changes the journal is folded into a fresh snapshot, written to a temporary file and swapped in
+    with an atomic rename so a crash can never leave a half-written archive behind. All disk I/O runs in a worker thread.
+    """
+
+    def __init__(self, snapshot_path: str, compact_every: int = 100) -> None:
+        self.snapshot_path = snapshot_path
+        self.journal_path = f"{snapshot_path}.journal"
+        self.compact_every = compact_every
+
+        self._entries: Dict[ArchiveKey, Dict[str, Any]] = {}
+        self._journal_length = 0
+        self._lock = asyncio.Lock()
+
+    @staticmethod
+    def _key(entry: Dict[str, Any]) -> ArchiveKey:
+        # Entries from the old name-based archive have no id to key on until they're migrated
+        guild_id: Optional[int] = entry.get("guild_id")
+        return guild_id if guild_id is not None else f"name:{entry.get('name')}"
+
+    async def load(self) -> List[Dict[str, Any]]:
+        """Reads the snapshot and replays the journal on top of it, returning the current list of archive entries"""
+        async with self._lock:
+            self._entries, self._journal_length, is_torn = await asyncio.to_thread(self._read)
+            # Appending after a torn line would glue the next change onto it, so fold everything into a clean snapshot first
+            if is_torn:
+                await self._compact()
+
+        return list(self._entries.values())
+
+    async def put(self, entry: Dict[str, Any]) -> None:
+        await self._append({"op": "put", "entry": entry})
+
+    async def delete(self, guild_id: int) -> None:
+        await self._append({"op": "delete", "guild_id": guild_id})
+
+    async def rewrite(self, entries: List[Dict[str, Any]]) -> None:
+        """Replaces the whole archive with `entries` and compacts immediately"""
+        async with self._lock:
+            self._entries = {self._key(entry): entry for entry in entries}
+            await self._compact()
+
+    async def compact(self) -> None:
+        async with self._lock:
+            await self._compact()
+
+    async def _append(self, change: Dict[str, Any]) -> None:
+        async with self._lock:
+            self._apply(self._entries, change)
+            await asyncio.to_thread(self._append_line, json.dumps(change))
+            self._journal_length += 1
+
+            if self._journal_length >= self.compact_every:
+                await self._compact()
+
+    async def _compact(self) -> None:
+        await asyncio.to_thread(self._write_snapshot, list(self._entries.values()))
+        self._journal_length = 0
+
+    @classmethod
+    def _apply(cls, entries: Dict[ArchiveKey, Dict[str, Any]], change: Dict[str, Any]) -> None:
+        if change["op"] == "put":
+            entry = change["entry"]
+            entries[cls._key(entry)] = entry
+            # A migrated entry supersedes the name-keyed legacy entry for the same guild
+            entries.pop(f"name:{entry.get('name')}", None)
+        elif change["op"] == "delete":
+            entries.pop(change["guild_id"], None)
+
+    def _read(self) -> tuple[Dict[ArchiveKey, Dict[str, Any]], int, bool]:
+        entries: Dict[ArchiveKey, Dict[str, Any]] = {}
+
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path) as snapshot_file:
+                snapshot = jsonpickle.decode(snapshot_file.read() or "[]")
+            # The example archive ships as an empty object rather than an empty list
+            for entry in snapshot if isinstance(snapshot, list) else []:
+                entries[self._key(entry)] = entry
+
+        journal_length = 0
+        is_torn = False
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path) as journal_file:
+                for line in journal_file:
+                    # Only the final line can be torn by a crash mid-append, and that change never completed
+                    try:
+                        if not line.endswith("\n"):
+                            raise ValueError("Incomplete journal line")
+                        change = json.loads(line)
+                    except ValueError:
+                        is_torn = True
+                        break
+                    self._apply(entries, change)
+                    journal_length += 1
+
+        return entries, journal_length, is_torn
+
+    def _append_line(self, line: str) -> None:
+        with open(self.journal_path, "a") as journal_file:
+            journal_file.write(line + "\n")
+            journal_file.flush()
+            os.fsync(journal_file.fileno())
+
+    def _write_snapshot(self, entries: List[Dict[str, Any]]) -> None:
+        temporary_path = f"{self.snapshot_path}.tmp"
+
+        with open(temporary_path, "w") as snapshot_file:
+            snapshot_file.write(jsonpickle.encode(entries, include_properties=True))
+            snapshot_file.flush()
+            os.fsync(snapshot_file.fileno())
+
+        os.replace(temporary_path, self.snapshot_path)
+        # Once the snapshot is in place the journal's changes are all contained in it
+        with open(self.journal_path, "w"):
+            pass
+
+
+class SqliteGuildArchiveStore():
+    """
+    The same archive kept in an SQLite database, for when several cluster processes share one archive.
+
+    Every change is its own transaction and the database is in WAL mode, so any process can read while another writes
+    and a `register` in one cluster is in the archive every other cluster loads. Nothing is cached in memory, since
+    other processes can change the archive at any time, and there's no journal to compact. All database work runs in a
+    worker thread.
+    """
+
+    SCHEMA = "CREATE TABLE IF NOT EXISTS guild_archive (archive_key TEXT PRIMARY KEY, entry TEXT NOT NULL)"
+
+    def __init__(self, path: str, busy_timeout: float = 30.0) -> None:
+        self.path = path
+        self.busy_timeout = busy_timeout
+
+        self._connection: Optional[sqlite3.Connection] = None
+        self._lock = asyncio.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            # Writers in other processes hold the database briefly, so waiting on them beats failing with "locked"
+            connection = sqlite3.connect(self.path, timeout=self.busy_timeout, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(self.SCHEMA)
+            self._connection = connection
+
+        return self._connection
+
+    def close(self) -> None:
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    async def load(self) -> List[Dict[str, Any]]:
+        return await self._run(self._load)
+
+    async def put(self, entry: Dict[str, Any]) -> None:
+        await self._run(self._put, entry)
+
+    async def delete(self, guild_id: int) -> None:
+        await self._run(self._delete, guild_id)
+
+    async def rewrite(self, entries: List[Dict[str, Any]]) -> None:
+        """Replaces the whole archive with `entries`, including every other cluster's entries"""
+        await self._run(self._rewrite, entries)
+
+    async def compact(self) -> None:
+        # Each change is written in place, so there's never a journal to fold
+        pass
+
+    async def import_from(self, store: GuildArchiveStore) -> int:
+        """Seeds the database with a file-based archive's entries the first time it's called, returning how many were copied"""
+        entries = await store.load()
+        return await self._run(self._import, entries)
+
+    async def _run(self, func, *args):
+        async with self._lock:
+            return await asyncio.to_thread(func, *args)
+
+    def _load(self) -> List[Dict[str, Any]]:
+        rows = self._connect().execute("SELECT entry FROM guild_archive").fetchall()
+        return [json.loads(entry) for (entry,) in rows]
+
+    def _put(self, entry: Dict[str, Any]) -> None:
+        connection = self._connect()
+        with connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO guild_archive (archive_key, entry) VALUES (?, ?)",
+                (str(GuildArchiveStore._key(entry)), json.dumps(entry)),
+            )
+            # A migrated entry supersedes the name-keyed legacy entry for the same guild
+            connection.execute("DELETE FROM guild_archive WHERE archive_key = ?", (f"name:{entry.get('name')}",))
+
+    def _delete(self, guild_id: int) -> None:
+        connection = self._connect()
+        with connection:
+            connection.execute("DELETE FROM guild_archive WHERE archive_key = ?", (str(guild_id),))
+
+    def _rewrite(self, entries: List[Dict[str, Any]]) -> None:
+        connection = self._connect()
+        with connection:
+            connection.execute("DELETE FROM guild_archive")
+            connection.executemany(
+                "INSERT OR REPLACE INTO guild_archive (archive_key, entry) VALUES (?, ?)",
+                [(str(GuildArchiveStore._key(entry)), json.dumps(entry)) for entry in entries],
+            )
+
+    def _import(self, entries: List[Dict[str, Any]]) -> int:
+        connection = self._connect()
+        with connection:
+            # The database is only ever seeded once, so restarting the cluster never resurrects entries that were
+            # deleted after the import
+            (imported,) = connection.execute("PRAGMA user_version").fetchone()
+            if imported:
+                return 0
+
+            connection.executemany(
+                "INSERT OR IGNORE INTO guild_archive (archive_key, entry) VALUES (?, ?)",
+                [(str(GuildArchiveStore._key(entry)), json.dumps(entry)) for entry in entries],
+            )
+            connection.execute("PRAGMA user_version = 1")
+
+        return len(entries)
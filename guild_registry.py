@@ -0,0 +1,48 @@
+from typing import Dict, Generic, Iterator, Optional, Protocol, TypeVar
+
+
+class RegistryRecord(Protocol):
+    """The minimal shape a record needs in order to be stored in a GuildRegistry"""
+    name: str
+
+    @property
+    def guild_id(self) -> int: ...
+
+
+RecordT = TypeVar("RecordT", bound=RegistryRecord)
+
+
+class GuildRegistry(Generic[RecordT]):
+    """
+    Holds one record per registered guild, indexed by guild id.
+    Every lookup is a dict access, so the cost stays flat no matter how many guilds are registered.
+    """
+
+    def __init__(self) -> None:
+        self._by_id: Dict[int, RecordT] = {}
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    def __iter__(self) -> Iterator[RecordT]:
+        return iter(list(self._by_id.values()))
+
+    def __contains__(self, guild_id: int) -> bool:
+        return guild_id in self._by_id
+
+    def add(self, record: RecordT) -> None:
+        """Adds a record, replacing any existing record for the same guild."""
+        self._by_id[record.guild_id] = record
+
+    def remove(self, guild_id: int) -> Optional[RecordT]:
+        return self._by_id.pop(guild_id, None)
+
+    def get(self, guild_id: int) -> Optional[RecordT]:
+        return self._by_id.get(guild_id)
+
+    def rename(self, guild_id: int, new_name: str) -> None:
+        """Keeps a registered guild's record in step when the guild is renamed."""
+        record = self._by_id.get(guild_id)
+
+        if record is not None:
+            record.name = new_name
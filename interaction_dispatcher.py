@@ -0,0 +1,120 @@
+import asyncio
+import os
+from typing import Any, Callable, Dict, NamedTuple, Optional, Tuple
+
+import discord
+from discord.ext import commands
+
+INTERACTION_TIMEOUT = float(os.getenv("INTERACTION_TIMEOUT", 60))
+
+ReplyKey = Tuple[int, int, int]
+# Turns a message into the value the waiting command wants, or None if the message isn't an answer
+ReplyParser = Callable[[discord.Message], Optional[Any]]
+
+
+class _Waiter(NamedTuple):
+    future: asyncio.Future
+    parse: ReplyParser
+
+
+class ChoiceView(discord.ui.View):
+    """
+    A view that resolves `choice` with the first value its author picks. Subclasses add the components and call
+    `choose` from their callbacks. Anyone other than the author is turned away.
+    """
+
+    def __init__(self, author_id: int, timeout: float = INTERACTION_TIMEOUT) -> None:
+        super().__init__(timeout=timeout)
+        self.author_id = author_id
+        self.choice: asyncio.Future = asyncio.get_running_loop().create_future()
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        if interaction.user.id != self.author_id:
+            await interaction.response.send_message("This menu belongs to someone else.", ephemeral=True)
+            return False
+
+        return True
+
+    async def choose(self, interaction: discord.Interaction, value: Any) -> None:
+        if not self.choice.done():
+            self.choice.set_result(value)
+
+        self.disable()
+        await interaction.response.edit_message(view=self)
+
+    def disable(self) -> None:
+        for item in self.children:
+            item.disabled = True
+        self.stop()
+
+    async def on_timeout(self) -> None:
+        if not self.choice.done():
+            self.choice.set_result(None)
+
+
+class InteractionDispatcher():
+    """
+    Routes chat replies to the command waiting on them.
+
+    Waiters are keyed by (guild, channel, author), so each message costs one dict lookup no matter how many commands
+    are waiting, and only the author of a command can answer it. A user has at most one pending prompt per channel:
+    starting a new one resolves the old one with None. Waiters that go unanswered expire after their timeout.
+    """
+
+    def __init__(self) -> None:
+        self._waiters: Dict[ReplyKey, _Waiter] = {}
+
+    def __len__(self) -> int:
+        return len(self._waiters)
+
+    @staticmethod
+    def _key(guild: discord.abc.Snowflake, channel: discord.abc.Snowflake, author: discord.abc.Snowflake) -> ReplyKey:
+        return guild.id, channel.id, author.id
+
+    def dispatch(self, message: discord.Message) -> bool:
+        """Hands the message to the command waiting on it. Returns True if the message was consumed as a reply."""
+        if message.guild is None:
+            return False
+
+        waiter = self._waiters.get(self._key(message.guild, message.channel, message.author))
+        if waiter is None or waiter.future.done():
+            return False
+
+        value = waiter.parse(message)
+        if value is None:
+            return False
+
+        waiter.future.set_result(value)
+        return True
+
+    async def wait_for_reply(self, ctx: commands.Context, parse: ReplyParser, timeout: float = INTERACTION_TIMEOUT,
+                             future: Optional[asyncio.Future] = None) -> Optional[Any]:
+        """
+        Waits for the command's author to send a message in the command's channel that `parse` accepts, and returns
+        the parsed value. Returns None if the wait times out or the author starts another prompt in the meantime.
+        `future` lets something else, like a ChoiceView, answer the same wait.
+        """
+        key = self._key(ctx.guild, ctx.channel, ctx.author)
+        superseded = self._waiters.get(key)
+        if superseded is not None and not superseded.future.done():
+            superseded.future.set_result(None)
+
+        waiter = self._waiters[key] = _Waiter(future or asyncio.get_running_loop().create_future(), parse)
+        try:
+            return await asyncio.wait_for(waiter.future, timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            if self._waiters.get(key) is waiter:
+                del self._waiters[key]
+
+    async def wait_for_choice(self, ctx: commands.Context, view: ChoiceView, parse: ReplyParser,
+                              timeout: float = INTERACTION_TIMEOUT) -> Optional[Any]:
+        """Waits for the author to pick from `view` or to type a reply `parse` accepts, whichever comes first"""
+        try:
+            return await self.wait_for_reply(ctx, parse, timeout, future=view.choice)
+        finally:
+            view.disable()
+
+
+interaction_dispatcher = InteractionDispatcher()
@@ -0,0 +1,193 @@
+"""
+Lavalink node pool bootstrap shared by the Music cog and LavalinkVoiceClient.
+
+Nodes are read from LAVALINK_NODES, a JSON list such as:
+    [{"host": "lavalink-1", "port": 2333, "password": "...", "region": "us", "name": "us-1"},
+     {"host": "lavalink-2", "port": 2333, "password": "...", "region": "eu", "name": "eu-1", "ssl": false}]
+When it isn't set, the single LAVALINK_SERVER_HOST/PORT/PASSWORD node is used instead.
+
+Lavalink.py already places new players on the available node with the lowest penalty (playing players, CPU load and
+frame deficit/null frames from the node's live stats) and moves players off a node that disconnects. The monitor here
+covers the remaining case, a node that is still connected but degraded, by moving players to a healthier node.
+"""
+import asyncio
+import json
+import logging
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+import discord
+import lavalink
+from dotenv import load_dotenv
+from chocobot_player import ChocobotPlayer
+
+load_dotenv()
+
+LAVALINK_SERVER_PASSWORD = os.getenv("LAVALINK_SERVER_PASSWORD")
+LAVALINK_SERVER_PORT = os.getenv("LAVALINK_SERVER_PORT")
+LAVALINK_SERVER_HOST = os.getenv("LAVALINK_SERVER_HOST")
+LAVALINK_NODES = os.getenv("LAVALINK_NODES")
+# Optional JSON object of region -> voice endpoint prefixes, e.g. {"us": ["us-", "atlanta"], "eu": ["rotterdam"]}
+LAVALINK_REGIONS = os.getenv("LAVALINK_REGIONS")
+NODE_MONITOR_INTERVAL = float(os.getenv("NODE_MONITOR_INTERVAL", 30))
+NODE_DEGRADED_PENALTY = float(os.getenv("NODE_DEGRADED_PENALTY", 500))
+NODE_MAX_MIGRATIONS = int(os.getenv("NODE_MAX_MIGRATIONS", 10))
+
+
+def load_node_configs() -> List[Dict[str, Any]]:
+    if LAVALINK_NODES:
+        return json.loads(LAVALINK_NODES)
+
+    return [{
+        "host": LAVALINK_SERVER_HOST,
+        "port": LAVALINK_SERVER_PORT,
+        "password": LAVALINK_SERVER_PASSWORD,
+        "region": "us",
+        "name": "default-node",
+    }]
+
+
+def load_regions() -> Optional[Dict[str, Tuple[str]]]:
+    if not LAVALINK_REGIONS:
+        return None
+
+    return {region: tuple(endpoints) for region, endpoints in json.loads(LAVALINK_REGIONS).items()}
+
+
+def ensure_lavalink_client(client: discord.Client, node_configs: Optional[List[Dict[str, Any]]] = None) -> lavalink.Client:
+    """Creates the bot's Lavalink client and node pool the first time it's needed, and returns the existing one after that"""
+    if hasattr(client, 'lavalink'):
+        return client.lavalink
+
+    client.lavalink = lavalink.Client(client.user.id, player=ChocobotPlayer, regions=load_regions(), connect_back=True)
+
+    for index, node_config in enumerate(node_configs if node_configs is not None else load_node_configs()):
+        client.lavalink.add_node(
+            host=node_config["host"],
+            port=int(node_config["port"]),
+            password=node_config["password"],
+            region=node_config.get("region", "us"),
+            name=node_config.get("name", f"node-{index}"),
+            ssl=node_config.get("ssl", False),
+        )
+
+    return client.lavalink
+
+
+def describe_nodes(lavalink_client: lavalink.Client) -> List[Dict[str, Any]]:
+    """Every node's name, region, availability, player count and penalty, as reported in the node metrics"""
+    return [
+        {
+            "name": node.name,
+            "region": node.region,
+            "available": node.available,
+            "players": len(node.players),
+            "penalty": node.penalty,
+        }
+        for node in lavalink_client.node_manager
+    ]
+
+
+class NodeHealthMonitor():
+    """
+    Periodically moves players off connected nodes whose penalty has climbed past `degraded_penalty`.
+    A move only happens when another node is at most half as loaded, so players don't bounce between two busy nodes.
+
+    Penalties come from stats reported about once a minute, so within a pass each node's penalty is estimated from its
+    last report plus the players moved on or off it since, with its CPU load scaled by its playing player count. That
+    spreads one pass's moves across the healthy nodes instead of sending them all to whichever looked best first.
+    """
+
+    def __init__(
+        self,
+        lavalink_client: lavalink.Client,
+        interval: float = NODE_MONITOR_INTERVAL,
+        degraded_penalty: float = NODE_DEGRADED_PENALTY,
+        max_migrations: int = NODE_MAX_MIGRATIONS,
+    ) -> None:
+        self.lavalink = lavalink_client
+        self.interval = interval
+        self.degraded_penalty = degraded_penalty
+        self.max_migrations = max_migrations
+
+        self.migrations = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.rebalance()
+            except Exception as err:
+                logging.exception(
+                    f"""
+                    [CHOCOBOT] There was an error at NodeHealthMonitor.rebalance...
+                    {err}
+                    """
+                )
+
+    @staticmethod
+    def estimated_penalty(node: lavalink.Node, added_players: int = 0, load_per_player: float = 0.0) -> float:
+        """
+        `node`'s penalty once `added_players` more players (or fewer, if negative) are playing on it. Its CPU load is
+        scaled by its own load per playing player, or by `load_per_player` if it has none playing to go by.
+        """
+        stats = node.stats
+        if not added_players or not node.available or stats.is_fake:
+            return node.penalty + added_players
+
+        if stats.playing_players:
+            load_per_player = stats.system_load / stats.playing_players
+        system_load = max(0.0, stats.system_load + added_players * load_per_player)
+        cpu_penalty = 1.05 ** (100 * system_load) * 10 - 10
+
+        return node.penalty - stats.penalty.cpu_penalty + cpu_penalty + added_players
+
+    def _candidates(self, node: lavalink.Node) -> List[lavalink.Node]:
+        # The same preference find_ideal_node has: the node's own region first, then anywhere
+        others = [other for other in self.lavalink.node_manager.available_nodes if other is not node]
+        return [other for other in others if other.region == node.region] or others
+
+    async def rebalance(self) -> int:
+        """Moves up to `max_migrations` players off degraded nodes, returning how many were moved"""
+        moved = 0
+        # node -> players moved onto it (or off it, if negative) in this pass
+        added: Dict[lavalink.Node, int] = {}
+
+        for node in self.lavalink.node_manager.available_nodes:
+            if node.penalty < self.degraded_penalty:
+                continue
+
+            # What a player costs on this node, for targets that have no playing players to estimate from
+            load_per_player = node.stats.system_load / node.stats.playing_players if node.stats.playing_players else 0.0
+
+            for player in node.players:
+                if moved >= self.max_migrations:
+                    return moved
+
+                candidates = self._candidates(node)
+                if not candidates:
+                    break
+
+                target = min(candidates, key=lambda other: self.estimated_penalty(other, added.get(other, 0) + 1, load_per_player))
+                if self.estimated_penalty(target, added.get(target, 0) + 1, load_per_player) * 2 > (
+                    self.estimated_penalty(node, added.get(node, 0), load_per_player)
+                ):
+                    break
+
+                await player.change_node(target)
+                added[target] = added.get(target, 0) + 1
+                added[node] = added.get(node, 0) - 1
+                moved += 1
+                self.migrations += 1
+
+        return moved
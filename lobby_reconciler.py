@@ -0,0 +1,106 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Iterable, Optional
+
+import discord
+
+
+def format_lobby_join_message(members: list[discord.Member], in_lobby_role: discord.Role) -> str:
+    mentions = [member.mention for member in members]
+    joined_names = mentions[0] if len(mentions) == 1 else f"{', '.join(mentions[:-1])} and {mentions[-1]}"
+    verb = "has" if len(mentions) == 1 else "have"
+
+    return f"{joined_names} {verb} joined the lobby! {in_lobby_role.mention}"
+
+
+class LobbyReconciler():
+    """
+    Keeps a guild's lobby role in step with who is in voice, batching role edits instead of making one call per event.
+
+    Voice state changes are collected for `window` seconds, then each member's latest state is compared against whether
+    they currently hold the role. Members who joined and left (or left and rejoined) inside the window need no edit at all.
+    Everyone added in a batch is announced together.
+    """
+
+    def __init__(
+        self,
+        guild: discord.Guild,
+        in_lobby_role: discord.Role,
+        announce_joins: Callable[[list[discord.Member]], Awaitable[None]],
+        is_eligible: Callable[[discord.Member], bool] = lambda _: True,
+        window: float = 2.0,
+    ) -> None:
+        self.guild = guild
+        self.in_lobby_role = in_lobby_role
+        self.announce_joins = announce_joins
+        self.is_eligible = is_eligible
+        self.window = window
+
+        self._pending: Dict[int, tuple[discord.Member, bool]] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+
+    def observe(self, member: discord.Member, in_voice: bool) -> None:
+        """Records a member's latest voice presence. Only the last state seen inside a window is acted on."""
+        if not self.is_eligible(member):
+            return
+
+        self._pending[member.id] = (member, in_voice)
+
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_after_window())
+
+    async def _flush_after_window(self) -> None:
+        # observe() won't start another flush while this one is running, so whatever arrived during the role edits
+        # gets a window of its own here
+        while self._pending:
+            await asyncio.sleep(self.window)
+            pending, self._pending = self._pending, {}
+
+            await self._apply(pending.values())
+
+    async def reconcile_all(self) -> None:
+        """Diffs every voice-connected member against the role's holders and fixes any drift in one pass"""
+        in_voice: Dict[int, discord.Member] = {
+            member.id: member
+            for channel in self.guild.voice_channels + self.guild.stage_channels
+            for member in channel.members
+            if self.is_eligible(member)
+        }
+        role_holders = self._role_holders()
+
+        desired_states = [(member, True) for member_id, member in in_voice.items() if member_id not in role_holders]
+        desired_states += [(member, False) for member_id, member in role_holders.items() if member_id not in in_voice]
+
+        # Members who were already in voice before startup aren't news, so drift fixes are applied silently
+        await self._apply(desired_states, announce=False)
+
+    def _role_holders(self) -> Dict[int, discord.Member]:
+        # With a partial member cache (low-memory mode) role.members only sees the members in voice, so a holder who left
+        # voice while the bot was offline keeps the role until they next join voice and leave it again. Fetching every
+        # member to find them would cost a full REST scan of each guild on startup, which is what the partial cache avoids.
+        return {member.id: member for member in self.in_lobby_role.members}
+
+    async def _apply(self, desired_states: Iterable[tuple[discord.Member, bool]], announce: bool = True) -> None:
+        joined: list[discord.Member] = []
+
+        for member, in_voice in desired_states:
+            has_role = member.get_role(self.in_lobby_role.id) is not None
+            if in_voice == has_role:
+                continue
+
+            try:
+                if in_voice:
+                    await member.add_roles(self.in_lobby_role)
+                    joined.append(member)
+                else:
+                    await member.remove_roles(self.in_lobby_role)
+            except discord.HTTPException as err:
+                logging.exception(
+                    f"""
+                    [CHOCOBOT] There was an error at LobbyReconciler._apply ({self.guild.name})...
+                    {err}
+                    """
+                )
+
+        if announce and joined:
+            await self.announce_joins(joined)
@@ -0,0 +1,296 @@
+import asyncio
+import io
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from typing import Deque, Dict, Optional, Tuple
+
+import discord
+from discord import app_commands
+from discord.ext import commands
+
+import metrics
+
+# Loop callbacks that run longer than this are recorded as stalls while detection is on
+LOOP_STALL_THRESHOLD_MS = float(os.getenv("LOOP_STALL_THRESHOLD_MS", 100))
+# Turns stall detection on at startup, rather than waiting for the owner to
+LOOP_STALL_DETECTION = os.getenv("LOOP_STALL_DETECTION", "false").lower() in ("1", "true", "yes")
+LOOP_STALL_HISTORY = 50
+LOOP_PROFILE_INTERVAL = float(os.getenv("LOOP_PROFILE_INTERVAL", 0.005))
+LOOP_PROFILE_MAX_SECONDS = float(os.getenv("LOOP_PROFILE_MAX_SECONDS", 60))
+REPORT_LENGTH = 15
+# Discord's message limit, less room for the code block around a report
+INLINE_REPORT_LIMIT = 1900
+
+Location = Tuple[str, int, str]
+
+# Frames inside asyncio and the profiler itself are the same for every stall and every sample, so they're left out of reports
+_ASYNCIO_DIRECTORY = os.path.dirname(asyncio.__file__)
+
+
+def _is_plumbing(code) -> bool:
+    return code.co_filename.startswith(_ASYNCIO_DIRECTORY) or code.co_filename == __file__
+
+
+def _format_location(location: Location) -> str:
+    filename, lineno, function = location
+    return f"{function} ({os.path.basename(filename)}:{lineno})"
+
+
+def describe_callback(handle: asyncio.Handle) -> Tuple[str, str]:
+    """
+    Names whatever a loop callback ran, and where it was when it gave the loop back. Task steps are named after the
+    task's coroutine, with the deepest coroutine of ours it's awaiting as the location, since that's the code that
+    just ran.
+    """
+    callback = handle._callback
+    task = getattr(callback, "__self__", None)
+    if not isinstance(task, asyncio.Task):
+        return getattr(callback, "__qualname__", repr(callback)), ""
+
+    coroutine = task.get_coro()
+    name = f"{getattr(coroutine, '__qualname__', repr(coroutine))} [{task.get_name()}]"
+
+    innermost = coroutine
+    while getattr(getattr(innermost, "cr_await", None), "cr_frame", None) is not None and not _is_plumbing(innermost.cr_await.cr_code):
+        innermost = innermost.cr_await
+
+    frame = getattr(innermost, "cr_frame", None)
+    if frame is None:
+        # The task finished in this step, so there's no suspended frame left to point at
+        code = getattr(innermost, "cr_code", None)
+        return name, _format_location((code.co_filename, code.co_firstlineno, code.co_name)) if code else ""
+
+    return name, _format_location((frame.f_code.co_filename, frame.f_lineno, frame.f_code.co_name))
+
+
+class StallStats():
+    def __init__(self) -> None:
+        self.count = 0
+        self.total = 0.0
+        self.worst = 0.0
+        self.location = ""
+
+    def add(self, duration: float, location: str) -> None:
+        self.count += 1
+        self.total += duration
+        if duration >= self.worst:
+            self.worst = duration
+            self.location = location
+
+
+class SlowCallbackDetector():
+    """
+    Times every callback the event loop runs and records the ones that take longer than `threshold` seconds, which is
+    how long every other handler was kept waiting.
+
+    Detection works by wrapping asyncio's Handle._run, which the loop calls for every callback and task step, and
+    unwrapping it again when detection is turned off, so it costs nothing at all while off and one clock read either
+    side of each callback while on. Stalls are totalled by culprit, and the most recent are kept in order.
+    """
+
+    def __init__(self, threshold: float = LOOP_STALL_THRESHOLD_MS / 1000, history: int = LOOP_STALL_HISTORY) -> None:
+        self.threshold = threshold
+        self.by_culprit: Dict[str, StallStats] = {}
+        self.recent: Deque[Tuple[float, float, str, str]] = deque(maxlen=history)
+
+        self._original_run = None
+
+    @property
+    def enabled(self) -> bool:
+        return self._original_run is not None
+
+    def enable(self, threshold: Optional[float] = None) -> None:
+        if threshold is not None:
+            self.threshold = threshold
+        if self.enabled:
+            return
+
+        original_run = self._original_run = asyncio.Handle._run
+        detector = self
+
+        def timed_run(handle: asyncio.Handle) -> None:
+            started_at = time.perf_counter()
+            original_run(handle)
+            duration = time.perf_counter() - started_at
+            if duration >= detector.threshold:
+                detector.record(handle, duration)
+
+        asyncio.Handle._run = timed_run
+
+    def disable(self) -> None:
+        if self._original_run is not None:
+            asyncio.Handle._run = self._original_run
+            self._original_run = None
+
+    def reset(self) -> None:
+        self.by_culprit.clear()
+        self.recent.clear()
+
+    def record(self, handle: asyncio.Handle, duration: float) -> None:
+        culprit, location = describe_callback(handle)
+        self.by_culprit.setdefault(culprit, StallStats()).add(duration, location)
+        self.recent.append((time.time(), duration, culprit, location))
+        metrics.LOOP_STALLS.inc()
+
+    def report(self, limit: int = REPORT_LENGTH) -> str:
+        state = f"on, threshold {self.threshold * 1000:.0f}ms" if self.enabled else "off"
+        lines = [f"Slow callback detection is {state}. {sum(stats.count for stats in self.by_culprit.values())} stalls recorded."]
+
+        worst_first = sorted(self.by_culprit.items(), key=lambda item: item[1].total, reverse=True)[:limit]
+        if worst_first:
+            lines += ["", "Top offenders by total time stalled:"]
+            for culprit, stats in worst_first:
+                lines.append(
+                    f"{stats.total * 1000:8.0f}ms total {stats.count:5}x  worst {stats.worst * 1000:6.0f}ms  {culprit}"
+                    + (f" at {stats.location}" if stats.location else "")
+                )
+
+        if self.recent:
+            lines += ["", "Most recent stalls:"]
+            for recorded_at, duration, culprit, location in list(self.recent)[-limit:]:
+                lines.append(f"{time.strftime('%H:%M:%S', time.localtime(recorded_at))} {duration * 1000:6.0f}ms  {culprit}"
+                             + (f" at {location}" if location else ""))
+
+        return "\n".join(lines)
+
+
+class SamplingProfiler():
+    """
+    Profiles the live process for a fixed time by sampling the event loop thread's stack from another thread every
+    `interval` seconds. Nothing is instrumented, so the loop runs at full speed while it's being profiled.
+
+    Samples taken while the loop is waiting for I/O are counted as idle. The rest are attributed to the function at
+    the top of the stack (self time) and to every function on the stack (total time).
+    """
+
+    def __init__(self, interval: float = LOOP_PROFILE_INTERVAL) -> None:
+        self.interval = interval
+        self._lock = asyncio.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._lock.locked()
+
+    async def profile(self, seconds: float) -> str:
+        async with self._lock:
+            loop_thread_id = threading.get_ident()
+            started_at = time.perf_counter()
+            samples, idle, self_counts, total_counts = await asyncio.to_thread(self._sample, loop_thread_id, seconds)
+
+            return self._report(time.perf_counter() - started_at, samples, idle, self_counts, total_counts)
+
+    def _sample(self, thread_id: int, seconds: float) -> Tuple[int, int, Counter, Counter]:
+        samples = idle = 0
+        self_counts: Counter = Counter()
+        total_counts: Counter = Counter()
+        deadline = time.perf_counter() + seconds
+
+        while time.perf_counter() < deadline:
+            frame = sys._current_frames().get(thread_id)
+            if frame is not None:
+                samples += 1
+                leaf: Location = (frame.f_code.co_filename, frame.f_lineno, frame.f_code.co_name)
+                # The loop blocks in the selector whenever there's nothing to run
+                if frame.f_code.co_name in ("select", "poll", "epoll") and os.path.basename(frame.f_code.co_filename) == "selectors.py":
+                    idle += 1
+                else:
+                    self_counts[leaf] += 1
+                    on_stack = set()
+                    while frame is not None:
+                        if not _is_plumbing(frame.f_code) and frame.f_code.co_name != "<module>":
+                            on_stack.add((frame.f_code.co_filename, frame.f_code.co_firstlineno, frame.f_code.co_name))
+                        frame = frame.f_back
+                    total_counts.update(on_stack)
+
+            time.sleep(self.interval)
+
+        return samples, idle, self_counts, total_counts
+
+    @staticmethod
+    def _report(elapsed: float, samples: int, idle: int, self_counts: Counter, total_counts: Counter, limit: int = REPORT_LENGTH) -> str:
+        if not samples:
+            return "No samples were taken."
+
+        def share(count: int) -> str:
+            return f"{count / samples * 100:5.1f}%"
+
+        lines = [f"{samples} samples over {elapsed:.1f}s. The loop was idle for {share(idle)} of them.", "", "Top functions by self time:"]
+        lines += [f"{share(count)}  {_format_location(location)}" for location, count in self_counts.most_common(limit)]
+        lines += ["", "Top functions by total time:"]
+        lines += [f"{share(count)}  {_format_location(location)}" for location, count in total_counts.most_common(limit)]
+
+        return "\n".join(lines)
+
+
+class LoopProfiler(commands.Cog):
+    """Owner-only tools for finding what's blocking the event loop"""
+
+    def __init__(self, bot: commands.Bot, detector: Optional[SlowCallbackDetector] = None, profiler: Optional[SamplingProfiler] = None) -> None:
+        self.bot = bot
+        self.detector = detector or SlowCallbackDetector()
+        self.profiler = profiler or SamplingProfiler()
+
+    async def cog_load(self) -> None:
+        if LOOP_STALL_DETECTION:
+            self.detector.enable()
+
+    async def cog_unload(self) -> None:
+        self.detector.disable()
+
+    async def cog_check(self, ctx: commands.Context) -> bool:
+        if not await self.bot.is_owner(ctx.author):
+            raise commands.NotOwner("Only the bot's owner can use the profiler.")
+        return True
+
+    async def cog_before_invoke(self, ctx: commands.Context) -> None:
+        # Profiles take longer than the three seconds a slash command has to be acknowledged in
+        await ctx.defer()
+
+    async def cog_command_error(self, ctx: commands.Context, error: commands.CommandError) -> None:
+        if isinstance(error, commands.NotOwner):
+            await ctx.send(str(error))
+
+    async def send_report(self, ctx: commands.Context, title: str, report: str, filename: str) -> None:
+        if len(report) <= INLINE_REPORT_LIMIT:
+            await ctx.send(f"**{title}**\n```\n{report}\n```")
+        else:
+            await ctx.send(f"**{title}**", file=discord.File(io.BytesIO(report.encode()), filename=filename))
+
+    @commands.hybrid_group(name='profiler', invoke_without_command=True, fallback='stalls')
+    @app_commands.default_permissions(administrator=True)
+    async def profiler(self, ctx: commands.Context) -> None:
+        """ Reports the slowest event loop callbacks recorded so far. """
+        await self.send_report(ctx, "Event loop stalls", self.detector.report(), "loop_stalls.txt")
+
+    @profiler.command(name='on')
+    @app_commands.describe(threshold_ms="Callbacks slower than this many milliseconds are recorded")
+    async def profiler_on(self, ctx: commands.Context, threshold_ms: float = LOOP_STALL_THRESHOLD_MS) -> None:
+        """ Turns on slow callback detection. """
+        self.detector.enable(max(1.0, threshold_ms) / 1000)
+        await ctx.send(f"Recording event loop callbacks slower than {self.detector.threshold * 1000:.0f}ms.")
+
+    @profiler.command(name='off')
+    async def profiler_off(self, ctx: commands.Context) -> None:
+        """ Turns off slow callback detection. What was recorded is kept until it's reset. """
+        self.detector.disable()
+        await ctx.send("Slow callback detection is off.")
+
+    @profiler.command(name='reset')
+    async def profiler_reset(self, ctx: commands.Context) -> None:
+        """ Forgets every stall recorded so far. """
+        self.detector.reset()
+        await ctx.send("Cleared the recorded stalls.")
+
+    @profiler.command(name='sample')
+    @app_commands.describe(seconds="How long to profile for")
+    async def profiler_sample(self, ctx: commands.Context, seconds: float = 10.0) -> None:
+        """ Samples what the event loop spends its time on for a few seconds and reports the top functions. """
+        if self.profiler.running:
+            return await ctx.send("A profile is already running.")
+
+        seconds = max(1.0, min(seconds, LOOP_PROFILE_MAX_SECONDS))
+        report = await self.profiler.profile(seconds)
+        await self.send_report(ctx, f"Event loop profile ({seconds:.0f}s)", report, "loop_profile.txt")
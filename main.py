@@ -1,27 +1,52 @@
+# Imported first so the startup timeline's first phase covers every other import
+from startup_timeline import startup_timeline
 from music import Music
+from guild_registry import GuildRegistry
+from guild_archive_store import GuildArchiveStore, SqliteGuildArchiveStore
+from lobby_reconciler import LobbyReconciler, format_lobby_join_message
+from outbound_scheduler import ScheduledContext, outbound
+from interaction_dispatcher import ChoiceView, interaction_dispatcher
+from loop_profiler import LoopProfiler
+from gateway_config import CLUSTER_ID, CLUSTER_SHARD_IDS, LOW_MEMORY_MODE, PREFIX_COMMANDS, gateway_options, shard_options
+import metrics
 from functools import wraps
+import asyncio
 import logging
-from typing import Callable, Coroutine, Dict
+import time
+from typing import Callable, Coroutine, Dict, Optional
 import discord
+from discord import app_commands
 from discord.ext import commands
 import os
 from dotenv import load_dotenv
-import jsonpickle
-import yt_dlp
 
 load_dotenv()
 
 DISCORD_TOKEN = os.getenv("DISCORD_TOKEN")
 COMMAND_PREFIX = os.getenv("COMMAND_PREFIX")
-VISIBLE_QUEUE_LENGTH = os.getenv("VISIBLE_QUEUE_LENGTH")
-# Setting the intents. These should match the intents on the Discord Developer Portal
-intents = discord.Intents.all()
+VISIBLE_QUEUE_LENGTH = int(os.getenv("VISIBLE_QUEUE_LENGTH", 10))
+GUILD_ARCHIVE_PATH = os.getenv("GUILD_ARCHIVE_PATH", "guild_archive.json")
+HYDRATION_CONCURRENCY = int(os.getenv("HYDRATION_CONCURRENCY", 16))
+GUILD_ARCHIVE_COMPACT_EVERY = int(os.getenv("GUILD_ARCHIVE_COMPACT_EVERY", 100))
+# "json" for the journaled archive file, or "sqlite" for a database several cluster processes can share
+GUILD_ARCHIVE_BACKEND = os.getenv("GUILD_ARCHIVE_BACKEND", "json")
+GUILD_ARCHIVE_DB = os.getenv("GUILD_ARCHIVE_DB", "guild_archive.db")
+IN_LOBBY_ROLE_NAME = "In Server Lobby"
+LOBBY_RECONCILE_WINDOW = float(os.getenv("LOBBY_RECONCILE_WINDOW", 2))
+# Pushes the slash command definitions to Discord on startup. Only needed when commands have been added or changed.
+SYNC_APP_COMMANDS = os.getenv("SYNC_APP_COMMANDS", "true").lower() in ("1", "true", "yes")
+
+def _is_lobby_eligible(member: discord.Member) -> bool:
+    return not discord.utils.get(member.roles, name = "Chocobot")
     
 class ChocobotGuildRecord():
     """A set of environmental variables storing state specific to each guild the bot is connected to"""
     class GuildArchiveDataEntry(Dict):
         name: str
+        guild_id: int
         bot_command_channel: str
+        bot_command_channel_id: int
+        in_lobby_role_id: int
 
     def __init__(self, guild: discord.Guild, bot_command_channel: discord.abc.GuildChannel, in_lobby_role: discord.Role) -> None:
         self.name: str = guild.name
@@ -29,48 +54,97 @@ class ChocobotGuildRecord():
         self.bot_command_channel: discord.abc.GuildChannel = bot_command_channel
         # self.song_queue: RadioQueue = RadioQueue(send_message=self._send_message)
         self.in_lobby_role: discord.Role = in_lobby_role
+        self.lobby_reconciler: LobbyReconciler = LobbyReconciler(
+            guild, in_lobby_role, self._announce_lobby_joins, is_eligible=_is_lobby_eligible, window=LOBBY_RECONCILE_WINDOW
+        )
+
+    @property
+    def guild_id(self) -> int:
+        return self.guild.id
     
     def to_archive_format(self) -> GuildArchiveDataEntry:
         return {
             "name": self.name,
-            "bot_command_channel": self.bot_command_channel.name
+            "guild_id": self.guild.id,
+            "bot_command_channel": self.bot_command_channel.name,
+            "bot_command_channel_id": self.bot_command_channel.id,
+            "in_lobby_role_id": self.in_lobby_role.id
         }
+
+    @staticmethod
+    def is_legacy_archive_entry(guild_archive_data: GuildArchiveDataEntry) -> bool:
+        """Entries written before the archive stored ids only carry guild and channel names"""
+        return any(guild_archive_data.get(key) is None for key in ("guild_id", "bot_command_channel_id", "in_lobby_role_id"))
+    
+    async def archive(self) -> None:
+        """Persists this record's archive entry without rewriting the rest of the archive"""
+        await guild_archive_store.put(self.to_archive_format())
     
     async def _send_message(self, msg: str) -> None:
-        await self.guild.get_channel(self.bot_command_channel.id).send(msg)
+        outbound.submit(self.guild.get_channel(self.bot_command_channel.id), content=msg)
+
+    async def _announce_lobby_joins(self, members: list[discord.Member]) -> None:
+        # Joins announced while an earlier announcement is still waiting to go out are folded into it
+        outbound.submit_batched(
+            self.guild.get_channel(self.bot_command_channel.id), members, render=self._render_lobby_joins,
+            merge_key=("lobby_join", self.guild.id),
+        )
+
+    def _render_lobby_joins(self, members: list[discord.Member]) -> Dict[str, str]:
+        unique_members = list({member.id: member for member in members}.values())
+        return {"content": format_lobby_join_message(unique_members, self.in_lobby_role)}
 
     @classmethod
     async def from_archive_format(cls, guild_archive_data: GuildArchiveDataEntry):
-        guild: discord.Guild = discord.utils.get(bot.guilds, name=guild_archive_data.get("name"))
-        bot_command_channel: discord.abc.GuildChannel = discord.utils.get(guild.channels, name=guild_archive_data.get("bot_command_channel"))
-        guild_record = await ChocobotGuildRecord.generate_record(guild, bot_command_channel)
+        # Ids are direct cache lookups. Names are only used to migrate entries from the old name-based archive.
+        guild_id: Optional[int] = guild_archive_data.get("guild_id")
+        guild: Optional[discord.Guild] = bot.get_guild(guild_id) if guild_id is not None else (
+            discord.utils.get(bot.guilds, name=guild_archive_data.get("name"))
+        )
+        if guild is None:
+            return None
+
+        bot_command_channel_id: Optional[int] = guild_archive_data.get("bot_command_channel_id")
+        bot_command_channel: discord.abc.GuildChannel = guild.get_channel(bot_command_channel_id) if bot_command_channel_id is not None else (
+            discord.utils.get(guild.channels, name=guild_archive_data.get("bot_command_channel"))
+        )
+        # A deleted channel leaves nowhere to announce to or archive by, so the guild needs registering again
+        if bot_command_channel is None:
+            print(f"[CHOCOBOT] Skipped the archive entry for {guild.name}: its bot command channel no longer exists")
+            return None
+
+        guild_record = await ChocobotGuildRecord.generate_record(guild, bot_command_channel, guild_archive_data.get("in_lobby_role_id"))
 
         return guild_record
     
     @classmethod
-    async def generate_record(cls, guild: discord.Guild, bot_command_channel: discord.ChannelType):
-        fetched_in_lobby_role = discord.utils.get(guild.roles, name="In Server Lobby")
+    async def generate_record(cls, guild: discord.Guild, bot_command_channel: discord.ChannelType, in_lobby_role_id: Optional[int] = None):
+        fetched_in_lobby_role = guild.get_role(in_lobby_role_id) if in_lobby_role_id is not None else None
+        if fetched_in_lobby_role is None:
+            fetched_in_lobby_role = discord.utils.get(guild.roles, name=IN_LOBBY_ROLE_NAME)
         in_lobby_role = fetched_in_lobby_role if fetched_in_lobby_role is not None else (
-            await guild.create_role(name="In Server Lobby", hoist=True, mentionable=True, color=discord.Color.green())
+            await guild.create_role(name=IN_LOBBY_ROLE_NAME, hoist=True, mentionable=True, color=discord.Color.green())
         )
 
         return ChocobotGuildRecord(guild=guild, bot_command_channel=bot_command_channel, in_lobby_role=in_lobby_role)
 
     @classmethod
     def get_matching_guild_record(cls, target_guild: discord.Guild):
-        return next((guild_record for guild_record in guild_registry if guild_record.guild.id == target_guild.id), None)
+        return guild_registry.get(target_guild.id)
 
-def bot_command_with_registry(name: str, help: str) -> Callable:
+def bot_command_with_registry(name: str, brief: str, help: str) -> Callable:
     def decorator(func: Coroutine):
         @wraps(func)
-        @bot.command(name=name, help=help)
-        async def inner(ctx, *args, **kwargs):
+        @bot.hybrid_command(name=name, brief=brief, help=help)
+        async def inner(ctx: commands.Context) -> None:
+            # Acknowledges slash commands before any role changes go out
+            await ctx.defer()
             guild_record = ChocobotGuildRecord.get_matching_guild_record(ctx.guild)
 
             if guild_record is not None:
-                await func(ctx, guild_record, *args, **kwargs)
+                await func(ctx, guild_record)
             else:
-                await ctx.send("This command requires that you first register your guild. It'll only take a few seconds! Just use the !register command to get set up!")
+                await ctx.send("This command requires that you first register your guild. It'll only take a few seconds! Just use the /register command to get set up!")
 
         return inner
     return decorator
@@ -78,45 +152,124 @@ def bot_command_with_registry(name: str, help: str) -> Callable:
 def bot_event_with_registry(func: Coroutine) -> Callable:
     @wraps(func)
     async def inner(member: discord.Member, before: discord.VoiceState, after: discord.VoiceState, *args, **kwargs) -> None:
-        guild_record = ChocobotGuildRecord.get_matching_guild_record(member.guild)
+        with metrics.EVENT_LATENCY.time(event=func.__name__):
+            guild_record = ChocobotGuildRecord.get_matching_guild_record(member.guild)
 
-        if guild_record is not None:
-            await func(member, before, after, guild_record, *args, **kwargs)
+            if guild_record is not None:
+                await func(member, before, after, guild_record, *args, **kwargs)
 
     # The function needs to maintain its name for the listener to be called correctly
     inner.__name__ = func.__name__
 
     return bot.event(inner) 
 
-guild_registry: list[ChocobotGuildRecord] = []
-
-bot = commands.Bot(command_prefix = COMMAND_PREFIX, intents = intents)
-
-# ytdl configuration
-yt_dlp.utils.bug_reports_message = lambda: 'There was an error!'
-ytdl_format_options = {
-    'format': 'bestaudio/best',
-    'outtmpl': '%(extractor)s-%(id)s-%(title)s.%(ext)s',
-    'restrictfilenames': True,
-    'noplaylist': False,
-    'nocheckcertificate': True,
-    'ignoreerrors': False,
-    'logtostderr': True,
-    'quiet': True,
-    'no_warnings': True,
-    'default_search': 'auto',
-    'source_address': '0.0.0.0',  # bind to ipv4 since ipv6 addresses cause issues sometimes
-    'force-ipv4': True,
-    'cachedir': False,
-    'nokeepfragments': True
-}
-
-ffmpeg_options = {
-    'options': '-vn'
-}
-
-# Initializing our ytdl client
-ytdl = yt_dlp.YoutubeDL(ytdl_format_options)
+guild_registry: GuildRegistry[ChocobotGuildRecord] = GuildRegistry()
+guild_archive_store = SqliteGuildArchiveStore(GUILD_ARCHIVE_DB) if GUILD_ARCHIVE_BACKEND == "sqlite" else (
+    GuildArchiveStore(GUILD_ARCHIVE_PATH, compact_every=GUILD_ARCHIVE_COMPACT_EVERY)
+)
+
+class ChocobotCommandTree(app_commands.CommandTree):
+    async def _call(self, interaction: discord.Interaction) -> None:
+        # Slash commands don't go through Bot.invoke, so they're timed here. Autocomplete requests aren't commands.
+        if interaction.type is not discord.InteractionType.application_command:
+            return await super()._call(interaction)
+
+        started_at = time.perf_counter()
+        try:
+            await super()._call(interaction)
+        finally:
+            if interaction.command is not None:
+                command_name = interaction.command.qualified_name
+                metrics.COMMAND_LATENCY.observe(time.perf_counter() - started_at, command=command_name)
+                if interaction.command_failed:
+                    metrics.COMMAND_ERRORS.inc(command=command_name)
+
+# One process of a cluster owns a range of shards. On its own, the bot runs unsharded.
+class ChocobotBot(commands.AutoShardedBot if CLUSTER_SHARD_IDS else commands.Bot):
+    health_reporter = None
+    # Set by the first on_ready, so the one-off startup work isn't repeated after a gateway reconnect
+    ready_handled = False
+
+    async def invoke(self, ctx: commands.Context, /) -> None:
+        # Timing here covers every command, including checks, before-invoke hooks and error handlers
+        if ctx.command is None:
+            return await super().invoke(ctx)
+
+        with metrics.COMMAND_LATENCY.time(command=ctx.command.qualified_name):
+            await super().invoke(ctx)
+
+        if ctx.command_failed:
+            metrics.COMMAND_ERRORS.inc(command=ctx.command.qualified_name)
+
+    async def get_context(self, origin, /, *, cls=ScheduledContext):
+        return await super().get_context(origin, cls=cls)
+
+    async def on_message(self, message: discord.Message, /) -> None:
+        # Replies to a pending prompt are answers, not commands
+        if interaction_dispatcher.dispatch(message):
+            return
+
+        if PREFIX_COMMANDS:
+            await self.process_commands(message)
+
+    async def setup_hook(self) -> None:
+        # Runs once, after login and before connecting to the gateway, so the cog and its Lavalink client are only
+        # ever created once however many times the gateway reconnects
+        startup_timeline.mark("login")
+
+        if metrics.METRICS_PORT:
+            await metrics_server.start()
+
+        await self.add_cog(Music(self, visible_queue_length=VISIBLE_QUEUE_LENGTH))
+        await self.add_cog(LoopProfiler(self))
+        startup_timeline.mark("cog load")
+
+        # Every cluster registers the same global commands, so one sync is enough
+        if SYNC_APP_COMMANDS and not CLUSTER_ID:
+            await self.tree.sync()
+            startup_timeline.mark("slash command sync")
+
+        if self.health_reporter is not None:
+            self.health_reporter.start(self)
+
+    async def close(self) -> None:
+        # Removing the cogs takes their gauges out of the registry, and the metrics port is released last
+        await super().close()
+        await metrics_server.stop()
+
+bot = ChocobotBot(
+    command_prefix = COMMAND_PREFIX or commands.when_mentioned,
+    tree_cls = ChocobotCommandTree,
+    # Every command works on a guild's player or registry, so none of them are offered in DMs
+    allowed_contexts = app_commands.AppCommandContext(guild=True),
+    # The intents should match the ones enabled on the Discord Developer Portal. LOW_MEMORY_MODE narrows them and
+    # limits the member cache to voice-connected members (see gateway_config.py).
+    **gateway_options(LOW_MEMORY_MODE),
+    **shard_options(),
+)
+metrics_server = metrics.MetricsServer()
+
+metrics.registry.register(metrics.Gauge(
+    "chocobot_registered_guilds", "Guilds in the guild registry", callback=lambda: len(guild_registry)
+))
+metrics.registry.register(metrics.Gauge(
+    "chocobot_gateway_latency_seconds", "Discord gateway heartbeat latency", callback=lambda: bot.latency
+))
+metrics.registry.register(metrics.Gauge(
+    "chocobot_shard_latency_seconds", "Discord gateway heartbeat latency of each shard this process owns", ("shard",),
+    callback=lambda: {(str(shard_id),): latency for shard_id, latency in getattr(bot, "latencies", [])}
+))
+metrics.registry.register(metrics.Gauge(
+    "chocobot_startup_phase_seconds", "Time taken by each startup phase", ("phase",),
+    callback=lambda: {(phase,): duration for phase, duration in startup_timeline.phases.items()}
+))
+metrics.registry.register(metrics.Gauge(
+    "chocobot_pending_replies", "Prompts waiting on a reply from their command's author", callback=lambda: len(interaction_dispatcher)
+))
+metrics.registry.register(metrics.Gauge(
+    "chocobot_outbound_pending", "Outbound messages waiting to be sent, by priority", ("priority",),
+    callback=lambda: {(priority,): count for priority, count in outbound.stats().items()}
+))
 
 def _log_error(err: Exception, tag: str = None):
     logging.exception(
@@ -126,55 +279,118 @@ def _log_error(err: Exception, tag: str = None):
         """
     )
 
+async def _hydrate_guild_registry(guild_archive: list[ChocobotGuildRecord.GuildArchiveDataEntry]) -> None:
+    """Rebuilds the guild registry from the archive, with at most HYDRATION_CONCURRENCY guilds in flight at once"""
+    hydration_slots = asyncio.Semaphore(HYDRATION_CONCURRENCY)
+
+    async def hydrate(archive_entry: ChocobotGuildRecord.GuildArchiveDataEntry) -> Optional[ChocobotGuildRecord]:
+        async with hydration_slots:
+            try:
+                guild_record = await ChocobotGuildRecord.from_archive_format(archive_entry)
+                # Old name-based entries are migrated one at a time, since the archive may also hold guilds that
+                # belong to other clusters
+                if guild_record is not None and ChocobotGuildRecord.is_legacy_archive_entry(archive_entry):
+                    await guild_record.archive()
+                    migrated.append(guild_record.guild_id)
+                return guild_record
+            except Exception as err:
+                _log_error(err, f"_hydrate_guild_registry ({archive_entry.get('name')})")
+                return None
+
+    migrated: list[int] = []
+
+    started_at = time.perf_counter()
+    _guild_registry: list[Optional[ChocobotGuildRecord]] = await asyncio.gather(*[
+        hydrate(archive_entry) for archive_entry in guild_archive
+    ])
+
+    hydrated = [guild_record for guild_record in _guild_registry if guild_record is not None]
+    for guild_record in hydrated:
+        guild_registry.add(guild_record)
+
+    elapsed = time.perf_counter() - started_at
+    skipped = len(_guild_registry) - len(hydrated)
+    print(f"[CHOCOBOT] Hydrated {len(hydrated)} guild records in {elapsed:.3f}s ({skipped} skipped, concurrency {HYDRATION_CONCURRENCY})")
+
+    if migrated:
+        print(f"[CHOCOBOT] Migrated {len(migrated)} guild archive entries to the id-based format")
+
 @bot.event
 async def on_ready():
-    await bot.add_cog(Music(bot))
+    # on_ready fires again after every gateway reconnect, but the registry only needs building once. The flag is set
+    # before anything is awaited, so a reconnect during hydration doesn't start it a second time.
+    if bot.ready_handled:
+        return
+    bot.ready_handled = True
+    startup_timeline.mark("gateway ready")
 
-    with open("guild_archive.json") as guild_archive_file:
-        guild_archive = jsonpickle.decode(guild_archive_file.read())
+    guild_archive = await guild_archive_store.load()
 
-        _guild_registry: list[ChocobotGuildRecord] = [
-            await ChocobotGuildRecord.from_archive_format(archive_entry) for archive_entry in guild_archive
-        ]
-        
-        for guild_record in _guild_registry:
-            guild_registry.append(guild_record) 
+    await _hydrate_guild_registry(guild_archive)
+    startup_timeline.mark("registry hydration")
+
+    music: Music = bot.get_cog("Music")
+    await asyncio.gather(
+        music.queue_snapshotter.restore(),
+        *[guild_record.lobby_reconciler.reconcile_all() for guild_record in guild_registry],
+    )
+    startup_timeline.mark("queue restore and lobby reconcile")
+    startup_timeline.finish()
+
+@bot.event
+async def on_guild_update(before: discord.Guild, after: discord.Guild) -> None:
+    if before.name != after.name and after.id in guild_registry:
+        guild_registry.rename(after.id, after.name)
+        await guild_registry.get(after.id).archive()
 
 @bot.event
 async def on_guild_join(guild: discord.Guild) -> None:
     print("guild.channels[0]: ", guild.channels[0])
-    await guild.channels[0].send("Hi! I'm Chocobot! To use most of the commands, you'll need to run '!register' first. To learn more about '!register', use '!help register'")
+    outbound.submit(guild.channels[0], content="Hi! I'm Chocobot! To use most of the commands, you'll need to run '/register' first.")
 
 @bot_event_with_registry
 async def on_voice_state_update(member: discord.Member, _, after: discord.VoiceState, guild_record: ChocobotGuildRecord) -> None:
-    is_in_lobby = member.get_role(guild_record.in_lobby_role.id) is not None
+    guild_record.lobby_reconciler.observe(member, after.channel is not None)
+
+class BotCommandChannelView(ChoiceView):
+    """A channel picker for register. Choosing a channel resolves to its id."""
 
-    if not discord.utils.get(member.roles, name = "Chocobot"):
-        if after.channel and not is_in_lobby:
-            await member.add_roles(guild_record.in_lobby_role)
-            await guild_record.bot_command_channel.send(f"{member.mention} has joined the lobby! {guild_record.in_lobby_role.mention}")
-        elif not after.channel and is_in_lobby:
-            await member.remove_roles(guild_record.in_lobby_role)
+    @discord.ui.select(cls=discord.ui.ChannelSelect, channel_types=[discord.ChannelType.text], placeholder="Bot commands channel")
+    async def select_channel(self, interaction: discord.Interaction, select: discord.ui.ChannelSelect) -> None:
+        await self.choose(interaction, select.values[0].id)
 
-@bot.command(name = 'register', help = 'Sets initial, permanent configurations for the bot specific to this server')
+@bot.hybrid_command(name = 'register', help = 'Sets initial, permanent configurations for the bot specific to this server')
 async def register(ctx: commands.Context) -> None:
-    REGISTER_TIMEOUT = 7000
-    if ctx.guild.name not in next((guild_record.name for guild_record in guild_registry), None):
-        channel_names: [str] = [channel.name for channel in ctx.guild.channels]
+    REGISTER_TIMEOUT = 300
+    await ctx.defer()
+    if ctx.guild.id not in guild_registry:
+        def parse_channel_name(msg: discord.Message) -> Optional[int]:
+            channel = discord.utils.get(ctx.guild.channels, name=msg.content)
+            return channel.id if channel is not None else None
+
+        view = BotCommandChannelView(ctx.author.id, timeout=REGISTER_TIMEOUT)
+        prompt = await ctx.send(
+            "Pick your preferred bot commands channel, or type its *specific* name, hyphens, etc... and all."
+            if PREFIX_COMMANDS else "Pick your preferred bot commands channel.",
+            view=view,
+        )
+        bot_command_channel_id: Optional[int] = await interaction_dispatcher.wait_for_choice(ctx, view, parse=parse_channel_name, timeout=REGISTER_TIMEOUT)
+        await prompt.edit(view=view)
 
-        await ctx.send("Please type the *specific* name of your preferred bot commands channel, hyphens, etc... and all.")
-        response: discord.Message = await bot.wait_for("message", check=lambda msg: msg.content in channel_names, timeout=REGISTER_TIMEOUT)
-        bot_command_channel = discord.utils.get(ctx.guild.channels, name=response.content)
+        if bot_command_channel_id is None:
+            await ctx.send("Registration timed out. Run the command again whenever you're ready.")
+            return
+
+        bot_command_channel = ctx.guild.get_channel(bot_command_channel_id)
         
         await ctx.send(f"Registration for {ctx.guild.name} is complete. Enjoy!")
-        guild_registry.append(await ChocobotGuildRecord.generate_record(bot_command_channel=bot_command_channel, guild=ctx.guild))
-        with open("guild_archive.json", "w") as guild_archive:
-            pickled_json_registry: str = jsonpickle.encode([guild_record.to_archive_format() for guild_record in guild_registry], include_properties=True)
-            guild_archive.write(pickled_json_registry)
+        guild_record = await ChocobotGuildRecord.generate_record(bot_command_channel=bot_command_channel, guild=ctx.guild)
+        guild_registry.add(guild_record)
+        await guild_record.archive()
     else:
         await ctx.send("This guild is already registered. If you need to re-register, contact whoever is running this bot.")
 
-@bot_command_with_registry(name = "join_lobby", help = """
+@bot_command_with_registry(name = "join_lobby", brief = "Join the server LFG lobby", help = """
              Join the server LFG 'lobby'. LFG lobbies are just a way to indicate to other folks that you're looking
              to join a call or play something without having to just sit in call. When somebody joins the lobby while you're
              in it, the bot will ping you to let you know.
@@ -194,7 +410,7 @@ async def join_lobby(ctx: commands.Context, guild_record: ChocobotGuildRecord) -
 async def on_join_lobby_error(_, err: Exception) -> None:
     _log_error(err, "_on_join_lobby_error")
 
-@bot_command_with_registry(name = "leave_lobby", help = """
+@bot_command_with_registry(name = "leave_lobby", brief = "Leave the server LFG lobby", help = """
             Leave the server LFG 'lobby'. LFG lobbies are just a way to indicate to other folks that you're looking
             to join a call or play something without having to just sit in call.
             """)
@@ -207,5 +423,11 @@ async def leave_lobby(ctx: commands.Context, guild_record: ChocobotGuildRecord)
 
     await ctx.author.remove_roles(guild_record.in_lobby_role)
 
+def run(health_reporter=None) -> None:
+    """Runs the bot until it's closed. cluster.py passes each cluster process a reporter for its health."""
+    startup_timeline.mark("imports")
+    bot.health_reporter = health_reporter
+    bot.run(DISCORD_TOKEN)
+
 if __name__ == "__main__":
-    bot.run(DISCORD_TOKEN)
\ No newline at end of file
+    run()
\ No newline at end of file
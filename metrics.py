@@ -0,0 +1,232 @@
+"""
+Minimal Prometheus-format metrics for the bot.
+
+Metrics are plain in-process counters, gauges and histograms. When METRICS_PORT is set, MetricsServer serves them as
+Prometheus text on http://METRICS_HOST:METRICS_PORT/metrics using the aiohttp server discord.py already depends on.
+"""
+import math
+import os
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+from aiohttp import web
+
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = os.getenv("METRICS_PORT")
+
+LabelValues = Tuple[str, ...]
+DEFAULT_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(labelnames: Sequence[str], labelvalues: LabelValues, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, labelvalues)]
+    if extra:
+        pairs.append(extra)
+
+    return f"{{{','.join(pairs)}}}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if math.isnan(value):
+        return "NaN"
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+
+    return repr(float(value))
+
+
+class _Metric():
+    type_name = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+
+    def _labelvalues(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self) -> Iterator[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type_name}", *self.samples()]
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()) -> None:
+        super().__init__(name, help, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._labelvalues(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> Iterator[str]:
+        for labelvalues, value in self._values.items():
+            yield f"{self.name}{_format_labels(self.labelnames, labelvalues)} {_format_value(value)}"
+
+
+class Gauge(_Metric):
+    """A gauge whose value is either set directly or read from a callback each time metrics are scraped"""
+    type_name = "gauge"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 callback: Optional[Callable[[], Union[float, Dict[LabelValues, float]]]] = None) -> None:
+        super().__init__(name, help, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self.callback = callback
+
+    def set(self, value: float, **labels: str) -> None:
+        self._values[self._labelvalues(labels)] = value
+
+    def samples(self) -> Iterator[str]:
+        values = self._values
+        if self.callback is not None:
+            result = self.callback()
+            values = result if isinstance(result, dict) else {(): result}
+
+        for labelvalues, value in values.items():
+            yield f"{self.name}{_format_labels(self.labelnames, labelvalues)} {_format_value(value)}"
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS) -> None:
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._counts: Dict[LabelValues, List[int]] = {}
+        self._sums: Dict[LabelValues, float] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._labelvalues(labels)
+        counts = self._counts.setdefault(key, [0] * len(self.buckets))
+
+        for index, upper_bound in enumerate(self.buckets):
+            if value <= upper_bound:
+                counts[index] += 1
+                break
+
+        self._sums[key] = self._sums.get(key, 0) + value
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started_at, **labels)
+
+    def samples(self) -> Iterator[str]:
+        for labelvalues, counts in self._counts.items():
+            cumulative = 0
+            for upper_bound, count in zip(self.buckets, counts):
+                cumulative += count
+                bucket_label = f'le="{_format_value(upper_bound)}"'
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, labelvalues, bucket_label)} {cumulative}"
+
+            yield f"{self.name}_sum{_format_labels(self.labelnames, labelvalues)} {_format_value(self._sums[labelvalues])}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, labelvalues)} {cumulative}"
+
+
+class MetricsRegistry():
+    def __init__(self) -> None:
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def unregister(self, metric: _Metric) -> None:
+        """Removes `metric`, unless something else has since been registered under its name"""
+        if self._metrics.get(metric.name) is metric:
+            del self._metrics[metric.name]
+
+    def get(self, name: str) -> Optional[_Metric]:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self._metrics.values()) + "\n"
+
+
+registry = MetricsRegistry()
+
+COMMAND_LATENCY: Histogram = registry.register(Histogram(
+    "chocobot_command_duration_seconds", "Time taken to handle a command, including checks and error handling", ("command",)
+))
+COMMAND_ERRORS: Counter = registry.register(Counter(
+    "chocobot_command_errors_total", "Commands that finished with an error", ("command",)
+))
+EVENT_LATENCY: Histogram = registry.register(Histogram(
+    "chocobot_event_duration_seconds", "Time taken to handle a gateway event", ("event",)
+))
+LAVALINK_REQUEST_LATENCY: Histogram = registry.register(Histogram(
+    "chocobot_lavalink_request_duration_seconds", "Latency of REST requests to Lavalink", ("operation",)
+))
+LAVALINK_REQUEST_ERRORS: Counter = registry.register(Counter(
+    "chocobot_lavalink_request_errors_total", "Lavalink REST requests that failed or returned an error result", ("operation",)
+))
+TRACK_HOOK_LATENCY: Histogram = registry.register(Histogram(
+    "chocobot_track_hook_duration_seconds", "Time taken to process a Lavalink event in the track hook", ("event",)
+))
+FILTER_UPDATES: Counter = registry.register(Counter(
+    "chocobot_filter_updates_total", "Debounced filter chain flushes, by whether an update was sent or skipped as a no-op", ("result",)
+))
+ADMISSIONS: Counter = registry.register(Counter(
+    "chocobot_admissions_total", "New player requests, by whether they were admitted straight away, after queueing, or rejected", ("result",)
+))
+OUTBOUND_MESSAGES: Counter = registry.register(Counter(
+    "chocobot_outbound_messages_total", "Scheduled outbound messages, by whether they were sent, merged into another, dropped or failed", ("result",)
+))
+OUTBOUND_LATENCY: Histogram = registry.register(Histogram(
+    "chocobot_outbound_send_duration_seconds", "Time from queueing an outbound message to Discord accepting it", ("priority",)
+))
+TRACK_LOOKAHEAD: Counter = registry.register(Counter(
+    "chocobot_track_lookahead_total", "Upcoming queue entries resolved, revalidated, replaced or dropped before reaching the play head", ("result",)
+))
+TRACK_TRANSITION_LATENCY: Histogram = registry.register(Histogram(
+    "chocobot_track_transition_duration_seconds", "Time from a skip or a track ending to the next track starting", ("trigger",)
+))
+LOOP_STALLS: Counter = registry.register(Counter(
+    "chocobot_loop_stalls_total", "Event loop callbacks that ran past the slow callback threshold while detection was on"
+))
+
+
+class MetricsServer():
+    """Serves the registry's metrics over HTTP. Nothing is bound unless start() is called."""
+
+    def __init__(self, metrics_registry: MetricsRegistry = registry, host: str = METRICS_HOST, port: Optional[int] = None) -> None:
+        self.metrics_registry = metrics_registry
+        self.host = host
+        self.port = port if port is not None else int(METRICS_PORT or 0)
+        self._runner: Optional[web.AppRunner] = None
+
+    async def _handle_metrics(self, _: web.Request) -> web.Response:
+        return web.Response(text=self.metrics_registry.render(), content_type="text/plain", charset="utf-8")
+
+    async def start(self) -> None:
+        if self._runner is not None:
+            return
+
+        app = web.Application()
+        app.router.add_get("/metrics", self._handle_metrics)
+
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        print(f"[CHOCOBOT] Serving metrics on http://{self.host}:{self.port}/metrics")
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
@@ -8,23 +8,201 @@ modifications as necessary for use with another Discord library.
 Usage of this cog requires Python 3.6 or higher due to the use of f-strings.
 Compatibility with Python 3.5 should be possible if f-strings are removed.
 """
+import asyncio
 import re
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
 
 import discord
 import lavalink
 import os
+from discord import app_commands
 from discord.ext import commands
-from lavalink.filters import LowPass, Vibrato
+from lavalink.server import LoadResult, LoadType
 from dotenv import load_dotenv
-
-LAVALINK_SERVER_PASSWORD = os.getenv("LAVALINK_SERVER_PASSWORD")
-LAVALINK_SERVER_PORT = os.getenv("LAVALINK_SERVER_PORT")
-LAVALINK_SERVER_HOST = os.getenv("LAVALINK_SERVER_HOST")
+from lavalink_pool import NodeHealthMonitor, describe_nodes, ensure_lavalink_client
+from admission_control import AdmissionController
+from chocobot_player import ChocobotPlayer
+from filter_chain import FILTER_PRESETS
+from player_lifecycle import PlayerLifecycleManager
+from interaction_dispatcher import ChoiceView, interaction_dispatcher
+from queue_snapshot import QueueSnapshotter
+from station import StationManager
+from track_history import track_history
+from track_lookahead import TrackLookahead, mark_resolved
+from gateway_config import PREFIX_COMMANDS
+import metrics
+
+TRACK_CACHE_SIZE = int(os.getenv("TRACK_CACHE_SIZE", 1024))
+TRACK_CACHE_TTL = float(os.getenv("TRACK_CACHE_TTL", 900))
+PLAYLIST_ENQUEUE_BATCH_SIZE = int(os.getenv("PLAYLIST_ENQUEUE_BATCH_SIZE", 50))
+# Queue entries further than this from the play head are stored in compact form
+QUEUE_FULL_TRACK_WINDOW = int(os.getenv("QUEUE_FULL_TRACK_WINDOW", 10))
 
 url_rx = re.compile(r'https?://(?:www\.)?.+')
+# Commands that work on a guild's own queue, which a guild listening to a station doesn't have
+OWN_QUEUE_COMMANDS = ('play', 'search', 'skip', 'clear', 'pause')
+# Commands that don't touch this guild's voice connection, so they work without anyone being in voice
+VOICE_FREE_COMMANDS = ('station', 'station list', 'station skip', 'station end')
 
 load_dotenv()
 
+class TrackSearchCache():
+    """
+    A size-bounded LRU cache of Lavalink search results, shared across every guild.
+    Entries expire after `ttl` seconds and concurrent lookups for the same query share a single request to the node.
+    """
+
+    def __init__(self, max_size: int = TRACK_CACHE_SIZE, ttl: float = TRACK_CACHE_TTL) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: OrderedDict[str, tuple[float, LoadResult]] = OrderedDict()
+        self._in_flight: Dict[str, asyncio.Future] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    @staticmethod
+    def normalize(query: str) -> str:
+        # Search text is case-insensitive on every source we use, but URLs (video ids especially) aren't
+        if url_rx.match(query):
+            return query.strip()
+
+        return " ".join(query.split()).lower()
+
+    @staticmethod
+    def _copy(results: LoadResult) -> LoadResult:
+        # Tracks pick up per-guild state (requester, position) once queued, so every caller gets their own copies
+        return LoadResult(
+            results.load_type,
+            [type(track)(track) for track in results.tracks],
+            results.playlist_info,
+            results.plugin_info,
+            results.error,
+        )
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+        }
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def _get_fresh(self, key: str) -> Optional[LoadResult]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        expires_at, results = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+
+        self._entries.move_to_end(key)
+        return results
+
+    def _put(self, key: str, results: LoadResult) -> None:
+        self._entries[key] = (time.monotonic() + self.ttl, results)
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    @staticmethod
+    async def _timed_get_tracks(node: lavalink.Node, query: str) -> LoadResult:
+        try:
+            with metrics.LAVALINK_REQUEST_LATENCY.time(operation="get_tracks"):
+                results = await node.get_tracks(query)
+        except Exception:
+            metrics.LAVALINK_REQUEST_ERRORS.inc(operation="get_tracks")
+            raise
+
+        if not results or results.load_type == LoadType.ERROR:
+            metrics.LAVALINK_REQUEST_ERRORS.inc(operation="get_tracks")
+            return results
+
+        # Cached copies keep the stamp, so the look-ahead knows how long ago they were really loaded
+        resolved_at = time.monotonic()
+        for track in results.tracks:
+            mark_resolved(track, resolved_at)
+
+        return results
+
+    async def get_tracks(self, node: lavalink.Node, query: str) -> LoadResult:
+        key = self.normalize(query)
+
+        cached_results = self._get_fresh(key)
+        if cached_results is not None:
+            self.hits += 1
+            return self._copy(cached_results)
+
+        in_flight = self._in_flight.get(key)
+        if in_flight is not None:
+            self.coalesced += 1
+            results = await asyncio.shield(in_flight)
+            return self._copy(results) if results else results
+
+        self.misses += 1
+        request = asyncio.ensure_future(self._timed_get_tracks(node, query))
+        self._in_flight[key] = request
+        try:
+            # Shielded so a cancelled command doesn't cancel the lookup for everyone else waiting on it
+            results = await asyncio.shield(request)
+        finally:
+            if self._in_flight.get(key) is request:
+                del self._in_flight[key]
+
+        # Errors and empty results aren't cached so a transient failure doesn't stick around for the whole TTL
+        if results and results.tracks and results.load_type != LoadType.ERROR:
+            self._put(key, results)
+            return self._copy(results)
+
+        return results
+
+track_search_cache = TrackSearchCache()
+
+def compact_track(track: lavalink.AudioTrack) -> lavalink.AudioTrack:
+    """
+    Rebuilds a track from just its encoded string and the metadata the cog displays.
+    Artwork, ISRC and plugin info are dropped, which is most of the per-track memory for YouTube playlists.
+    """
+    if track.track is None:
+        # Deferred tracks have nothing encoded yet and have to keep whatever they need to load later
+        return track
+
+    return lavalink.AudioTrack({
+        'encoded': track.track,
+        'info': {
+            'identifier': track.identifier,
+            'isSeekable': track.is_seekable,
+            'author': track.author,
+            'length': track.duration,
+            'isStream': track.is_stream,
+            'title': track.title,
+            'uri': track.uri,
+        },
+    }, track.requester, resolved_at=track.extra.get('resolved_at'))
+
+async def enqueue_in_batches(player: lavalink.DefaultPlayer, tracks: list[lavalink.AudioTrack], requester: int,
+                             batch_size: int = PLAYLIST_ENQUEUE_BATCH_SIZE) -> None:
+    """ Adds tracks to a player's queue in batches, yielding to the event loop between each one. """
+    for batch_start in range(0, len(tracks), batch_size):
+        for track in tracks[batch_start:batch_start + batch_size]:
+            if len(player.queue) >= QUEUE_FULL_TRACK_WINDOW:
+                track = compact_track(track)
+            player.add(requester=requester, track=track)
+
+        await asyncio.sleep(0)
+
 class LavalinkVoiceClient(discord.VoiceClient):
     """
     This is the preferred way to handle external voice sending
@@ -37,18 +215,7 @@ class LavalinkVoiceClient(discord.VoiceClient):
         self.client = client
         self.channel = channel
         # ensure a client already exists
-        if hasattr(self.client, 'lavalink'):
-            self.lavalink = self.client.lavalink
-        else:
-            self.client.lavalink = lavalink.Client(client.user.id)
-            self.client.lavalink.add_node(
-                LAVALINK_SERVER_HOST,
-                LAVALINK_SERVER_PORT,
-                LAVALINK_SERVER_PASSWORD,
-                'us',
-                'default-node'
-            )
-            self.lavalink = self.client.lavalink
+        self.lavalink = ensure_lavalink_client(client)
 
     async def on_voice_server_update(self, data):
         # the data needs to be transformed before being handed down to
@@ -97,28 +264,152 @@ class LavalinkVoiceClient(discord.VoiceClient):
         player.channel_id = None
         self.cleanup()
 
-class Music(commands.Cog):
-    def __init__(self, bot):
-        self.bot: discord.Client = bot
+class QueueView(discord.ui.View):
+    """ Previous/next buttons for paging through a guild's queue. Only the requested page is ever rendered. """
+
+    def __init__(self, cog: 'Music', guild_id: int, page: int = 0, timeout: float = 120) -> None:
+        super().__init__(timeout=timeout)
+        self.cog = cog
+        self.guild_id = guild_id
+        self.page = page
+
+    def _player(self) -> Optional[ChocobotPlayer]:
+        return self.cog.bot.lavalink.player_manager.get(self.guild_id)
+
+    async def _show_page(self, interaction: discord.Interaction, page: int) -> None:
+        player = self._player()
+        page_count = player.page_count(self.cog.visible_queue_length) if player else 1
+        # The queue may have shrunk since this page was rendered
+        self.page = max(0, min(page, page_count - 1))
+
+        await interaction.response.edit_message(embed=self.cog.build_queue_embed(player, self.page), view=self)
+
+    @discord.ui.button(label='Previous', style=discord.ButtonStyle.secondary)
+    async def previous_page(self, interaction: discord.Interaction, _: discord.ui.Button) -> None:
+        await self._show_page(interaction, self.page - 1)
+
+    @discord.ui.button(label='Next', style=discord.ButtonStyle.secondary)
+    async def next_page(self, interaction: discord.Interaction, _: discord.ui.Button) -> None:
+        await self._show_page(interaction, self.page + 1)
+
+class TrackSelectView(ChoiceView):
+    """ One numbered button per search result. Choosing one resolves to that result's index. """
+
+    def __init__(self, author_id: int, result_count: int) -> None:
+        super().__init__(author_id)
+
+        for index in range(result_count):
+            button = discord.ui.Button(label=str(index + 1), style=discord.ButtonStyle.primary)
+            button.callback = self._make_callback(index)
+            self.add_item(button)
 
-        if not hasattr(bot, 'lavalink'):  # This ensures the client isn't overwritten during cog reloads.
-            bot.lavalink = lavalink.Client(bot.user.id)
-            bot.lavalink.add_node(host=LAVALINK_SERVER_HOST, port=LAVALINK_SERVER_PORT, password=LAVALINK_SERVER_PASSWORD, region="us")  # Host, Port, Password, Region, Name
-            bot.lavalink.add_event_hook(self.track_hook)
+    def _make_callback(self, index: int):
+        async def callback(interaction: discord.Interaction) -> None:
+            await self.choose(interaction, index)
 
-    def cog_unload(self):
+        return callback
+
+class Music(commands.Cog):
+    def __init__(self, bot, visible_queue_length: int = 10):
+        self.bot: discord.Client = bot
+        self.visible_queue_length = visible_queue_length
+
+        # This reuses the existing client and node pool during cog reloads instead of overwriting it.
+        ensure_lavalink_client(bot)
+        # Event hooks are cleared on unload, so they're always registered against the current cog instance.
+        bot.lavalink.add_event_hook(self.track_hook)
+        self.node_monitor = NodeHealthMonitor(bot.lavalink)
+        self.admission = AdmissionController(bot.lavalink)
+        self.playlist_enqueue_tasks: Dict[int, asyncio.Task] = {}
+        self.player_lifecycle = PlayerLifecycleManager(bot, on_destroy=self.forget_player)
+        self.queue_snapshotter = QueueSnapshotter(bot, connect=lambda channel: channel.connect(cls=LavalinkVoiceClient))
+        self.stations = StationManager(bot)
+        self.lookahead = TrackLookahead(bot.lavalink, track_search_cache.get_tracks)
+
+        # Their callbacks close over this instance, so they're registered while the cog is loaded and removed with it
+        self.gauges = (
+            metrics.Gauge(
+                "chocobot_players", "Lavalink players by state", ("state",),
+                callback=lambda: {(state,): count for state, count in self.player_lifecycle.stats().items() if not state.startswith("reaped_")}
+            ),
+            metrics.Gauge(
+                "chocobot_lavalink_nodes", "Each Lavalink node's availability, player count and load-balancing penalty", ("node", "stat"),
+                callback=lambda: {
+                    (node["name"], stat): value
+                    for node in describe_nodes(bot.lavalink)
+                    for stat, value in node.items() if stat in ("available", "players", "penalty")
+                }
+            ),
+            metrics.Gauge(
+                "chocobot_track_search_cache", "Track search cache size and lookup counters", ("stat",),
+                callback=lambda: {(stat,): value for stat, value in track_search_cache.stats().items()}
+            ),
+            metrics.Gauge(
+                "chocobot_track_history", "Track history index lookups and recorded tracks", ("stat",),
+                callback=lambda: {(stat,): value for stat, value in track_history.stats().items()}
+            ),
+            metrics.Gauge(
+                "chocobot_admission", "Requests waiting for a new player and nodes past an admission threshold", ("stat",),
+                callback=lambda: {(stat,): value for stat, value in self.admission.stats().items()}
+            ),
+            metrics.Gauge(
+                "chocobot_stations", "Stations, the guilds listening to them and the tracks queued on them", ("stat",),
+                callback=lambda: {(stat,): value for stat, value in self.stations.stats().items()}
+            ),
+            metrics.Gauge(
+                "chocobot_track_lookahead", "Upcoming queue entries handled by the look-ahead, and guilds it's working on", ("stat",),
+                callback=lambda: {(stat,): value for stat, value in self.lookahead.stats().items()}
+            ),
+        )
+
+    async def cog_load(self):
+        for gauge in self.gauges:
+            metrics.registry.register(gauge)
+        self.node_monitor.start()
+        self.player_lifecycle.start()
+        # The queue snapshotter starts itself once on_ready has restored the last run's players
+        self.stations.start()
+
+    async def cog_unload(self):
         """ Cog unload handler. This removes any event hooks that were registered. """
+        self.node_monitor.stop()
+        self.player_lifecycle.stop()
+        self.queue_snapshotter.stop()
+        self.stations.stop()
+        self.lookahead.stop()
+        for guild_id in list(self.playlist_enqueue_tasks):
+            self.cancel_playlist_enqueue(guild_id)
         self.bot.lavalink._event_hooks.clear()
+        for gauge in self.gauges:
+            metrics.registry.unregister(gauge)
+        # A last snapshot, so a clean shutdown resumes from exactly where it stopped
+        await self.queue_snapshotter.snapshot()
 
     async def cog_before_invoke(self, ctx):
         """ Command before-invoke handler. """
+        # Slash commands have to be acknowledged within three seconds, and connecting to voice or loading tracks can take
+        # longer than that. Deferring acknowledges them straight away and every reply after it is sent as a followup.
+        # This does nothing for prefix commands.
+        await ctx.defer()
+
         guild_check = ctx.guild is not None
         #  This is essentially the same as `@commands.guild_only()`
         #  except it saves us repeating ourselves (and also a few lines).
 
         if guild_check:
-            await self.ensure_voice(ctx)
-            #  Ensure that the bot and command author share a mutual voicechannel.
+            if ctx.command.qualified_name not in VOICE_FREE_COMMANDS:
+                await self.ensure_voice(ctx)
+                #  Ensure that the bot and command author share a mutual voicechannel.
+
+            station = self.stations.station_of(ctx.guild.id)
+            if station is not None and ctx.command.qualified_name in OWN_QUEUE_COMMANDS:
+                raise commands.CommandInvokeError(
+                    f'This server is listening to the **{station.name}** station. Leave it first with `/station leave`.'
+                )
+
+            player: Optional[ChocobotPlayer] = self.bot.lavalink.player_manager.get(ctx.guild.id)
+            if player is not None:
+                player.touch()
 
         return guild_check
 
@@ -132,16 +423,9 @@ class Music(commands.Cog):
 
     async def ensure_voice(self, ctx):
         """ This check ensures that the bot and command author are in the same voicechannel. """
-        player = self.bot.lavalink.player_manager.create(ctx.guild.id)
-        # Create returns a player if one exists, otherwise creates.
-        # This line is important because it ensures that a player always exists for a guild.
-
-        # Most people might consider this a waste of resources for guilds that aren't playing, but this is
-        # the easiest and simplest way of ensuring players are created.
-
         # These are commands that require the bot to join a voicechannel (i.e. initiating playback).
         # Commands such as volume/skip etc don't require the bot to be in a voicechannel so don't need listing here.
-        should_connect = ctx.command.name in ('play',)
+        should_connect = ctx.command.qualified_name in ('play', 'search', 'station start', 'station join', 'station add')
 
         if not ctx.author.voice or not ctx.author.voice.channel:
             # Our cog_command_error handler catches this and sends it to the voicechannel.
@@ -149,6 +433,8 @@ class Music(commands.Cog):
             # execution state of the command goes no further.
             raise commands.CommandInvokeError('Join a voicechannel first.')
 
+        # Players are only created for commands that start playback. Every other command works with the existing
+        # player, if there is one, and idle players are cleaned up by the lifecycle manager.
         v_client = ctx.voice_client
         if not v_client:
             if not should_connect:
@@ -159,22 +445,69 @@ class Music(commands.Cog):
             if not permissions.connect or not permissions.speak:  # Check user limit too?
                 raise commands.CommandInvokeError('I need the `CONNECT` and `SPEAK` permissions.')
 
+            # Only a new connection adds a stream to a node. Queueing more tracks on a connected player is always allowed.
+            admitted = await self.admission.admit(on_queued=lambda position: ctx.send(
+                f'The music servers are busy, so you\'re number {position} in line. Playback will start as soon as there\'s room.'
+            ))
+            if not admitted:
+                raise commands.CommandInvokeError('The music servers are at capacity right now. Try again in a few minutes.')
+
+            # Create returns a player if one exists, otherwise creates.
+            player = self.bot.lavalink.player_manager.create(ctx.guild.id)
             player.store('channel', ctx.channel.id)
             await ctx.author.voice.channel.connect(cls=LavalinkVoiceClient)
         else:
             if v_client.channel.id != ctx.author.voice.channel.id:
                 raise commands.CommandInvokeError('You need to be in my voicechannel.')
 
+            if should_connect:
+                self.bot.lavalink.player_manager.create(ctx.guild.id)
+
     async def track_hook(self, event):
+        with metrics.TRACK_HOOK_LATENCY.time(event=type(event).__name__):
+            await self._handle_track_event(event)
+
+    async def _handle_track_event(self, event):
+        if isinstance(event, lavalink.events.TrackStartEvent):
+            event.player.touch()
+            # The play head moved, so there's a new entry in the look-ahead window
+            self.lookahead.schedule(event.player)
+            await track_history.record(event.player.guild_id, event.track, played=True)
+
         if isinstance(event, lavalink.events.QueueEndEvent):
             # When this track_hook receives a "QueueEndEvent" from lavalink.py
             # it indicates that there are no tracks left in the player's queue.
             # To save on resources, we can tell the bot to disconnect from the voicechannel.
             guild_id = event.player.guild_id
             guild = self.bot.get_guild(guild_id)
-            await guild.voice_client.disconnect(force=True)
-
-    @commands.command(aliases=['ps'])
+            # The queue can run dry again after the bot has already left, e.g. a skip racing a disconnect
+            if guild is not None and guild.voice_client is not None:
+                await guild.voice_client.disconnect(force=True)
+
+    def forget_player(self, guild_id: int) -> None:
+        """ Drops everything the cog holds for a guild's player once it's destroyed. """
+        self.cancel_playlist_enqueue(guild_id)
+        self.stations.leave(guild_id)
+        self.lookahead.cancel(guild_id)
+
+    def cancel_playlist_enqueue(self, guild_id: int) -> None:
+        task = self.playlist_enqueue_tasks.pop(guild_id, None)
+        if task is not None:
+            task.cancel()
+
+    async def _enqueue_playlist_remainder(self, player: lavalink.DefaultPlayer, tracks: list[lavalink.AudioTrack], requester: int,
+                                          previous_task: Optional[asyncio.Task] = None) -> None:
+        try:
+            # Playlists queued back to back are added in order. Cancelling this task cancels the one it's waiting on too.
+            if previous_task is not None:
+                await previous_task
+
+            await enqueue_in_batches(player, tracks, requester)
+        finally:
+            if self.playlist_enqueue_tasks.get(player.guild_id) is asyncio.current_task():
+                del self.playlist_enqueue_tasks[player.guild_id]
+
+    @commands.hybrid_command(aliases=['ps'])
     async def pause(self, ctx: commands.Context):
         """Pauses the current track until the play command is used again. """
         player: lavalink.DefaultPlayer = self.bot.lavalink.player_manager.get(ctx.guild.id)
@@ -185,78 +518,124 @@ class Music(commands.Cog):
         await player.set_pause(True)
         await ctx.send(embed=embed)
 
-    @commands.command(aliases=['pl'])
+    async def autocomplete_history(self, interaction: discord.Interaction, current: str) -> list[app_commands.Choice[str]]:
+        """ Suggests tracks from this server's history as the query is typed. Choosing one plays it by its URL. """
+        if interaction.guild_id is None:
+            return []
+
+        tracks = await track_history.search(interaction.guild_id, current, limit=25)
+        return [
+            app_commands.Choice(name=f'{track.title} - {track.author}'[:100], value=track.uri)
+            for track in tracks if track.uri and len(track.uri) <= 100
+        ]
+
+    @commands.hybrid_command(aliases=['pl'])
+    @app_commands.describe(query="What to search for, or a link. Leave it empty to resume playback.")
+    @app_commands.autocomplete(query=autocomplete_history)
     async def play(self, ctx: commands.Context, *, query: str = "") -> None:
-        """ Searches and plays a song from a given query. """
+        """ Searches this server's history, then YouTube, and plays a song from a given query. """
+        await self.play_query(ctx, query, use_history=True)
 
+    @commands.hybrid_command(aliases=['yt'])
+    @app_commands.describe(query="What to search YouTube for")
+    async def search(self, ctx: commands.Context, *, query: str) -> None:
+        """ Searches YouTube and plays a song from a given query, skipping this server's history. """
+        await self.play_query(ctx, query, use_history=False)
+
+    async def play_query(self, ctx: commands.Context, query: str, use_history: bool) -> None:
         # Get the player for this guild from cache.
         player: lavalink.DefaultPlayer = self.bot.lavalink.player_manager.get(ctx.guild.id)
         # Remove leading and trailing <>. <> may be used to suppress embedding links in Discord.
         query = query.strip('<>')
 
         await player.set_pause(False)
-        if query == "": return
+        if query == "":
+            return await ctx.send(embed=discord.Embed(color=discord.Color.blurple(), title="Radio Resumed"))
 
         # Check if the user input might be a URL. If it isn't, we can have Lavalink do a YouTube search for it instead.
         # SoundCloud searching is possible by prefixing "scsearch:" instead.
+        history_tracks: list[lavalink.AudioTrack] = []
         if not url_rx.match(query):
+            # Songs this server has played before are found locally, and only a miss goes to Lavalink.
+            if use_history:
+                history_tracks = await track_history.search(ctx.guild.id, query)
             query = f'ytsearch:{query}'
 
-        # Get the results for the query from Lavalink.
-        results = await player.node.get_tracks(query)
+        # Get the results for the query from the history index or from Lavalink.
+        if history_tracks:
+            results = LoadResult(LoadType.SEARCH, history_tracks)
+        else:
+            results = await track_search_cache.get_tracks(player.node, query)
 
         print("results: ", results)
 
         # Results could be None if Lavalink returns an invalid response (non-JSON/non-200 (OK)).
         # Alternatively, results.tracks could be an empty array if the query yielded no tracks.
         if not results or not results.tracks:
-            if results.load_type == 'ERROR':
+            if results and results.load_type == LoadType.ERROR:
                 print(f'Lavalink threw an error from the query "{query}": [SEV{results.error.severity}] -- {results.error.message}')
             return await ctx.send('Nothing found!')
 
         embed = discord.Embed(color=discord.Color.blurple())
 
         # Valid loadTypes are:
-        #   TRACK_LOADED    - single video/direct URL)
-        #   PLAYLIST_LOADED - direct URL to playlist)
-        #   SEARCH_RESULT   - query prefixed with either ytsearch: or scsearch:.
-        #   NO_MATCHES      - query yielded no results
-        #   LOAD_FAILED     - most likely, the video encountered an exception during loading.
+        #   TRACK    - single video/direct URL)
+        #   PLAYLIST - direct URL to playlist)
+        #   SEARCH   - query prefixed with either ytsearch: or scsearch:.
+        #   EMPTY    - query yielded no results
+        #   ERROR    - most likely, the video encountered an exception during loading.
         tracks: list[lavalink.AudioTrack] = results.tracks
 
         print("[DEBUG]: results.load_type: ", results.load_type)
 
-        if results.load_type == 'PLAYLIST_LOADED':
-            for track in tracks:
-                # Add all of the tracks from the playlist to the queue.
-                player.add(requester=ctx.author.id, track=track)
+        if results.load_type == LoadType.PLAYLIST:
+            # Only the first track is queued up front so playback can start straight away.
+            # The rest of the playlist is added in the background.
+            player.add(requester=ctx.author.id, track=tracks[0])
+            if not player.is_playing:
+                await player.play()
+
+            if len(tracks) > 1:
+                self.playlist_enqueue_tasks[ctx.guild.id] = asyncio.create_task(
+                    self._enqueue_playlist_remainder(player, tracks[1:], ctx.author.id, self.playlist_enqueue_tasks.get(ctx.guild.id))
+                )
 
             embed.title = 'Playlist Enqueued!'
             embed.description = f'{results.playlist_info.name} - {len(tracks)} tracks'
-        elif results.load_type == "SEARCH_RESULT":
+        elif results.load_type == LoadType.SEARCH:
             newline = '\n'
+            search_results = tracks[:5]
 
             track_select_embed = discord.Embed(color=discord.Color.blurple())
             track_select_embed.title = "Select Song"
+            if history_tracks:
+                track_select_embed.set_footer(text=f"From this server's history. Use {ctx.prefix}search to search YouTube instead.")
             track_select_embed.description = f"""
-                Send the number corresponding to the track you want to play.
+                Pick the track you want to play{', or send its number' if PREFIX_COMMANDS else ''}.
 
-                {newline.join([f'{iter + 1}: {tracks[iter].title}' for iter in range(0, 5)])}
+                {newline.join([f'{iter + 1}: {tracks[iter].title}' for iter in range(0, len(search_results))])}
             """
 
-            bot: discord.Client = ctx.bot
-            await ctx.send(embed=track_select_embed)
-            response: discord.Message = await bot.wait_for(
-                "message", check=lambda msg: int(msg.content) in range(1, 6),
-            )
-            #* Converting this target track number to an index for the tracks list
-            target_track_number = int(response.content) - 1
-            track = tracks[target_track_number]
+            def parse_track_number(msg: discord.Message) -> Optional[int]:
+                #* Converting the track number to an index for the tracks list. Anything that isn't a listed number is ignored.
+                content = msg.content.strip()
+                return int(content) - 1 if content.isdecimal() and 1 <= int(content) <= len(search_results) else None
+
+            view = TrackSelectView(ctx.author.id, len(search_results))
+            track_select_message = await ctx.send(embed=track_select_embed, view=view)
+            target_track_index: Optional[int] = await interaction_dispatcher.wait_for_choice(ctx, view, parse=parse_track_number)
+            await track_select_message.edit(view=view)
+
+            if target_track_index is None:
+                return await ctx.send('No track selected.')
+
+            track = search_results[target_track_index]
 
             embed.title = 'Track Enqueued'
             embed.description = f'[{track.title}]({track.uri})'
 
             player.add(requester=ctx.author.id, track=track)
+            await track_history.record(ctx.guild.id, track)
         else:
             track = tracks[0]
 
@@ -266,6 +645,7 @@ class Music(commands.Cog):
             embed.description = ""
 
             player.add(track=track, )
+            await track_history.record(ctx.guild.id, track)
 
         await ctx.send(embed=embed)
 
@@ -273,34 +653,57 @@ class Music(commands.Cog):
         # the current track.
         if not player.is_playing:
             await player.play()
+        else:
+            self.lookahead.schedule(player)
 
-    @commands.command(aliases=['q'])
+    @commands.hybrid_command(aliases=['q'])
     async def queue(self, ctx: commands.Context):
         """ Reads out the current queue """
-        newline = "\n"
+        player: ChocobotPlayer = self.bot.lavalink.player_manager.get(ctx.guild.id)
 
-        player: lavalink.DefaultPlayer = self.bot.lavalink.player_manager.get(ctx.guild.id)
+        embed = self.build_queue_embed(player, page=0)
+        # Paging buttons are only worth showing when there's more than one page
+        if player is not None and player.page_count(self.visible_queue_length) > 1:
+            await ctx.send(embed=embed, view=QueueView(self, ctx.guild.id))
+        else:
+            await ctx.send(embed=embed)
 
+    def build_queue_embed(self, player: Optional[ChocobotPlayer], page: int) -> discord.Embed:
         embed = discord.Embed(color=discord.Color.blurple())
-
         embed.title = "Queue"
-        embed.description = f"""1: {player.current.title}
-            {newline.join(
-                [f"{iter + 2}: {track.title}" for iter, track in enumerate(player.queue[::])]
-            )}
-        """
-        
-        await ctx.send(embed=embed)
+
+        if player is None or (player.current is None and not player.queue):
+            embed.description = "The queue is empty."
+            return embed
+
+        now_playing = player.current.title if player.current else "Nothing"
+        queue_page = player.render_queue_page(page, self.visible_queue_length)
+        embed.description = f"1: {now_playing}\n{queue_page}" if queue_page else f"1: {now_playing}"
+        embed.set_footer(text=f"{player.queue_summary()} - page {page + 1}/{player.page_count(self.visible_queue_length)}")
+
+        return embed
     
-    @commands.command(aliases=['cl'])
+    @commands.hybrid_command(aliases=['cl'])
     async def clear(self, ctx: commands.Context):
         """ Clears all tracks from the queue"""
         player: lavalink.DefaultPlayer = self.bot.lavalink.player_manager.get(ctx.guild.id)
 
+        self.cancel_playlist_enqueue(ctx.guild.id)
         player.queue.clear()
         await ctx.send(embed=discord.Embed(color=discord.Color.blurple(), description="Queue cleared!"))
 
-    @commands.command(aliases=['vb'])
+    async def refuse_filters_under_load(self, ctx: commands.Context, player: ChocobotPlayer) -> bool:
+        """ Replies and returns True if new filters are being shed because the player's node is overloaded. """
+        if not self.admission.should_shed_filters(player.node):
+            return False
+
+        await ctx.send(embed=discord.Embed(
+            color=discord.Color.blurple(), description="The music server is under heavy load, so new filters are paused for now."
+        ))
+        return True
+
+    @commands.hybrid_command(aliases=['vb'])
+    @app_commands.describe(frequency="Vibrato frequency from 0 to 14. 0 turns the filter off.")
     async def vibrato(self, ctx, frequency: float):
         """ Sets the frequency (0-14) of the vibrato filter. """
         # Get the player for this guild from cache.
@@ -314,22 +717,22 @@ class Music(commands.Cog):
 
         # A frequency of 0 effectively means this filter won't function, so we can disable it.
         if frequency == 0.0:
-            await player.remove_filter('vibrato')
+            await player.filter_chain.remove('vibrato')
             embed.description = 'Disabled **Vibrato Filter**'
             return await ctx.send(embed=embed)
 
-        # Lets create our filter.
-        vibrato = Vibrato()
-        vibrato.update(frequency=frequency, depth=depth)  # Set the filter frequency to the user's desired level.
+        if await self.refuse_filters_under_load(ctx, player):
+            return
 
-        # This applies our filter. If the filter is already enabled on the player, then this will
-        # just overwrite the filter with the new values.
-        await player.set_filter(vibrato)
+        # This adds our filter to the guild's filter chain. If the filter is already enabled on the player, then this will
+        # just overwrite the filter with the new values. Changes made in quick succession go out as one update.
+        await player.filter_chain.set('vibrato', frequency=frequency, depth=depth)
 
         embed.description = f'Set **Vibrato** frequency to {frequency}.'
         await ctx.send(embed=embed)
     
-    @commands.command(aliases=['lp'])
+    @commands.hybrid_command(aliases=['lp'])
+    @app_commands.describe(strength="Filter strength from 0 to 100. 0 turns the filter off.")
     async def lowpass(self, ctx, strength: float):
         """ Sets the strength (0-100) of the low pass filter. """
         # Get the player for this guild from cache.
@@ -347,22 +750,168 @@ class Music(commands.Cog):
 
         # A strength of 0 effectively means this filter won't function, so we can disable it.
         if strength == 0.0:
-            await player.remove_filter('lowpass')
+            await player.filter_chain.remove('lowpass')
             embed.description = 'Disabled **Low Pass Filter**'
             return await ctx.send(embed=embed)
 
-        # Lets create our filter.
-        low_pass = LowPass()
-        low_pass.update(smoothing=strength)  # Set the filter strength to the user's desired level.
+        if await self.refuse_filters_under_load(ctx, player):
+            return
 
-        # This applies our filter. If the filter is already enabled on the player, then this will
-        # just overwrite the filter with the new values.
-        await player.set_filter(low_pass)
+        # This adds our filter to the guild's filter chain. If the filter is already enabled on the player, then this will
+        # just overwrite the filter with the new values. Changes made in quick succession go out as one update.
+        await player.filter_chain.set('lowpass', smoothing=strength)
 
         embed.description = f'Set **Low Pass Filter** strength to {strength}.'
         await ctx.send(embed=embed)
 
-    @commands.command(aliases=['dc'])
+    async def autocomplete_preset(self, interaction: discord.Interaction, current: str) -> list[app_commands.Choice[str]]:
+        return [app_commands.Choice(name=name, value=name) for name in FILTER_PRESETS if name.startswith(current.lower())]
+
+    @commands.hybrid_command(aliases=['fx'])
+    @app_commands.describe(name="The preset to apply. Leave it empty to list them.")
+    @app_commands.autocomplete(name=autocomplete_preset)
+    async def preset(self, ctx, name: str = ""):
+        """ Applies a named filter preset, replacing any filters already set. Use "off" to clear them all. """
+        player: ChocobotPlayer = self.bot.lavalink.player_manager.get(ctx.guild.id)
+        embed = discord.Embed(color=discord.Color.blurple(), title='Filter Presets')
+
+        name = name.lower()
+        if name not in FILTER_PRESETS:
+            embed.description = f'Available presets: {", ".join(FILTER_PRESETS)}\nActive filters: {", ".join(player.filter_chain.active) or "none"}'
+            return await ctx.send(embed=embed)
+
+        # Clearing filters only ever lightens the node's load, so "off" is always allowed
+        if name != 'off' and await self.refuse_filters_under_load(ctx, player):
+            return
+
+        await player.filter_chain.apply_preset(name)
+
+        embed.description = 'Cleared all filters.' if name == 'off' else f'Applied the **{name}** preset.'
+        await ctx.send(embed=embed)
+
+    async def autocomplete_station(self, interaction: discord.Interaction, current: str) -> list[app_commands.Choice[str]]:
+        return [
+            app_commands.Choice(name=station.name, value=station.name)
+            for station in self.stations if station.name.lower().startswith(current.lower())
+        ][:25]
+
+    @commands.hybrid_group(aliases=['st'], invoke_without_command=True, fallback='list')
+    async def station(self, ctx: commands.Context):
+        """ Lists the stations, which play one queue to every server listening along. """
+        embed = discord.Embed(color=discord.Color.blurple(), title='Stations')
+        embed.description = '\n'.join([
+            f'**{station.name}** - {station.current.title if station.current else "Off air"} ({len(station.listeners)} listening)'
+            for station in self.stations
+        ]) or 'There are no stations yet. Start one with `/station start`.'
+
+        listening = self.stations.station_of(ctx.guild.id)
+        if listening is not None:
+            embed.set_footer(text=f'This server is listening to {listening.name}.')
+        await ctx.send(embed=embed)
+
+    @station.command(name='start')
+    @app_commands.describe(name="The station's name, which other servers use to join it")
+    async def station_start(self, ctx: commands.Context, *, name: str):
+        """ Starts a station other servers can listen along to. This server programs what it plays. """
+        station = self.stations.create(name, ctx.guild.id)
+        if station is None:
+            return await ctx.send('That name is taken, or this server already runs a station.')
+
+        await self.join_station(ctx, station)
+        await ctx.send(embed=discord.Embed(
+            color=discord.Color.blurple(), title='Station Started',
+            description=f'**{station.name}** is on air. Queue tracks with `/station add`, and other servers can listen with `/station join {station.name}`.'
+        ))
+
+    @station.command(name='join')
+    @app_commands.describe(name="The station to listen to")
+    @app_commands.autocomplete(name=autocomplete_station)
+    async def station_join(self, ctx: commands.Context, *, name: str):
+        """ Listens along to a station, replacing this server's own queue. """
+        station = self.stations.get(name)
+        if station is None:
+            return await ctx.send('There\'s no station by that name.')
+
+        await self.join_station(ctx, station)
+        now_playing = f'Now playing {station.current.title}.' if station.current else 'It\'s off air until its next track is queued.'
+        await ctx.send(embed=discord.Embed(color=discord.Color.blurple(), title=f'Tuned in to {station.name}', description=now_playing))
+
+    async def join_station(self, ctx: commands.Context, station) -> None:
+        player: ChocobotPlayer = self.bot.lavalink.player_manager.get(ctx.guild.id)
+
+        self.cancel_playlist_enqueue(ctx.guild.id)
+        await self.stations.join(station, player)
+
+    @station.command(name='leave')
+    async def station_leave(self, ctx: commands.Context):
+        """ Stops listening to a station. The server's own queue starts empty. """
+        player: ChocobotPlayer = self.bot.lavalink.player_manager.get(ctx.guild.id)
+
+        station = self.stations.leave(ctx.guild.id)
+        if station is None:
+            return await ctx.send('This server isn\'t listening to a station.')
+
+        await player.stop()
+        await ctx.send(embed=discord.Embed(color=discord.Color.blurple(), description=f'Left the **{station.name}** station.'))
+
+    @station.command(name='add')
+    @app_commands.describe(query="What to search for, or a link to a track or playlist")
+    async def station_add(self, ctx: commands.Context, *, query: str):
+        """ Queues a track or playlist on this server's station. """
+        player: ChocobotPlayer = self.bot.lavalink.player_manager.get(ctx.guild.id)
+        station = self.stations.owned_by(ctx.guild.id)
+        if station is None:
+            return await ctx.send('This server doesn\'t run a station. Start one with `/station start`.')
+
+        # The station's own server stops listening when its player is cleaned up, and tunes back in here
+        if self.stations.station_of(ctx.guild.id) is None and not player.is_playing:
+            await self.join_station(ctx, station)
+
+        # Tracks are resolved once for the station, however many servers are listening, so any node will do
+        query = query.strip('<>')
+        history_tracks: list[lavalink.AudioTrack] = []
+        if not url_rx.match(query):
+            history_tracks = await track_history.search(ctx.guild.id, query, limit=1)
+            query = f'ytsearch:{query}'
+
+        node = self.bot.lavalink.node_manager.find_ideal_node()
+        if not history_tracks and node is None:
+            return await ctx.send('The music servers are unavailable right now. Try again in a few minutes.')
+
+        results = LoadResult(LoadType.SEARCH, history_tracks) if history_tracks else await track_search_cache.get_tracks(node, query)
+        if not results or not results.tracks:
+            return await ctx.send('Nothing found!')
+
+        tracks = results.tracks if results.load_type == LoadType.PLAYLIST else results.tracks[:1]
+        await enqueue_in_batches(station, tracks, ctx.author.id)
+        await self.stations.start_if_idle(station)
+
+        description = f'{results.playlist_info.name} - {len(tracks)} tracks' if results.load_type == LoadType.PLAYLIST else (
+            f'[{tracks[0].title}]({tracks[0].uri})'
+        )
+        await ctx.send(embed=discord.Embed(color=discord.Color.blurple(), title=f'Queued on {station.name}', description=description))
+
+    @station.command(name='skip')
+    async def station_skip(self, ctx: commands.Context):
+        """ Skips the track this server's station is playing, for every server listening. """
+        station = self.stations.owned_by(ctx.guild.id)
+        if station is None:
+            return await ctx.send('This server doesn\'t run a station.')
+
+        await self.stations.advance(station)
+        await ctx.send(embed=discord.Embed(color=discord.Color.blurple(), description="Skipped!"))
+
+    @station.command(name='end')
+    async def station_end(self, ctx: commands.Context):
+        """ Takes this server's station off air, stopping it for every server listening. """
+        station = self.stations.owned_by(ctx.guild.id)
+        if station is None:
+            return await ctx.send('This server doesn\'t run a station.')
+
+        await self.stations.end(station)
+        await ctx.send(embed=discord.Embed(color=discord.Color.blurple(), description=f'**{station.name}** is off air.'))
+
+    @commands.hybrid_command(aliases=['dc'])
     async def disconnect(self, ctx):
         """ Disconnects the player from the voice channel and clears its queue. """
         player = self.bot.lavalink.player_manager.get(ctx.guild.id)
@@ -378,6 +927,7 @@ class Music(commands.Cog):
 
         # Clear the queue to ensure old tracks don't start playing
         # when someone else queues something.
+        self.forget_player(ctx.guild.id)
         player.queue.clear()
         # Stop the current track so Lavalink consumes less resources.
         await player.stop()
@@ -385,12 +935,13 @@ class Music(commands.Cog):
         await ctx.voice_client.disconnect(force=True)
         await ctx.send('*⃣ | Disconnected.')
 
-    @commands.command(aliases=['sk'])
+    @commands.hybrid_command(aliases=['sk'])
     async def skip(self, ctx: commands.Context):
         """Skips the currently playing track. If this is the last track in the queue, this will end playback."""
         player: lavalink.DefaultPlayer = self.bot.lavalink.player_manager.get(ctx.guild.id)
 
         await player.skip()
+        await ctx.send(embed=discord.Embed(color=discord.Color.blurple(), description="Skipped!"))
 
 def setup(bot):
     bot.add_cog(Music(bot))
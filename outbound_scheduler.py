@@ -0,0 +1,202 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Hashable, List, Optional
+
+import discord
+from discord.ext import commands
+
+import metrics
+
+# Messages a channel may be sent per window before the scheduler paces itself, staying under Discord's channel limit
+OUTBOUND_CHANNEL_BURST = int(os.getenv("OUTBOUND_CHANNEL_BURST", 5))
+OUTBOUND_CHANNEL_WINDOW = float(os.getenv("OUTBOUND_CHANNEL_WINDOW", 5))
+# Past this many waiting messages in a channel, the oldest notifications are dropped. Replies never are.
+OUTBOUND_MAX_PENDING = int(os.getenv("OUTBOUND_MAX_PENDING", 20))
+
+REPLY = 0
+NOTIFICATION = 1
+PRIORITY_NAMES = {REPLY: "reply", NOTIFICATION: "notification"}
+
+Render = Callable[[List[Any]], Dict[str, Any]]
+
+
+def _latest(items: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return items[-1]
+
+
+def _retrieve_exception(future: asyncio.Future) -> None:
+    # Fire-and-forget senders never look at the result, so a failure (already logged) would otherwise warn on collection
+    if not future.cancelled():
+        future.exception()
+
+
+class OutboundMessage():
+    """A message waiting to be sent. `render` turns everything merged into it so far into the send() arguments."""
+
+    def __init__(self, priority: int, sequence: int, items: List[Any], render: Render, merge_key: Optional[Hashable]) -> None:
+        self.priority = priority
+        self.sequence = sequence
+        self.items = items
+        self.render = render
+        self.merge_key = merge_key
+        self.queued_at = time.perf_counter()
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.future.add_done_callback(_retrieve_exception)
+
+    def __lt__(self, other: "OutboundMessage") -> bool:
+        return (self.priority, self.sequence) < (other.priority, other.sequence)
+
+
+class ChannelQueue():
+    def __init__(self, burst: int) -> None:
+        self.pending: List[OutboundMessage] = []
+        self.by_merge_key: Dict[Hashable, OutboundMessage] = {}
+        self.sent_at: Deque[float] = deque(maxlen=burst)
+        self.worker: Optional[asyncio.Task] = None
+
+
+class OutboundScheduler():
+    """
+    Sends messages through one worker per channel, so a handler never sits in discord.py's 429 backoff itself.
+
+    Each channel's worker paces itself to `burst` messages per `window` seconds and always sends the highest priority
+    message waiting, so replies to commands go out ahead of notifications. A message queued with a `merge_key` that
+    matches one still waiting is folded into it instead of being sent separately. When a channel backs up past
+    `max_pending`, its oldest notifications are dropped. Every submission returns a future for the sent message, which
+    callers can await or ignore. A channel's queue is dropped once it has been idle for a whole window.
+    """
+
+    def __init__(self, burst: int = OUTBOUND_CHANNEL_BURST, window: float = OUTBOUND_CHANNEL_WINDOW,
+                 max_pending: int = OUTBOUND_MAX_PENDING) -> None:
+        self.burst = burst
+        self.window = window
+        self.max_pending = max_pending
+
+        self._channels: Dict[int, ChannelQueue] = {}
+        self._sequence = itertools.count()
+
+    def stats(self) -> Dict[str, int]:
+        pending = {name: 0 for name in PRIORITY_NAMES.values()}
+        for queue in self._channels.values():
+            for message in queue.pending:
+                pending[PRIORITY_NAMES[message.priority]] += 1
+
+        return pending
+
+    def submit(self, channel: discord.abc.Messageable, priority: int = NOTIFICATION, merge_key: Optional[Hashable] = None,
+               **kwargs: Any) -> asyncio.Future:
+        """Queues `channel.send(**kwargs)`. A waiting message with the same merge key is replaced by this one."""
+        return self._enqueue(channel, [kwargs], _latest, priority, merge_key)
+
+    def submit_batched(self, channel: discord.abc.Messageable, items: List[Any], render: Render, merge_key: Hashable,
+                       priority: int = NOTIFICATION) -> asyncio.Future:
+        """Queues `items` to be sent as one message, together with any others queued under `merge_key` before it goes out"""
+        return self._enqueue(channel, list(items), render, priority, merge_key)
+
+    async def send(self, channel: discord.abc.Messageable, priority: int = REPLY, **kwargs: Any) -> Optional[discord.Message]:
+        return await self.submit(channel, priority=priority, **kwargs)
+
+    def _enqueue(self, channel: discord.abc.Messageable, items: List[Any], render: Render, priority: int,
+                 merge_key: Optional[Hashable]) -> asyncio.Future:
+        queue = self._channels.get(channel.id)
+        if queue is None:
+            queue = self._channels[channel.id] = ChannelQueue(self.burst)
+
+        waiting = queue.by_merge_key.get(merge_key) if merge_key is not None else None
+        if waiting is not None:
+            waiting.items.extend(items)
+            metrics.OUTBOUND_MESSAGES.inc(result="merged")
+            return waiting.future
+
+        message = OutboundMessage(priority, next(self._sequence), items, render, merge_key)
+        heapq.heappush(queue.pending, message)
+        if merge_key is not None:
+            queue.by_merge_key[merge_key] = message
+        self._drop_excess(queue)
+
+        if queue.worker is None:
+            queue.worker = asyncio.create_task(self._drain(channel, queue))
+
+        return message.future
+
+    def _drop_excess(self, queue: ChannelQueue) -> None:
+        while len(queue.pending) > self.max_pending:
+            notifications = [message for message in queue.pending if message.priority != REPLY]
+            if not notifications:
+                return
+
+            oldest = min(notifications, key=lambda message: message.sequence)
+            queue.pending.remove(oldest)
+            heapq.heapify(queue.pending)
+            if oldest.merge_key is not None:
+                queue.by_merge_key.pop(oldest.merge_key, None)
+
+            oldest.future.set_result(None)
+            metrics.OUTBOUND_MESSAGES.inc(result="dropped")
+
+    async def _wait_for_send_slot(self, queue: ChannelQueue) -> None:
+        if len(queue.sent_at) == self.burst:
+            wait = queue.sent_at[0] + self.window - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+
+    async def _drain(self, channel: discord.abc.Messageable, queue: ChannelQueue) -> None:
+        try:
+            while queue.pending:
+                await self._wait_for_send_slot(queue)
+
+                # Popped only once a slot is free, so a reply queued in the meantime still goes first
+                message = heapq.heappop(queue.pending)
+                if message.merge_key is not None:
+                    queue.by_merge_key.pop(message.merge_key, None)
+
+                queue.sent_at.append(time.monotonic())
+                try:
+                    sent = await channel.send(**message.render(message.items))
+                except Exception as err:
+                    logging.exception(
+                        f"""
+                        [CHOCOBOT] There was an error at OutboundScheduler._drain ({channel.id})...
+                        {err}
+                        """
+                    )
+                    metrics.OUTBOUND_MESSAGES.inc(result="failed")
+                    message.future.set_exception(err)
+                    continue
+
+                metrics.OUTBOUND_LATENCY.observe(time.perf_counter() - message.queued_at, priority=PRIORITY_NAMES[message.priority])
+                metrics.OUTBOUND_MESSAGES.inc(result="sent")
+                message.future.set_result(sent)
+        finally:
+            queue.worker = None
+            # The queue holds the channel's recent sends, so it's only forgotten once they've all left the window.
+            # Forgetting it sooner would let the next message start a fresh burst.
+            idle_for = queue.sent_at[-1] + self.window - time.monotonic() if queue.sent_at else 0
+            if idle_for > 0:
+                asyncio.get_running_loop().call_later(idle_for, self._forget, channel.id, queue)
+            else:
+                self._forget(channel.id, queue)
+
+    def _forget(self, channel_id: int, queue: ChannelQueue) -> None:
+        # A message queued since the worker exited keeps the queue, and its new worker forgets it when it's done
+        if queue.worker is None and not queue.pending and self._channels.get(channel_id) is queue:
+            del self._channels[channel_id]
+
+
+class ScheduledContext(commands.Context):
+    """A Context whose replies go through the outbound scheduler, ahead of any notifications waiting for the channel"""
+
+    async def send(self, content: Optional[str] = None, **kwargs: Any) -> Optional[discord.Message]:
+        # Interaction responses and followups go through the interaction's webhook, not the channel's message limit
+        if self.interaction is not None:
+            return await super().send(content, **kwargs)
+
+        return await outbound.send(self.channel, content=content, **kwargs)
+
+
+outbound = OutboundScheduler()
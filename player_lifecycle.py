@@ -0,0 +1,131 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Callable, Dict, Optional
+
+import discord
+
+from chocobot_player import ChocobotPlayer
+
+PLAYER_REAP_INTERVAL = float(os.getenv("PLAYER_REAP_INTERVAL", 30))
+PLAYER_IDLE_TIMEOUT = float(os.getenv("PLAYER_IDLE_TIMEOUT", 300))
+PLAYER_PAUSED_TIMEOUT = float(os.getenv("PLAYER_PAUSED_TIMEOUT", 900))
+PLAYER_ALONE_TIMEOUT = float(os.getenv("PLAYER_ALONE_TIMEOUT", 120))
+
+
+class PlayerLifecycleManager():
+    """
+    Disconnects and destroys players that are no longer earning their keep, so the number of live players tracks
+    the number of guilds actually listening rather than every guild that has ever used a music command.
+
+    A player is reaped once it has been idle (nothing playing) for `idle_timeout`, paused for `paused_timeout`,
+    or the only member left in its voice channel for `alone_timeout`.
+    """
+
+    def __init__(
+        self,
+        bot: discord.Client,
+        on_destroy: Callable[[int], None] = lambda _: None,
+        interval: float = PLAYER_REAP_INTERVAL,
+        idle_timeout: float = PLAYER_IDLE_TIMEOUT,
+        paused_timeout: float = PLAYER_PAUSED_TIMEOUT,
+        alone_timeout: float = PLAYER_ALONE_TIMEOUT,
+    ) -> None:
+        self.bot = bot
+        self.on_destroy = on_destroy
+        self.interval = interval
+        self.idle_timeout = idle_timeout
+        self.paused_timeout = paused_timeout
+        self.alone_timeout = alone_timeout
+
+        self.reaped: Dict[str, int] = {"idle": 0, "paused": 0, "alone": 0}
+        self._alone_since: Dict[int, float] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def stats(self) -> Dict[str, int]:
+        players = list(self.bot.lavalink.player_manager.values())
+
+        return {
+            "players": len(players),
+            "connected": sum(1 for player in players if player.is_connected),
+            "playing": sum(1 for player in players if player.is_playing and not player.paused),
+            "paused": sum(1 for player in players if player.paused),
+            **{f"reaped_{reason}": count for reason, count in self.reaped.items()},
+        }
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.reap()
+            except Exception as err:
+                logging.exception(
+                    f"""
+                    [CHOCOBOT] There was an error at PlayerLifecycleManager.reap...
+                    {err}
+                    """
+                )
+
+    def _is_alone(self, guild: Optional[discord.Guild]) -> bool:
+        voice_client = guild.voice_client if guild else None
+        if voice_client is None or voice_client.channel is None:
+            return False
+
+        return not any(not member.bot for member in voice_client.channel.members)
+
+    def _reap_reason(self, player: ChocobotPlayer, now: float) -> Optional[str]:
+        guild = self.bot.get_guild(player.guild_id)
+
+        if self._is_alone(guild):
+            alone_since = self._alone_since.setdefault(player.guild_id, now)
+            if now - alone_since >= self.alone_timeout:
+                return "alone"
+        else:
+            self._alone_since.pop(player.guild_id, None)
+
+        if player.paused_since is not None and now - player.paused_since >= self.paused_timeout:
+            return "paused"
+
+        if player.current is None and now - player.last_active >= self.idle_timeout:
+            return "idle"
+
+        return None
+
+    async def reap(self) -> int:
+        """Destroys every player that has outlived its timeouts, returning how many were destroyed"""
+        now = time.monotonic()
+        reaped = 0
+
+        for player in list(self.bot.lavalink.player_manager.values()):
+            reason = self._reap_reason(player, now)
+            if reason is None:
+                continue
+
+            await self.destroy(player.guild_id)
+            self.reaped[reason] += 1
+            reaped += 1
+
+        if reaped:
+            print(f"[CHOCOBOT] Reaped {reaped} players, {len(self.bot.lavalink.player_manager)} still live")
+
+        return reaped
+
+    async def destroy(self, guild_id: int) -> None:
+        self.on_destroy(guild_id)
+        self._alone_since.pop(guild_id, None)
+
+        guild = self.bot.get_guild(guild_id)
+        if guild is not None and guild.voice_client is not None:
+            await guild.voice_client.disconnect(force=True)
+
+        await self.bot.lavalink.player_manager.destroy(guild_id)
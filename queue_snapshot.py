@@ -0,0 +1,223 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+import discord
+import lavalink
+
+from chocobot_player import ChocobotPlayer
+from guild_archive_store import GuildArchiveStore
+
+QUEUE_SNAPSHOT_PATH = os.getenv("QUEUE_SNAPSHOT_PATH", "queue_snapshot.json")
+QUEUE_SNAPSHOT_INTERVAL = float(os.getenv("QUEUE_SNAPSHOT_INTERVAL", 15))
+QUEUE_RESTORE_CONCURRENCY = int(os.getenv("QUEUE_RESTORE_CONCURRENCY", 16))
+
+QueueEntry = Dict[str, Any]
+
+
+def _decode_tracks(entries: List[List[Any]]) -> List[lavalink.AudioTrack]:
+    """Rebuilds tracks from [encoded, requester] pairs. Decoding is local, so nothing is searched or loaded again."""
+    tracks = []
+    for encoded, requester in entries:
+        track = lavalink.decode_track(encoded)
+        track.requester = requester
+        tracks.append(track)
+
+    return tracks
+
+
+class QueueSnapshotter():
+    """
+    Periodically saves every player's queue, current track and position so playback survives a restart, and rebuilds
+    the players from those snapshots on startup.
+
+    Tracks are stored as their encoded Lavalink strings, which decode back into full tracks without asking Lavalink to
+    search again. Queues are journaled per guild and only rewritten when they change. Positions change on every tick for
+    every playing guild, so they live in a small separate snapshot that is replaced wholesale each time. A position is
+    only applied on restore if it was taken against the same revision of the queue.
+    """
+
+    def __init__(self, bot: discord.Client, connect, snapshot_path: str = QUEUE_SNAPSHOT_PATH,
+                 interval: float = QUEUE_SNAPSHOT_INTERVAL, restore_concurrency: int = QUEUE_RESTORE_CONCURRENCY) -> None:
+        self.bot = bot
+        # Joins a voice channel the same way the cog does, e.g. channel.connect(cls=LavalinkVoiceClient)
+        self.connect = connect
+        self.interval = interval
+        self.restore_concurrency = restore_concurrency
+
+        self.queue_store = GuildArchiveStore(snapshot_path)
+        self.position_store = GuildArchiveStore(f"{snapshot_path}.positions")
+
+        # guild id -> (fingerprint of what was last saved, revision it was saved as)
+        self._saved: Dict[int, tuple[tuple, int]] = {}
+        self._revision = 0
+        self._restored = False
+        # Held while restoring, so a snapshot can't mistake players that haven't been rebuilt yet for stopped ones
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.snapshot()
+            except Exception as err:
+                logging.exception(
+                    f"""
+                    [CHOCOBOT] There was an error at QueueSnapshotter.snapshot...
+                    {err}
+                    """
+                )
+
+    @staticmethod
+    def _fingerprint(player: ChocobotPlayer) -> tuple:
+        return (
+            player.queue.version,
+            player.current.track if player.current else None,
+            player.channel_id,
+            player.fetch('channel'),
+        )
+
+    @staticmethod
+    def _is_worth_saving(player: ChocobotPlayer) -> bool:
+        # Stations aren't saved, so a guild listening to one has nothing of its own to resume
+        return player.is_connected and player.current is not None and player.current.track is not None and player.station is None
+
+    def _queue_entry(self, player: ChocobotPlayer, revision: int) -> QueueEntry:
+        return {
+            "guild_id": player.guild_id,
+            "revision": revision,
+            "voice_channel_id": int(player.channel_id),
+            "text_channel_id": player.fetch('channel'),
+            "current": [player.current.track, player.current.requester],
+            # Deferred tracks have nothing encoded yet, so they can't be saved
+            "queue": [[track.track, track.requester] for track in player.queue if track.track is not None],
+        }
+
+    async def snapshot(self) -> int:
+        """Saves the queues that changed since the last snapshot and every playing guild's position. Returns the number of queues written."""
+        # Until the last run's players are rebuilt there are none to save, and saving that would wipe out their snapshots
+        if not self._restored:
+            return 0
+
+        async with self._lock:
+            return await self._snapshot()
+
+    async def _snapshot(self) -> int:
+        queues_written = 0
+        positions: List[QueueEntry] = []
+        live_guild_ids = set()
+
+        for player in list(self.bot.lavalink.player_manager.values()):
+            if not self._is_worth_saving(player):
+                continue
+
+            live_guild_ids.add(player.guild_id)
+            fingerprint = self._fingerprint(player)
+            saved = self._saved.get(player.guild_id)
+
+            if saved is None or saved[0] != fingerprint:
+                self._revision += 1
+                await self.queue_store.put(self._queue_entry(player, self._revision))
+                self._saved[player.guild_id] = (fingerprint, self._revision)
+                queues_written += 1
+
+            positions.append({
+                "guild_id": player.guild_id,
+                "revision": self._saved[player.guild_id][1],
+                "position": int(player.position),
+                "paused": player.paused,
+            })
+
+        for guild_id in list(self._saved):
+            if guild_id not in live_guild_ids:
+                del self._saved[guild_id]
+                await self.queue_store.delete(guild_id)
+
+        await self.position_store.rewrite(positions)
+        return queues_written
+
+    async def restore(self) -> int:
+        """
+        Rebuilds the players saved by the last run, then starts the periodic snapshots. Only runs once, however many
+        times the bot becomes ready.
+        """
+        if self._restored:
+            return 0
+        self._restored = True
+
+        async with self._lock:
+            restored = await self._restore()
+
+        self.start()
+        return restored
+
+    async def _restore(self) -> int:
+        started_at = time.perf_counter()
+        queue_entries = await self.queue_store.load()
+        positions = {entry["guild_id"]: entry for entry in await self.position_store.load()}
+        # Revisions carry on from the previous run so they stay comparable with what's already on disk
+        self._revision = max((entry["revision"] for entry in queue_entries), default=0)
+
+        semaphore = asyncio.Semaphore(self.restore_concurrency)
+
+        async def restore_bounded(entry: QueueEntry) -> bool:
+            # Seeded so the next snapshot either rewrites this guild's entry or deletes it if the player didn't survive
+            self._saved[entry["guild_id"]] = ((), entry["revision"])
+
+            async with semaphore:
+                try:
+                    return await self._restore_player(entry, positions.get(entry["guild_id"]))
+                except Exception as err:
+                    logging.exception(
+                        f"""
+                        [CHOCOBOT] There was an error at QueueSnapshotter._restore_player ({entry.get("guild_id")})...
+                        {err}
+                        """
+                    )
+                    return False
+
+        results = await asyncio.gather(*[restore_bounded(entry) for entry in queue_entries])
+        restored = sum(results)
+
+        print(f"[CHOCOBOT] Restored {restored}/{len(queue_entries)} player queues in {time.perf_counter() - started_at:.2f}s")
+        return restored
+
+    async def _restore_player(self, entry: QueueEntry, position: Optional[QueueEntry]) -> bool:
+        guild = self.bot.get_guild(entry["guild_id"])
+        voice_channel = guild.get_channel(entry["voice_channel_id"]) if guild is not None else None
+        if voice_channel is None:
+            return False
+
+        current, *queue = _decode_tracks([entry["current"], *entry["queue"]])
+
+        player: ChocobotPlayer = self.bot.lavalink.player_manager.create(guild.id)
+        player.store('channel', entry["text_channel_id"])
+        player.queue.extend(queue)
+
+        if guild.voice_client is None:
+            await self.connect(voice_channel)
+
+        # A position saved against an older queue revision belongs to a different track
+        start_time = 0
+        paused = False
+        if position is not None and position["revision"] == entry["revision"]:
+            start_time = position["position"] if 0 <= position["position"] < current.duration else 0
+            paused = position["paused"]
+
+        await player.play(current, start_time=start_time, pause=paused)
+        if paused:
+            player.paused_since = time.monotonic()
+
+        return True
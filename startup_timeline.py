@@ -0,0 +1,49 @@
+import os
+import time
+from typing import Dict, Optional
+
+STARTUP_BUDGET = float(os.getenv("STARTUP_BUDGET", 0))
+
+
+class StartupTimeline():
+    """
+    Records how long each startup phase took, measured from when this module was first imported.
+    main.py imports it before anything else, so the first phase covers the cost of every other import.
+    """
+
+    def __init__(self, budget: float = STARTUP_BUDGET) -> None:
+        self.budget = budget
+        self.started_at = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+        self._last_mark = self.started_at
+        self.finished = False
+
+    def mark(self, phase: str) -> None:
+        """Ends `phase`, timing it from the end of the previous one"""
+        if self.finished:
+            return
+
+        now = time.perf_counter()
+        self.phases[phase] = now - self._last_mark
+        self._last_mark = now
+
+    @property
+    def total(self) -> float:
+        return self._last_mark - self.started_at
+
+    def finish(self) -> Optional[str]:
+        """Prints the timeline once startup is complete, warning if it went over STARTUP_BUDGET seconds"""
+        if self.finished:
+            return None
+        self.finished = True
+
+        steps = ", ".join(f"{phase} {duration:.3f}s" for phase, duration in self.phases.items())
+        report = f"[CHOCOBOT] Started in {self.total:.3f}s ({steps})"
+        if self.budget and self.total > self.budget:
+            report += f" - over the {self.budget:.1f}s startup budget"
+
+        print(report)
+        return report
+
+
+startup_timeline = StartupTimeline()
@@ -0,0 +1,246 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Dict, List, Optional, Set
+
+import discord
+import lavalink
+
+from chocobot_player import ChocobotPlayer, TrackedQueue
+
+# How often every listener is checked against its station, and how far one may drift before it's seeked back in line
+STATION_SYNC_INTERVAL = float(os.getenv("STATION_SYNC_INTERVAL", 10))
+STATION_MAX_DRIFT = float(os.getenv("STATION_MAX_DRIFT", 2))
+
+
+class Station():
+    """
+    One programmed queue that any number of guilds listen to.
+
+    The station keeps its own clock: the current track started at `started_at`, so where it is now doesn't depend on
+    any one listener. Tracks are resolved and stored once here, and listeners' players only ever hold the track that's
+    playing, which is the same object for all of them.
+    """
+
+    def __init__(self, name: str, owner_guild_id: int) -> None:
+        self.name = name
+        self.owner_guild_id = owner_guild_id
+        self.queue: TrackedQueue = TrackedQueue()
+        self.current: Optional[lavalink.AudioTrack] = None
+        self.started_at = 0.0
+        self.listeners: Set[int] = set()
+
+        self._advance_task: Optional[asyncio.Task] = None
+
+    def add(self, requester: int, track: lavalink.AudioTrack) -> None:
+        """Queues a track, the same way DefaultPlayer.add does, so enqueue_in_batches works on stations too"""
+        track.requester = requester
+        self.queue.append(track)
+
+    @property
+    def position(self) -> int:
+        """Milliseconds into the current track"""
+        return int((time.monotonic() - self.started_at) * 1000) if self.current is not None else 0
+
+    def remaining(self) -> Optional[float]:
+        """Seconds until the current track ends, or None if it never will on its own"""
+        if self.current is None or self.current.is_stream:
+            return None
+
+        return max(0.0, self.current.duration / 1000 - (time.monotonic() - self.started_at))
+
+
+class StationManager():
+    """
+    Runs the stations for every guild this process serves.
+
+    Each station moves on to its next track when its own clock says the current one is over, and tells every
+    listener's player to play it. A listening player's own queue is switched off, so it never starts anything by
+    itself. Listeners that join mid-track start at the station's position, and a periodic sync seeks any listener
+    that has drifted more than `max_drift` seconds, or lost its track, back in line.
+
+    Searches and queued tracks cost the same however many guilds listen. Lavalink still needs one player update per
+    listener when the track changes, since every guild has its own voice connection.
+    """
+
+    def __init__(self, bot: discord.Client, sync_interval: float = STATION_SYNC_INTERVAL, max_drift: float = STATION_MAX_DRIFT) -> None:
+        self.bot = bot
+        self.sync_interval = sync_interval
+        self.max_drift = max_drift
+
+        self._stations: Dict[str, Station] = {}
+        self._listening: Dict[int, Station] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._stations)
+
+    def __iter__(self):
+        return iter(self._stations.values())
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "stations": len(self._stations),
+            "listeners": len(self._listening),
+            "queued": sum(len(station.queue) for station in self._stations.values()),
+        }
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+        for station in self._stations.values():
+            if station._advance_task is not None:
+                station._advance_task.cancel()
+
+    def get(self, name: str) -> Optional[Station]:
+        return self._stations.get(name.lower())
+
+    def station_of(self, guild_id: int) -> Optional[Station]:
+        return self._listening.get(guild_id)
+
+    def owned_by(self, guild_id: int) -> Optional[Station]:
+        return next((station for station in self._stations.values() if station.owner_guild_id == guild_id), None)
+
+    def create(self, name: str, owner_guild_id: int) -> Optional[Station]:
+        """Creates a station, or returns None if the name is taken or the guild already runs one"""
+        if name.lower() in self._stations or self.owned_by(owner_guild_id) is not None:
+            return None
+
+        station = self._stations[name.lower()] = Station(name, owner_guild_id)
+        return station
+
+    async def end(self, station: Station) -> None:
+        """Stops the station for every listener and removes it"""
+        self._stations.pop(station.name.lower(), None)
+        if station._advance_task is not None:
+            station._advance_task.cancel()
+
+        players = [self._player(guild_id) for guild_id in list(station.listeners)]
+        for guild_id in list(station.listeners):
+            self.leave(guild_id)
+        await asyncio.gather(*[player.stop() for player in players if player is not None])
+
+    async def join(self, station: Station, player: ChocobotPlayer) -> None:
+        """Moves a guild's player onto the station, dropping whatever it was playing"""
+        self.leave(player.guild_id)
+
+        player.station = station.name
+        player.queue.clear()
+        station.listeners.add(player.guild_id)
+        self._listening[player.guild_id] = station
+
+        if station.current is not None:
+            await self._play(player, station, start_time=station.position)
+
+    def leave(self, guild_id: int) -> Optional[Station]:
+        """Takes a guild off its station. Its player is left as it is, and goes back to its own queue from here on."""
+        station = self._listening.pop(guild_id, None)
+        if station is None:
+            return None
+
+        station.listeners.discard(guild_id)
+        player = self._player(guild_id)
+        if player is not None:
+            player.station = None
+
+        return station
+
+    async def start_if_idle(self, station: Station) -> None:
+        if station.current is None:
+            await self.advance(station)
+
+    async def advance(self, station: Station) -> None:
+        """Moves the station on to its next track, or stops every listener if the queue is empty"""
+        if station._advance_task is not None and station._advance_task is not asyncio.current_task():
+            station._advance_task.cancel()
+        station._advance_task = None
+
+        station.current = station.queue.pop(0) if station.queue else None
+        station.started_at = time.monotonic()
+
+        players = [player for player in map(self._player, station.listeners) if player is not None]
+        if station.current is None:
+            await asyncio.gather(*[player.stop() for player in players])
+            return
+
+        await asyncio.gather(*[self._play(player, station) for player in players])
+
+        remaining = station.remaining()
+        if remaining is not None:
+            station._advance_task = asyncio.create_task(self._advance_after(station, remaining))
+
+    async def _advance_after(self, station: Station, delay: float) -> None:
+        await asyncio.sleep(delay)
+        try:
+            await self.advance(station)
+        except Exception as err:
+            logging.exception(
+                f"""
+                [CHOCOBOT] There was an error at StationManager._advance_after ({station.name})...
+                {err}
+                """
+            )
+
+    async def _play(self, player: ChocobotPlayer, station: Station, start_time: int = 0) -> None:
+        track = station.current
+        # Streams can't be started part way through, and a track about to end isn't worth seeking into
+        if track.is_stream or not track.is_seekable or not 0 <= start_time < track.duration - 1000:
+            start_time = 0
+
+        try:
+            await player.play(track, start_time=start_time)
+        except Exception as err:
+            logging.exception(
+                f"""
+                [CHOCOBOT] There was an error at StationManager._play ({station.name}, {player.guild_id})...
+                {err}
+                """
+            )
+
+    def _player(self, guild_id: int) -> Optional[ChocobotPlayer]:
+        return self.bot.lavalink.player_manager.get(guild_id)
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.sync_interval)
+            try:
+                await self.sync()
+            except Exception as err:
+                logging.exception(
+                    f"""
+                    [CHOCOBOT] There was an error at StationManager.sync...
+                    {err}
+                    """
+                )
+
+    async def sync(self) -> int:
+        """Puts every listener that has lost the station's track or drifted from it back in line. Returns how many were."""
+        resyncs: List = []
+
+        for station in list(self._stations.values()):
+            if station.current is None:
+                continue
+
+            for guild_id in list(station.listeners):
+                player = self._player(guild_id)
+                # The player was destroyed without the station hearing about it
+                if player is None:
+                    self.leave(guild_id)
+                    continue
+                if not player.is_connected or player.paused:
+                    continue
+
+                if player.current is None or player.current.track != station.current.track:
+                    resyncs.append(self._play(player, station, start_time=station.position))
+                elif station.current.is_seekable and abs(player.position - station.position) > self.max_drift * 1000:
+                    resyncs.append(player.seek(station.position))
+
+        await asyncio.gather(*resyncs)
+        return len(resyncs)
@@ -0,0 +1,200 @@
+import asyncio
+import os
+import re
+import sqlite3
+import time
+from difflib import SequenceMatcher
+from typing import Dict, List, Optional
+
+import lavalink
+
+TRACK_HISTORY_PATH = os.getenv("TRACK_HISTORY_PATH", "track_history.db")
+# How closely a query has to match a track's title and author, from 0 to 1, before it's answered from history
+TRACK_HISTORY_MIN_SCORE = float(os.getenv("TRACK_HISTORY_MIN_SCORE", 0.8))
+# Full-text candidates fetched per lookup before they're re-scored for typos and ranked by play count
+TRACK_HISTORY_CANDIDATES = 50
+
+token_rx = re.compile(r'\w+')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tracks (
+    id INTEGER PRIMARY KEY,
+    track_key TEXT NOT NULL UNIQUE,
+    title TEXT NOT NULL,
+    author TEXT NOT NULL,
+    uri TEXT,
+    encoded TEXT NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS tracks_fts USING fts5(
+    title, author, content='tracks', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS tracks_after_insert AFTER INSERT ON tracks BEGIN
+    INSERT INTO tracks_fts(rowid, title, author) VALUES (new.id, new.title, new.author);
+END;
+CREATE TRIGGER IF NOT EXISTS tracks_after_update AFTER UPDATE OF title, author ON tracks BEGIN
+    INSERT INTO tracks_fts(tracks_fts, rowid, title, author) VALUES ('delete', old.id, old.title, old.author);
+    INSERT INTO tracks_fts(rowid, title, author) VALUES (new.id, new.title, new.author);
+END;
+CREATE TABLE IF NOT EXISTS plays (
+    guild_id INTEGER NOT NULL,
+    track_id INTEGER NOT NULL REFERENCES tracks(id),
+    play_count INTEGER NOT NULL DEFAULT 0,
+    last_played REAL NOT NULL,
+    PRIMARY KEY (guild_id, track_id)
+);
+"""
+
+
+def _tokens(text: str) -> List[str]:
+    return token_rx.findall(text.lower())
+
+
+def match_score(query_tokens: List[str], candidate_tokens: List[str]) -> float:
+    """
+    How well a track's title and author cover a query, from 0 to 1. A query word counts fully if it starts a word of
+    the track, and partially by how similar it is to the closest one otherwise, so small typos still match.
+    """
+    if not query_tokens or not candidate_tokens:
+        return 0.0
+
+    total = 0.0
+    for query_token in query_tokens:
+        if any(candidate_token.startswith(query_token) for candidate_token in candidate_tokens):
+            total += 1.0
+            continue
+
+        # The matcher caches what it learns about its second sequence, so the query word goes there
+        matcher = SequenceMatcher(b=query_token)
+        best = 0.0
+        for candidate_token in candidate_tokens:
+            matcher.set_seq1(candidate_token)
+            if matcher.quick_ratio() > best:
+                best = max(best, matcher.ratio())
+        total += best
+
+    return total / len(query_tokens)
+
+
+class TrackHistoryIndex():
+    """
+    A local full-text index of every track a guild has picked or played, kept in an embedded SQLite database.
+
+    Free-text `play` queries are answered from here first, so songs a guild plays often never cost a YouTube search.
+    Full-text search narrows the guild's history down to candidates sharing words with the query, which are then
+    re-scored to tolerate typos and ranked by how often the guild has played them. Tracks are stored as their encoded
+    Lavalink strings and decoded locally, just like restored queues. All database work runs in a worker thread.
+    """
+
+    def __init__(self, path: str = TRACK_HISTORY_PATH, min_score: float = TRACK_HISTORY_MIN_SCORE) -> None:
+        self.path = path
+        self.min_score = min_score
+
+        self._connection: Optional[sqlite3.Connection] = None
+        self._lock = asyncio.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.recorded = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "recorded": self.recorded}
+
+    def _connect(self) -> sqlite3.Connection:
+        # Opened on first use from the worker thread, rather than whenever this module is imported
+        if self._connection is None:
+            connection = sqlite3.connect(self.path, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.executescript(SCHEMA)
+            self._connection = connection
+
+        return self._connection
+
+    def close(self) -> None:
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    async def record(self, guild_id: int, track: lavalink.AudioTrack, played: bool = False) -> None:
+        """Indexes a track for a guild, counting it as a play if `played` is set"""
+        # Deferred tracks have nothing encoded yet, so there'd be nothing to play back from the index
+        if track.track is None or not track.title:
+            return
+
+        async with self._lock:
+            await asyncio.to_thread(self._record, guild_id, track, played)
+        self.recorded += 1
+
+    def _record(self, guild_id: int, track: lavalink.AudioTrack, played: bool) -> None:
+        connection = self._connect()
+        with connection:
+            connection.execute(
+                """
+                INSERT INTO tracks (track_key, title, author, uri, encoded) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (track_key) DO UPDATE SET
+                    title = excluded.title, author = excluded.author, uri = excluded.uri, encoded = excluded.encoded
+                """,
+                (track.uri or track.identifier, track.title, track.author or "", track.uri, track.track),
+            )
+            (track_id,) = connection.execute(
+                "SELECT id FROM tracks WHERE track_key = ?", (track.uri or track.identifier,)
+            ).fetchone()
+            connection.execute(
+                """
+                INSERT INTO plays (guild_id, track_id, play_count, last_played) VALUES (?, ?, ?, ?)
+                ON CONFLICT (guild_id, track_id) DO UPDATE SET
+                    play_count = play_count + excluded.play_count, last_played = excluded.last_played
+                """,
+                (guild_id, track_id, int(played), time.time()),
+            )
+
+    async def search(self, guild_id: int, query: str, limit: int = 5) -> List[lavalink.AudioTrack]:
+        """Returns up to `limit` tracks from the guild's history matching `query`, best first, or none on a miss"""
+        query_tokens = _tokens(query)
+        if not query_tokens:
+            return []
+
+        async with self._lock:
+            encoded_tracks = await asyncio.to_thread(self._search, guild_id, query_tokens, limit)
+
+        if encoded_tracks:
+            self.hits += 1
+        else:
+            self.misses += 1
+
+        return [lavalink.decode_track(encoded) for encoded in encoded_tracks]
+
+    def _search(self, guild_id: int, query_tokens: List[str], limit: int) -> List[str]:
+        prefixes = [f'"{token}"*' for token in query_tokens]
+        # Tracks containing every query word are cheap to find and usually enough. Only when that finds nothing is any
+        # single word allowed to match, so one mistyped word doesn't hide the track from re-scoring.
+        matches = self._scored_candidates(guild_id, query_tokens, " AND ".join(prefixes))
+        if not matches and len(prefixes) > 1:
+            matches = self._scored_candidates(guild_id, query_tokens, " OR ".join(prefixes))
+
+        matches.sort(key=lambda match: (match[0], match[1]), reverse=True)
+        return [encoded for _, _, encoded in matches[:limit]]
+
+    def _scored_candidates(self, guild_id: int, query_tokens: List[str], match_expression: str) -> List[tuple[float, int, str]]:
+        rows = self._connect().execute(
+            """
+            SELECT tracks.title, tracks.author, tracks.encoded, plays.play_count
+            FROM tracks_fts
+            JOIN tracks ON tracks.id = tracks_fts.rowid
+            JOIN plays ON plays.track_id = tracks.id AND plays.guild_id = ?
+            WHERE tracks_fts MATCH ?
+            ORDER BY bm25(tracks_fts)
+            LIMIT ?
+            """,
+            (guild_id, match_expression, TRACK_HISTORY_CANDIDATES),
+        ).fetchall()
+
+        scored = []
+        for title, author, encoded, play_count in rows:
+            score = match_score(query_tokens, _tokens(f"{title} {author}"))
+            if score >= self.min_score:
+                scored.append((score, play_count, encoded))
+
+        return scored
+
+track_history = TrackHistoryIndex()
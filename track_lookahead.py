@@ -0,0 +1,191 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Awaitable, Callable, Dict, Optional, Set
+
+import lavalink
+from lavalink.errors import LoadError
+from lavalink.server import LoadResult, LoadType, Severity
+
+import metrics
+from chocobot_player import ChocobotPlayer
+from track_history import TRACK_HISTORY_MIN_SCORE, match_score, token_rx
+
+# How many upcoming queue entries are kept resolved and checked ahead of the play head
+TRACK_LOOKAHEAD_DEPTH = int(os.getenv("TRACK_LOOKAHEAD_DEPTH", 3))
+# Tracks resolved longer ago than this, or restored from storage, are checked again before they're played
+TRACK_LOOKAHEAD_REVALIDATE_AFTER = float(os.getenv("TRACK_LOOKAHEAD_REVALIDATE_AFTER", 1800))
+
+GetTracks = Callable[[lavalink.Node, str], Awaitable[LoadResult]]
+
+
+def _title_tokens(track: lavalink.AudioTrack) -> list[str]:
+    return token_rx.findall(f"{track.title} {track.author}".lower())
+
+
+def mark_resolved(track: lavalink.AudioTrack, resolved_at: Optional[float] = None) -> lavalink.AudioTrack:
+    """Stamps a track as freshly loaded from Lavalink. Copies made with AudioTrack(track) keep the stamp."""
+    track.extra["resolved_at"] = time.monotonic() if resolved_at is None else resolved_at
+    return track
+
+
+class TrackLookahead():
+    """
+    Keeps the next `depth` entries of each player's queue ready to play, so the play head never waits on a lookup.
+
+    Deferred tracks are loaded in the background, instead of when DefaultPlayer reaches them. Tracks that haven't been
+    resolved in the last `revalidate_after` seconds, such as those restored from a queue snapshot or the track history
+    index, are loaded again by their URI to check they're still playable. A track that's gone is swapped for the first
+    search result with a matching title and author, or dropped from the queue if there isn't one, before the player
+    gets to it. Fresh search results are already known to be good and cost nothing here.
+
+    Work is scheduled whenever a player starts a track or has tracks added, and runs as one background task per guild.
+    """
+
+    def __init__(self, lavalink_client: lavalink.Client, get_tracks: GetTracks, depth: int = TRACK_LOOKAHEAD_DEPTH,
+                 revalidate_after: float = TRACK_LOOKAHEAD_REVALIDATE_AFTER, min_replacement_score: float = TRACK_HISTORY_MIN_SCORE) -> None:
+        self.lavalink = lavalink_client
+        # Goes through the shared search cache, so a URI or replacement search is only ever sent to Lavalink once
+        self.get_tracks = get_tracks
+        self.depth = depth
+        self.revalidate_after = revalidate_after
+        self.min_replacement_score = min_replacement_score
+
+        self.counts: Dict[str, int] = {"resolved": 0, "validated": 0, "replaced": 0, "dropped": 0}
+        self._tasks: Dict[int, asyncio.Task] = {}
+        self._dirty: Set[int] = set()
+
+    def stats(self) -> Dict[str, int]:
+        return {**self.counts, "running": len(self._tasks)}
+
+    def _count(self, result: str) -> None:
+        self.counts[result] += 1
+        metrics.TRACK_LOOKAHEAD.inc(result=result)
+
+    def schedule(self, player: ChocobotPlayer) -> None:
+        # Station listeners have no queue of their own
+        if player.station is not None or not player.queue or self.depth <= 0:
+            return
+
+        self._dirty.add(player.guild_id)
+        task = self._tasks.get(player.guild_id)
+        if task is None or task.done():
+            self._tasks[player.guild_id] = asyncio.create_task(self._run(player))
+
+    def cancel(self, guild_id: int) -> None:
+        self._dirty.discard(guild_id)
+        task = self._tasks.pop(guild_id, None)
+        if task is not None:
+            task.cancel()
+
+    def stop(self) -> None:
+        for guild_id in list(self._tasks):
+            self.cancel(guild_id)
+
+    async def _run(self, player: ChocobotPlayer) -> None:
+        try:
+            # A change made while this pass was running gets a pass of its own
+            while player.guild_id in self._dirty:
+                self._dirty.discard(player.guild_id)
+                await self.prepare(player)
+        except Exception as err:
+            logging.exception(
+                f"""
+                [CHOCOBOT] There was an error at TrackLookahead._run ({player.guild_id})...
+                {err}
+                """
+            )
+        finally:
+            if self._tasks.get(player.guild_id) is asyncio.current_task():
+                del self._tasks[player.guild_id]
+
+    async def prepare(self, player: ChocobotPlayer) -> int:
+        """Resolves and checks the upcoming entries of a player's queue. Returns how many entries were replaced or dropped."""
+        changed = 0
+
+        for track in list(player.queue[:self.depth]):
+            ready = await self._ready(player.node, track)
+            if ready is track:
+                continue
+
+            # The queue may have moved on while the track was being checked
+            index = next((index for index, queued in enumerate(player.queue) if queued is track), None)
+            if index is None:
+                continue
+
+            if ready is None:
+                del player.queue[index]
+                self._count("dropped")
+            else:
+                player.queue[index] = ready
+                self._count("replaced")
+            changed += 1
+
+        # Whatever moved up into the window to take a dropped entry's place hasn't been looked at yet
+        if changed:
+            self._dirty.add(player.guild_id)
+
+        return changed
+
+    async def _ready(self, node: lavalink.Node, track: lavalink.AudioTrack) -> Optional[lavalink.AudioTrack]:
+        """Returns `track` if it's ready to play, a replacement for it, or None if it can't be played at all"""
+        if isinstance(track, lavalink.DeferredAudioTrack) and track.track is None:
+            try:
+                encoded = await track.load(self.lavalink)
+            except LoadError:
+                encoded = None
+
+            if encoded is None:
+                return await self._replacement(node, track)
+
+            # DefaultPlayer only loads a deferred track that has nothing encoded, so this is all it takes
+            track.track = encoded
+            mark_resolved(track)
+            self._count("resolved")
+            return track
+
+        resolved_at = track.extra.get("resolved_at")
+        if resolved_at is not None and time.monotonic() - resolved_at < self.revalidate_after:
+            return track
+
+        # Streams and tracks without a link have nothing to load them again by
+        if track.is_stream or not track.uri:
+            return track
+
+        try:
+            results = await self.get_tracks(node, track.uri)
+        except Exception:
+            # The node couldn't be asked, which says nothing about the track. It's checked again on the next pass.
+            return track
+
+        if results and results.tracks and results.load_type != LoadType.ERROR:
+            mark_resolved(track)
+            self._count("validated")
+            return track
+
+        # Only an empty result or a "common" error means the track itself is unavailable. No response at all, or any other
+        # error, may just be the node having a bad moment.
+        if not results or results.load_type == LoadType.ERROR and results.error.severity != Severity.COMMON:
+            return track
+
+        return await self._replacement(node, track)
+
+    async def _replacement(self, node: lavalink.Node, track: lavalink.AudioTrack) -> Optional[lavalink.AudioTrack]:
+        query_tokens = _title_tokens(track)
+        if not query_tokens:
+            return None
+
+        try:
+            results = await self.get_tracks(node, f"ytsearch:{track.title} {track.author}")
+        except Exception:
+            return None
+        if not results or not results.tracks or results.load_type == LoadType.ERROR:
+            return None
+
+        for candidate in results.tracks:
+            if match_score(query_tokens, _title_tokens(candidate)) >= self.min_replacement_score:
+                candidate.requester = track.requester
+                return candidate
+
+        return None